@@ -1,105 +1,232 @@
 from django.contrib import admin
-from .models import User, Category, Product, Supplier, Customer, Order, Review, Shipping, Payment, Staff, Promotion
-import openpyxl
-from django.http import HttpResponse
+from .models import User, Category, Product, Supplier, Customer, Order, OrderItem, Review, Shipping, Payment, Staff, Promotion, EmailOutbox, ExportJob, ArchivedRecord, RowCount
 from django.contrib.admin import SimpleListFilter
 from django.contrib.admin.models import LogEntry
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import FieldDoesNotExist
+from .counting import EstimatedCountPaginator
+from .exports import BACKGROUND_THRESHOLD, export_response, queue_export
+from .notifications import mark_shipped
+from .pricing import price_orders
+
+
+def export_queryset(modeladmin, request, queryset, file_format):
+    if queryset.count() > BACKGROUND_THRESHOLD:
+        job = queue_export(queryset, file_format, request.user)
+        modeladmin.message_user(request, f"Выборка слишком большая, экспорт #{job.id} поставлен в очередь")
+        return None
+    return export_response(queryset, file_format)
+
+
+def export_to_excel(modeladmin, request, queryset):
+    return export_queryset(modeladmin, request, queryset, 'xlsx')
+
+export_to_excel.allowed_permissions = ('export',)
+export_to_excel.short_description = "Экспортировать выбранные записи в Excel"
+
+
+def export_to_csv(modeladmin, request, queryset):
+    return export_queryset(modeladmin, request, queryset, 'csv')
+
+export_to_csv.allowed_permissions = ('export',)
+export_to_csv.short_description = "Экспортировать выбранные записи в CSV"
+
+
+def export_to_parquet(modeladmin, request, queryset):
+    return export_queryset(modeladmin, request, queryset, 'parquet')
+
+export_to_parquet.allowed_permissions = ('export',)
+export_to_parquet.short_description = "Экспортировать выбранные записи в Parquet"
+
+
+class ExportActionsMixin:
+    """Export actions for models with an explicit column list in api/exports.py."""
+    actions = [export_to_excel, export_to_csv, export_to_parquet]
+
+    def has_export_permission(self, request):
+        # allowed_permissions are alternatives, so viewing is required here
+        return self.has_view_permission(request) and request.user.has_perm('api.export_data')
+
+
+# Relations each model's __str__ follows, so a column showing the object can join them
+STR_RELATIONS = {
+    Customer: ('user',),
+    Staff: ('user',),
+    Order: ('customer__user',),
+    OrderItem: ('product',),
+    Review: ('customer__user', 'product'),
+    Promotion: ('product',),
+}
+
+
+def display_relations(model, name, model_admin):
+    """select_related paths a list_display column needs."""
+    if name == '__str__':
+        return list(STR_RELATIONS.get(model, ()))
+    if isinstance(name, str):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            field = None
+        if field is not None and (field.many_to_one or field.one_to_one) and field.concrete:
+            return [name] + [f"{name}__{path}" for path in STR_RELATIONS.get(field.related_model, ())]
+    column = getattr(model_admin, name, None) if isinstance(name, str) else name
+    return list(getattr(column, 'select_related', ()))
+
+
+class RelatedLoadingChangeList(ChangeList):
+    def get_queryset(self, request, *args, **kwargs):
+        qs = super().get_queryset(request, *args, **kwargs)
+        prefetches = self.model_admin.get_list_prefetch_related(request)
+        return qs.prefetch_related(*prefetches) if prefetches else qs
+
+
+class OptimizedModelAdmin(admin.ModelAdmin):
+    """
+    Changelists join the relations their columns display: list_select_related is
+    derived from FK columns and __str__ (STR_RELATIONS), and callable columns name
+    theirs in `select_related`/`prefetch_related` attributes. Large tables are
+    counted from RowCount or statistics (api/counting.py), unless the URL has
+    ?exact_count=1, and the unfiltered total is not counted again.
+    """
+    list_prefetch_related = ()
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def get_list_select_related(self, request):
+        if self.list_select_related is True:
+            return True
+        paths = list(self.list_select_related or ())
+        for name in self.get_list_display(request):
+            paths += display_relations(self.model, name, self)
+        return tuple(dict.fromkeys(paths)) or False
+
+    def get_list_prefetch_related(self, request):
+        paths = list(self.list_prefetch_related)
+        for name in self.get_list_display(request):
+            column = getattr(self, name, None) if isinstance(name, str) else name
+            paths += getattr(column, 'prefetch_related', ())
+        return tuple(dict.fromkeys(paths))
 
+    def get_changelist(self, request, **kwargs):
+        return RelatedLoadingChangeList
+
+    def changelist_view(self, request, extra_context=None):
+        # Not a field lookup, so it is taken out before ChangeList reads the filters
+        if 'exact_count' in request.GET:
+            request.GET = request.GET.copy()
+            request.exact_count = request.GET.pop('exact_count')[-1] in ('1', 'true')
+        return super().changelist_view(request, extra_context)
 
-def export_logs_to_excel(modeladmin, request, queryset):
-    workbook = openpyxl.Workbook()
-    worksheet = workbook.active
-    worksheet.title = "Логи действий"
-
-    columns = ["ID", "Пользователь", "Тип действия", "Объект", "Дата и время"]
-    worksheet.append(columns)
-
-    for log_entry in queryset:
-        row = [
-            log_entry.id,
-            log_entry.user.username,
-            log_entry.get_action_flag_display(),
-            log_entry.object_repr,
-            log_entry.action_time.strftime("%Y-%m-%d %H:%M:%S"),
-        ]
-        worksheet.append(row)
-
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    response["Content-Disposition"] = 'attachment; filename="log_entries.xlsx"'
-    
-    workbook.save(response)
-    return response
-
-export_logs_to_excel.short_description = "Экспортировать выбранные логи в Excel"
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        return self.paginator(queryset, per_page, orphans, allow_empty_first_page, exact=getattr(request, 'exact_count', False))
 
 
 @admin.register(LogEntry)
-class LogEntryAdmin(admin.ModelAdmin):
+class LogEntryAdmin(ExportActionsMixin, OptimizedModelAdmin):
     list_display = ("id", "user", "action_flag", "object_repr", "action_time")
     list_filter = ("action_flag", "user")
     search_fields = ("object_repr", "user__username")
 
-    actions = [export_logs_to_excel]
-
     class Meta:
         verbose_name = "Журнал записи"
         verbose_name_plural = "Журнал записей"
 
 
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(OptimizedModelAdmin):
     list_display = ('username', 'email', 'role')
     list_per_page = 20
 
-class CategoryAdmin(admin.ModelAdmin):
+class CategoryAdmin(OptimizedModelAdmin):
     list_display = ('name',)
     list_per_page = 20
 
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(ExportActionsMixin, OptimizedModelAdmin):
     list_display = ('name', 'price', 'get_categories')  
     list_per_page = 20
 
     def get_categories(self, obj):
         return ", ".join([category.name for category in obj.categories.all()])
     get_categories.short_description = 'Categories'
+    get_categories.prefetch_related = ('categories',)
 
-class SupplierAdmin(admin.ModelAdmin):
+class SupplierAdmin(OptimizedModelAdmin):
     list_display = ('name', 'get_products')  
     list_per_page = 20
 
     def get_products(self, obj):
         return ", ".join([product.name for product in obj.products.all()])
     get_products.short_description = 'Products'
+    get_products.prefetch_related = ('products',)
 
-class CustomerAdmin(admin.ModelAdmin):
+class CustomerAdmin(OptimizedModelAdmin):
     list_display = ('user', 'phone')
     list_per_page = 20
 
-class OrderAdmin(admin.ModelAdmin):
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    readonly_fields = ('unit_price', 'discount_percent')
+    extra = 0
+
+class OrderAdmin(ExportActionsMixin, OptimizedModelAdmin):
     list_display = ('customer', 'order_date', 'total_amount')
+    readonly_fields = ('total_amount',)
+    inlines = [OrderItemInline]
     list_per_page = 20
 
-class ReviewAdmin(admin.ModelAdmin):
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        price_orders([form.instance])
+
+class ReviewAdmin(ExportActionsMixin, OptimizedModelAdmin):
     list_display = ('customer', 'product', 'rating', 'review_date')
     list_per_page = 20
 
-class ShippingAdmin(admin.ModelAdmin):
+def mark_as_shipped(modeladmin, request, queryset):
+    count = mark_shipped(queryset)
+    modeladmin.message_user(request, f"Отмечено как отправленные: {count}")
+
+mark_as_shipped.allowed_permissions = ('change',)
+mark_as_shipped.short_description = "Отметить выбранные доставки как отправленные"
+
+class ShippingAdmin(OptimizedModelAdmin):
     list_display = ('order', 'shipped_date')
+    actions = [mark_as_shipped]
     list_per_page = 20
 
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(ExportActionsMixin, OptimizedModelAdmin):
     list_display = ('order', 'payment_date', 'amount')
     list_per_page = 20
 
-class StaffAdmin(admin.ModelAdmin):
+class StaffAdmin(OptimizedModelAdmin):
     list_display = ('user', 'phone')
     list_per_page = 20
 
-class PromotionAdmin(admin.ModelAdmin):
+class PromotionAdmin(OptimizedModelAdmin):
     list_display = ('product', 'discount_percent')
     list_per_page = 20
 
+class EmailOutboxAdmin(OptimizedModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    list_per_page = 20
+
+class ExportJobAdmin(OptimizedModelAdmin):
+    list_display = ('__str__', 'format', 'status', 'file', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    list_per_page = 20
+
+class ArchivedRecordAdmin(OptimizedModelAdmin):
+    list_display = ('root', 'model', 'object_id', 'archived_at')
+    list_filter = ('model',)
+    search_fields = ('root',)
+    list_per_page = 20
+
+class RowCountAdmin(OptimizedModelAdmin):
+    list_display = ('label', 'rows', 'refreshed_at')
+    readonly_fields = ('label', 'rows', 'refreshed_at')
+    list_per_page = 20
+
 admin.site.register(User, UserAdmin)
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(Product, ProductAdmin)
@@ -111,3 +238,7 @@ admin.site.register(Shipping, ShippingAdmin)
 admin.site.register(Payment, PaymentAdmin)
 admin.site.register(Staff, StaffAdmin)
 admin.site.register(Promotion, PromotionAdmin)
+admin.site.register(EmailOutbox, EmailOutboxAdmin)
+admin.site.register(ExportJob, ExportJobAdmin)
+admin.site.register(ArchivedRecord, ArchivedRecordAdmin)
+admin.site.register(RowCount, RowCountAdmin)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import cache, counting, promotions, search, tokens  # noqa: F401 (connects the cache invalidation, row count, search index and token version signals)
@@ -0,0 +1,115 @@
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.apps import apps
+from django.core import serializers
+from django.db import transaction, DEFAULT_DB_ALIAS
+from django.db.models import Q
+from django.db.models.deletion import Collector
+from django.utils import timezone
+
+from .models import Order, OrderItem, Review, Shipping, Payment, Promotion, ArchivedRecord
+
+CHUNK_SIZE = 500
+# Models whose rows nothing else depends on once deleted. Order goes first, so its
+# items, shipping, payment and product links move together with it.
+ARCHIVED_MODELS = [Order, Shipping, Payment, OrderItem, Review, Promotion]
+
+
+def root_key(model, pk):
+    return f"{model._meta.label}:{pk}"
+
+
+def owner(obj, root_model, root_pks):
+    """The root an archived row is restored with: the root itself or the root its foreign key points to."""
+    for field in obj._meta.concrete_fields:
+        if field.is_relation and field.related_model is root_model and getattr(obj, field.attname) in root_pks:
+            return root_key(root_model, getattr(obj, field.attname))
+    return root_key(type(obj), obj.pk)
+
+
+def serialize(objects):
+    """Serializes objects of mixed models with their concrete fields; M2M links are archived as through rows."""
+    by_model = defaultdict(list)
+    for obj in objects:
+        by_model[type(obj)].append(obj)
+    serialized = {}
+    for model, instances in by_model.items():
+        fields = [field.name for field in model._meta.concrete_fields if not field.primary_key]
+        for obj, data in zip(instances, serializers.serialize('python', instances, fields=fields)):
+            serialized[id(obj)] = data
+    return [serialized[id(obj)] for obj in objects]
+
+
+def archive_chunk(roots):
+    """Moves `roots` and every row their deletion cascades to into ArchivedRecord; returns the row count."""
+    root_model = type(roots[0])
+    root_pks = {root.pk for root in roots}
+
+    collector = Collector(using=DEFAULT_DB_ALIAS)
+    collector.collect(roots)
+    collector.sort()
+    # Same order Collector.delete() removes them in; restore walks it backwards
+    objects = [obj for queryset in collector.fast_deletes for obj in queryset]
+    for instances in collector.data.values():
+        objects.extend(instances)
+
+    ArchivedRecord.objects.bulk_create([
+        ArchivedRecord(
+            root=owner(obj, root_model, root_pks),
+            model=data['model'],
+            object_id=str(obj.pk),
+            position=position,
+            data=data['fields'],
+        )
+        for position, (obj, data) in enumerate(zip(objects, serialize(objects)))
+    ])
+    collector.delete()
+    return len(objects)
+
+
+def archive_sources(retention_days=None):
+    cutoff = timezone.now() - timedelta(days=retention_days) if retention_days is not None else None
+    for model in ARCHIVED_MODELS:
+        condition = Q(is_deleted=True)
+        if model is Order and cutoff is not None:
+            condition |= Q(order_date__lt=cutoff)
+        yield model, model._base_manager.filter(condition).order_by('pk')
+
+
+def archive(retention_days=None, chunk_size=CHUNK_SIZE):
+    """
+    Archives soft-deleted rows, and orders older than `retention_days`, one chunk per
+    transaction. Interrupted runs resume where they stopped, since archived rows leave
+    the live tables. Returns ({model label: (roots, rows)}, seconds).
+    """
+    started = time.perf_counter()
+    stats = {}
+    for model, queryset in archive_sources(retention_days):
+        roots_total = rows_total = 0
+        while True:
+            with transaction.atomic():
+                roots = list(queryset.select_for_update()[:chunk_size])
+                if not roots:
+                    break
+                rows_total += archive_chunk(roots)
+                roots_total += len(roots)
+        stats[model._meta.label] = (roots_total, rows_total)
+    return stats, time.perf_counter() - started
+
+
+def restore(model, pks):
+    """Moves archived rows of the given roots back into the live tables; returns the row count."""
+    keys = [root_key(model, pk) for pk in pks]
+    with transaction.atomic():
+        records = list(ArchivedRecord.objects.filter(root__in=keys).order_by('-position'))
+        objects = serializers.deserialize('python', [
+            {'model': record.model, 'pk': apps.get_model(record.model)._meta.pk.to_python(record.object_id),
+             'fields': record.data}
+            for record in records
+        ])
+        for obj in objects:
+            obj.save()
+        ArchivedRecord.objects.filter(pk__in=[record.pk for record in records]).delete()
+    return len(records)
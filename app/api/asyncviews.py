@@ -0,0 +1,118 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist, SynchronousOnlyOperation, ValidationError as DjangoValidationError
+from django.http import Http404
+from rest_framework import status
+from rest_framework.response import Response
+
+CHUNK_SIZE = 2000
+
+
+class AsyncModelMixin:
+    """
+    ViewSet mixin that serves list/retrieve/create natively under ASGI when
+    settings.API_ASYNC_VIEWS is on (opt-in, API_ASYNC_VIEWS=1). Reads use the async
+    ORM (acount, aiterator, aget); authentication, id validation and writes run in a
+    worker thread, since they go through synchronous code (sessions, signals,
+    transactions). Permission classes only read request.user, so they run on the
+    event loop. Every other action is the regular synchronous view.
+    """
+    async_actions = ('list', 'retrieve', 'create')
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if not getattr(settings, 'API_ASYNC_VIEWS', False) or not set(actions.values()) & set(cls.async_actions):
+            return view
+        sync_view = sync_to_async(view)
+
+        async def async_view(request, *args, **kwargs):
+            method = request.method.lower()
+            if method == 'head':
+                method = 'get'
+            if actions.get(method) not in cls.async_actions:
+                return await sync_view(request, *args, **kwargs)
+            self = cls(**initkwargs)
+            self.action_map = actions
+            for name, action in actions.items():
+                setattr(self, name, getattr(self, action))
+            self.request, self.args, self.kwargs = request, args, kwargs
+            return await self.adispatch(request, *args, **kwargs)
+
+        # cls, initkwargs, actions and csrf_exempt, like the synchronous view
+        async_view.__dict__.update({key: value for key, value in view.__dict__.items() if key != '__wrapped__'})
+        async_view.__name__, async_view.__doc__ = view.__name__, view.__doc__
+        return async_view
+
+    async def adispatch(self, request, *args, **kwargs):
+        """APIView.dispatch() with the handler awaited."""
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            # Loading the user may query the database; initial() then reuses request.user
+            await sync_to_async(self.perform_authentication)(request)
+            self.initial(request, *args, **kwargs)
+            handler = getattr(self, f"a{self.action}")
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def afilter_queryset(self, queryset):
+        # Filters on relations validate the id against the database
+        if set(self.request.query_params) & set(getattr(self, 'filterset_fields', None) or ()):
+            return await sync_to_async(self.filter_queryset)(queryset)
+        return self.filter_queryset(queryset)
+
+    async def aserialize(self, serializer):
+        """serializer.data, built on the event loop unless a field needs the database."""
+        try:
+            return serializer.data
+        except SynchronousOnlyOperation:
+            # e.g. the active promotion cache reloading for effective_price
+            return await sync_to_async(lambda: serializer.data)()
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        if hasattr(self.paginator, 'apaginate_queryset'):
+            return await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+        return await sync_to_async(self.paginator.paginate_queryset)(queryset, self.request, view=self)
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = await self.afilter_queryset(self.get_queryset())
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(await self.aserialize(self.get_serializer(page, many=True)))
+        objects = [obj async for obj in queryset.aiterator(chunk_size=CHUNK_SIZE)]
+        return Response(await self.aserialize(self.get_serializer(objects, many=True)))
+
+    async def aget_object(self):
+        """get_object() with aget()."""
+        queryset = await self.afilter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except ObjectDoesNotExist:
+            raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+        except (DjangoValidationError, TypeError, ValueError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def aretrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        return Response(await self.aserialize(self.get_serializer(instance)))
+
+    def validate_and_create(self, serializer):
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+
+    async def acreate(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        # Validation resolves related ids and saving runs signals: one trip to a worker thread
+        await sync_to_async(self.validate_and_create)(serializer)
+        data = await self.aserialize(serializer)
+        return Response(data, status=status.HTTP_201_CREATED, headers=self.get_success_headers(data))
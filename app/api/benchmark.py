@@ -0,0 +1,429 @@
+import asyncio
+import importlib
+import io
+import json
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+from urllib.parse import urlencode
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import clear_url_caches
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from .cache import TRACKED_MODELS, invalidate
+from .compiled import get_converter
+from .counting import row_counter
+from .exports import write_export
+from .models import User, Category, Product, Supplier, Customer, Order, OrderItem, Review, Shipping, Payment, Staff, Promotion
+from .prefetching import eager_load
+from .promotions import active_promotions
+from .ratings import rebuild_ratings
+from .renderers import FastJSONParser, FastJSONRenderer
+from .search import rebuild_index
+from .serializers import OrderSerializer, ProductSerializer
+from .urls import router
+
+METRICS = ('queries', 'p50_ms', 'p95_ms', 'bytes')
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'benchmark_baseline.json'
+
+
+def seed_dataset(rows, start=0):
+    """Creates `rows` synthetic rows for every model with bulk inserts (signals are not sent)."""
+    now = timezone.now()
+    indexes = range(start, start + rows)
+
+    users = User.objects.bulk_create(
+        User(username=f"user{i}", email=f"user{i}@example.com") for i in indexes
+    )
+    staff_users = User.objects.bulk_create(
+        User(username=f"staff{i}", role='manager') for i in indexes
+    )
+    customers = Customer.objects.bulk_create(
+        Customer(user=user, phone=str(i)) for i, user in zip(indexes, users)
+    )
+    Staff.objects.bulk_create(Staff(user=user, phone=str(i)) for i, user in zip(indexes, staff_users))
+
+    categories = Category.objects.bulk_create(
+        Category(name=f"category{i}-{j}") for i in indexes for j in range(2)
+    )
+    products = Product.objects.bulk_create(
+        Product(name=f"product{i}", description=f"Product {i}", price=10 + i) for i in indexes
+    )
+    Product.categories.through.objects.bulk_create(
+        Product.categories.through(product=product, category=category)
+        for n, product in enumerate(products) for category in categories[2 * n:2 * n + 2]
+    )
+    suppliers = Supplier.objects.bulk_create(Supplier(name=f"supplier{i}") for i in indexes)
+    Supplier.products.through.objects.bulk_create(
+        Supplier.products.through(supplier=supplier, product=product)
+        for supplier, product in zip(suppliers, products)
+    )
+
+    orders = Order.objects.bulk_create(
+        Order(customer=customer, total_amount=product.price)
+        for customer, product in zip(customers, products)
+    )
+    Order.products.through.objects.bulk_create(
+        Order.products.through(order=order, product=product) for order, product in zip(orders, products)
+    )
+    OrderItem.objects.bulk_create(
+        OrderItem(order=order, product=product, unit_price=product.price) for order, product in zip(orders, products)
+    )
+    Review.objects.bulk_create(
+        Review(customer=customer, product=product, rating=1 + n % 5, comment="")
+        for n, (customer, product) in enumerate(zip(customers, products))
+    )
+    rebuild_ratings()
+    Shipping.objects.bulk_create(Shipping(order=order, address="address", shipped_date=now) for order in orders)
+    Payment.objects.bulk_create(Payment(order=order, amount=order.total_amount) for order in orders)
+    Promotion.objects.bulk_create(
+        Promotion(product=product, discount_percent=10, start_date=now, end_date=now + timedelta(days=7))
+        for product in products
+    )
+    # bulk_create sends no signals
+    active_promotions.invalidate()
+    invalidate(*TRACKED_MODELS)
+    rebuild_index()
+    row_counter.refresh()
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def routes():
+    """Yields (name, url) for the list and detail route of every ViewSet on the router."""
+    for prefix, viewset, basename in router.registry:
+        yield f"{basename}-list", f"/app/api/{prefix}/"
+        obj = viewset.queryset.model._default_manager.order_by('pk').first()
+        if obj is not None:
+            yield f"{basename}-detail", f"/app/api/{prefix}/{obj.pk}/"
+
+
+def measure(client, url, repeat):
+    client.get(url)  # warm up in-process caches
+    timings, queries, size = [], 0, 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {url} returned {response.status_code}")
+        queries, size = len(captured), len(response.content)
+    return {
+        'queries': queries,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'bytes': size,
+    }
+
+
+def measure_order_creation(repeat):
+    """Times creating an order in its own transaction, including the post_save email signal."""
+    customer = Customer.objects.select_related('user').order_by('pk').first()
+    timings, queries = [], 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            with transaction.atomic():
+                Order.objects.create(customer=customer, total_amount=10)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = len(captured)
+    return {
+        'queries': queries,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'bytes': 0,
+    }
+
+
+def run_benchmark(repeat=10, user=None):
+    """Hits every router endpoint `repeat` times and returns metrics per route."""
+    if user is None:
+        user, _ = User.objects.get_or_create(username='benchmark', defaults={'role': 'admin'})
+    client = APIClient()
+    client.force_authenticate(user)
+    results = {name: measure(client, url, repeat) for name, url in routes()}
+    results['order-create'] = measure_order_creation(repeat)
+    return results
+
+
+def measure_export(model, file_format):
+    """Returns export throughput in rows per second."""
+    with tempfile.TemporaryFile() as file:
+        started = time.perf_counter()
+        rows = write_export(file, model._default_manager.all(), file_format)
+        elapsed = time.perf_counter() - started
+    return round(rows / elapsed) if rows else 0
+
+
+def measure_bulk_create(rows=200, user=None):
+    """
+    Returns products created per second ({path: rate}) when each product is sent
+    in its own request and when all of them are sent in one bulk request.
+    """
+    if user is None:
+        user, _ = User.objects.get_or_create(username='benchmark', defaults={'role': 'admin'})
+    client = APIClient()
+    client.force_authenticate(user)
+    category_ids = list(Category.objects.values_list('pk', flat=True)[:2])
+    items = [
+        {'name': f"bulk{i}", 'description': f"Product {i}", 'price': "10.00", 'categories': category_ids}
+        for i in range(rows)
+    ]
+    rates = {}
+    for path, url, bodies in (('single', "/app/api/products/", items), ('bulk', "/app/api/products/bulk/", [items])):
+        started = time.perf_counter()
+        for body in bodies:
+            response = client.post(url, body, format='json')
+            if response.status_code != 201:
+                raise RuntimeError(f"POST {url} returned {response.status_code}")
+        rates[path] = round(rows / (time.perf_counter() - started))
+    return rates
+
+
+def measure_json(repeat=20):
+    """
+    Returns {renderer: MB/s} for rendering and parsing a page of orders with
+    customers, products and categories expanded, with DRF's stdlib renderer/parser
+    and with the orjson pair from api/renderers.py.
+    """
+    request = Request(APIRequestFactory().get("/", {'expand': "customer.user,products.categories"}))
+    serializer = OrderSerializer(context={'request': request})
+    orders = eager_load(Order.objects.order_by('pk'), serializer)[:100]
+    data = OrderSerializer(orders, many=True, context={'request': request}).data
+
+    rates = {}
+    for name, renderer, parser in (
+        ('stdlib', JSONRenderer(), JSONParser()), ('orjson', FastJSONRenderer(), FastJSONParser()),
+    ):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            content = renderer.render(data)
+        rendered = time.perf_counter() - started
+        started = time.perf_counter()
+        for _ in range(repeat):
+            parser.parse(io.BytesIO(content))
+        parsed = time.perf_counter() - started
+        megabytes = len(content) * repeat / 1e6
+        rates[name] = {'render': round(megabytes / rendered, 1), 'parse': round(megabytes / parsed, 1)}
+    return rates
+
+
+def measure_serializers(repeat=20):
+    """
+    Returns {endpoint: {path: rows/s}} for building response data of 100 products and
+    100 orders (relations expanded) with DRF serializers and with compiled converters.
+    """
+    request = Request(APIRequestFactory().get("/", {'expand': "categories,customer.user,products"}))
+    rates = {}
+    for name, serializer_class, queryset in (
+        ('products', ProductSerializer, Product.objects.order_by('pk')),
+        ('orders', OrderSerializer, Order.objects.order_by('pk')),
+    ):
+        root = serializer_class(context={'request': request})
+        instances = list(eager_load(queryset, root)[:100])
+        convert = get_converter(root)
+        rates[name] = {}
+        for path, build in (
+            ('drf', lambda: serializer_class(instances, many=True, context={'request': request}).data),
+            ('compiled', lambda: [convert(instance, root) for instance in instances]),
+        ):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                build()
+            rates[name][path] = round(len(instances) * repeat / (time.perf_counter() - started))
+    return rates
+
+
+def measure_search(rows, repeat=20, user=None):
+    """
+    Adds `rows` products named from a 1000-word vocabulary, rebuilds the search index
+    and returns p50/p95 latency of GET /products/search/ for a rare pair of words, a
+    word in every tenth description and a short prefix.
+    """
+    syllables = ["ка", "ро", "ми", "ла", "те", "ну", "бо", "зи", "ве", "ду"]
+    words = [a + b + c for a in syllables for b in syllables for c in syllables]
+    categories = list(Category.objects.values_list('pk', flat=True))
+    for start in range(0, rows, 10000):
+        products = Product.objects.bulk_create(
+            Product(
+                name=f"{words[i % 1000]} {words[i * 7 % 997]}",
+                description=f"{words[i * 13 % 991]} {words[i * 31 % 983]} {words[i % 10]}",
+                price=10,
+            )
+            for i in range(start, min(rows, start + 10000))
+        )
+        Product.categories.through.objects.bulk_create(
+            Product.categories.through(product_id=product.pk, category_id=categories[product.pk % len(categories)])
+            for product in products
+        )
+    rebuild_index()
+    invalidate(Product)
+    if user is None:
+        user, _ = User.objects.get_or_create(username='benchmark', defaults={'role': 'admin'})
+    client = APIClient()
+    client.force_authenticate(user)
+    results = {}
+    for name, query in (('rare', f"{words[500]} {words[501]}"), ('common', words[1]), ('prefix', words[1][:3])):
+        url = f"/app/api/products/search/?{urlencode({'q': query})}"
+        results[name] = {metric: value for metric, value in measure(client, url, repeat).items() if metric.endswith('_ms')}
+    return results
+
+
+@contextmanager
+def async_views(enabled):
+    """Reloads the URLconf with settings.API_ASYNC_VIEWS set to `enabled` (as_view() reads it)."""
+    import api.urls
+    import app.urls
+
+    def reload():
+        clear_url_caches()
+        importlib.reload(api.urls)
+        importlib.reload(app.urls)
+
+    try:
+        with override_settings(API_ASYNC_VIEWS=enabled):
+            reload()
+            yield
+    finally:
+        reload()
+
+
+def wsgi_environ(path, query, cookie):
+    return {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_COOKIE': cookie, 'HTTP_ACCEPT': 'application/json',
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': io.StringIO(), 'wsgi.url_scheme': 'http',
+    }
+
+
+def run_wsgi(urls, cookie, concurrency):
+    handler = WSGIHandler()
+
+    def get(url):
+        path, _, query = url.partition('?')
+        statuses = []
+        body = b''.join(handler(wsgi_environ(path, query, cookie), lambda status, headers: statuses.append(status)))
+        if not statuses[0].startswith('200'):
+            raise RuntimeError(f"GET {url} returned {statuses[0]}")
+        return len(body)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(get, urls))
+
+
+async def run_asgi(urls, cookie, concurrency):
+    handler = ASGIHandler()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def get(url):
+        path, _, query = url.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+            'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode()), (b'accept', b'application/json')],
+            'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+        }
+        messages, done = [], asyncio.Event()
+
+        async def receive():
+            if not messages:
+                messages.append(None)
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # The handler listens for a disconnect while the view runs
+            await done.wait()
+            return {'type': 'http.disconnect'}
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+            if message['type'] == 'http.response.body' and not message.get('more_body'):
+                done.set()
+
+        async with semaphore:
+            await handler(scope, receive, send)
+        if sent[0]['status'] != 200:
+            raise RuntimeError(f"GET {url} returned {sent[0]['status']}")
+        return sum(len(message.get('body', b'')) for message in sent)
+
+    return await asyncio.gather(*(get(url) for url in urls))
+
+
+def measure_concurrency(requests=200, concurrency=20, user=None):
+    """
+    Returns requests per second ({server: rate}) for `requests` GETs over the product,
+    order and review list/detail routes, `concurrency` at a time, through Django's
+    WSGI handler on a thread pool, its ASGI handler with the synchronous views, and
+    its ASGI handler with the async views (api/asyncviews.py). Handlers are called
+    in-process, so the numbers compare the request paths, not HTTP servers.
+    """
+    if user is None:
+        user, _ = User.objects.get_or_create(username='benchmark', defaults={'role': 'admin'})
+    client = Client()
+    client.force_login(user)
+    cookie = '; '.join(f"{name}={morsel.value}" for name, morsel in client.cookies.items())
+    # Bypass the response cache so every request reaches the view
+    targets = [url for name, url in routes() if name.split('-')[0] in ('product', 'order', 'review')]
+    urls = [f"{targets[i % len(targets)]}?n={i}" for i in range(requests)]
+
+    rates = {}
+    for name, enabled, run in (
+        ('wsgi', False, lambda: run_wsgi(urls, cookie, concurrency)),
+        ('asgi', False, lambda: asyncio.run(run_asgi(urls, cookie, concurrency))),
+        ('asgi-async', True, lambda: asyncio.run(run_asgi(urls, cookie, concurrency))),
+    ):
+        with async_views(enabled):
+            run()  # warm up
+            started = time.perf_counter()
+            run()
+            rates[name] = round(len(urls) / (time.perf_counter() - started))
+    return rates
+
+
+def compare(results, baseline, threshold=0.2, metrics=METRICS, noise_ms=1.0):
+    """
+    Returns a list of regressions: metrics that grew by more than `threshold`
+    relative to the baseline. Query counts must never grow, and latency changes
+    below `noise_ms` are ignored.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in metrics:
+            allowed = previous[metric] if metric == 'queries' else previous[metric] * (1 + threshold)
+            if metric.endswith('_ms'):
+                allowed = max(allowed, previous[metric] + noise_ms)
+            if current[metric] > allowed:
+                regressions.append(f"{name}: {metric} {previous[metric]} -> {current[metric]}")
+    return regressions
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_baseline(path, results):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+        file.write('\n')
@@ -0,0 +1,282 @@
+import codecs
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from rest_framework import serializers, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import BaseParser
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.validators import UniqueValidator
+
+from .cache import invalidate
+from .counting import row_counter
+from .notifications import batch_shipping_notifications, dispatch_order_emails, notify_if_shipped, order_email
+from .pricing import create_orders, sync_order_items
+from .relations import load_related
+from .renderers import FastJSONParser, loads
+from .search import index_products
+
+BATCH_SIZE = 1000
+
+
+class NDJSONParser(BaseParser):
+    """Parses newline-delimited JSON into a list with one item per non-empty line."""
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        items = []
+        for number, line in enumerate(codecs.getreader(encoding)(stream), start=1):
+            if not line.strip():
+                continue
+            try:
+                items.append(loads(line))
+            except ValueError as exc:
+                raise ParseError(f"NDJSON parse error on line {number} - {exc}")
+        return items
+
+
+def set_many_to_many(field, wanted, batch_size=BATCH_SIZE):
+    """
+    Makes the links of a ManyToManyField match `wanted` ({source pk: set of target pks})
+    by diffing against the through table: one SELECT, one DELETE and one INSERT per
+    batch. Returns (added, removed).
+    """
+    through = field.remote_field.through
+    source = through._meta.get_field(field.m2m_field_name()).attname
+    target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+
+    stale, existing = [], defaultdict(set)
+    sources = list(wanted)
+    for start in range(0, len(sources), batch_size):
+        rows = through.objects.filter(**{f"{source}__in": sources[start:start + batch_size]})
+        for pk, source_pk, target_pk in rows.values_list('pk', source, target):
+            if target_pk in wanted[source_pk]:
+                existing[source_pk].add(target_pk)
+            else:
+                stale.append(pk)
+
+    links = [
+        through(**{source: source_pk, target: target_pk})
+        for source_pk, target_pks in wanted.items()
+        for target_pk in target_pks - existing[source_pk]
+    ]
+    for start in range(0, len(stale), batch_size):
+        through.objects.filter(pk__in=stale[start:start + batch_size]).delete()
+    through.objects.bulk_create(links, batch_size=batch_size)
+    return len(links), len(stale)
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    Validates a list of items in one pass: related ids are loaded with one in_bulk()
+    per model, unique fields are checked with one query each, and invalid items are
+    collected in `item_errors` (index -> errors) instead of failing the whole list.
+    Valid items are written with bulk_create()/bulk_update().
+    """
+
+    def child_fields_without_unique_validators(self):
+        # check_unique() covers them with one query per field instead of one per item
+        for field in self.child.fields.values():
+            field.validators = [validator for validator in field.validators if not isinstance(validator, UniqueValidator)]
+
+    def run_child_validation(self, data):
+        if self.instance is not None:
+            pk = data.get('id') if isinstance(data, dict) else None
+            try:
+                self.child.instance = self.instance.get(self.child.Meta.model._meta.pk.to_python(pk))
+            except (DjangoValidationError, TypeError):
+                self.child.instance = None
+            if self.child.instance is None:
+                raise ValidationError({'id': [f"Объект с id={pk} не найден."]})
+        return super().run_child_validation(data)
+
+    def check_unique(self, items):
+        """Rejects items whose unique fields clash with each other or with stored rows."""
+        model = self.child.Meta.model
+        for field in model._meta.concrete_fields:
+            if not field.unique or field.primary_key:
+                continue
+            values = {index: attrs[field.name] for index, (attrs, _) in items.items() if field.name in attrs}
+            taken = dict(
+                model._base_manager.filter(**{f"{field.name}__in": values.values()}).values_list(field.attname, 'pk')
+            )
+            seen = set()
+            for index, value in values.items():
+                key = getattr(value, 'pk', value)
+                instance = items[index][1]
+                if key in seen or (key in taken and (instance is None or taken[key] != instance.pk)):
+                    self.item_errors[index] = {field.name: [UniqueValidator.message]}
+                seen.add(key)
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            message = self.error_messages['not_a_list'].format(input_type=type(data).__name__)
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [message]}, code='not_a_list')
+
+        self.context['related_objects'] = load_related(self.child, data)
+        self.child_fields_without_unique_validators()
+        self.item_errors, items = {}, {}
+        for index, item in enumerate(data):
+            try:
+                items[index] = (self.run_child_validation(item), self.child.instance)
+            except ValidationError as exc:
+                self.item_errors[index] = exc.detail
+        self.check_unique(items)
+
+        valid = [index for index in items if index not in self.item_errors]
+        self.valid_indexes = valid
+        self.valid_instances = [items[index][1] for index in valid]
+        return [items[index][0] for index in valid]
+
+    def split_many_to_many(self, validated_data):
+        names = {field.name for field in self.child.Meta.model._meta.many_to_many}
+        return [
+            {name: attrs.pop(name) for name in names if name in attrs}
+            for attrs in validated_data
+        ]
+
+    def save_many_to_many(self, objects, values):
+        model = self.child.Meta.model
+        for name in {name for item in values for name in item}:
+            field = model._meta.get_field(name)
+            wanted = {obj.pk: {related.pk for related in item[name]} for obj, item in zip(objects, values) if name in item}
+            set_many_to_many(field, wanted)
+            invalidate(field.related_model)
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        many_to_many = self.split_many_to_many(validated_data)
+        with transaction.atomic():
+            objects = model._default_manager.bulk_create([model(**attrs) for attrs in validated_data], BATCH_SIZE)
+            row_counter.add(model, len(objects))
+            self.save_many_to_many(objects, many_to_many)
+            self.after_save(objects, created=True)
+        return objects
+
+    def update(self, instance, validated_data):
+        model = self.child.Meta.model
+        many_to_many = self.split_many_to_many(validated_data)
+        objects = self.valid_instances
+        fields = set()
+        for obj, attrs in zip(objects, validated_data):
+            for attr, value in attrs.items():
+                setattr(obj, attr, value)
+            fields.update(attrs)
+        with transaction.atomic():
+            if fields:
+                model._default_manager.bulk_update(objects, sorted(fields), BATCH_SIZE)
+            self.save_many_to_many(objects, many_to_many)
+            self.after_save(objects, created=False)
+        return objects
+
+    def after_save(self, objects, created):
+        """Side effects the per-object post_save receivers would have run; bulk writes send no signals."""
+        invalidate(self.child.Meta.model)
+
+
+class ProductListSerializer(BulkListSerializer):
+    def after_save(self, objects, created):
+        super().after_save(objects, created)
+        index_products([product.pk for product in objects])
+
+
+class OrderListSerializer(BulkListSerializer):
+    def create(self, validated_data):
+        # Orders are created from their items (or one item per product) and priced in bulk
+        with transaction.atomic():
+            orders = create_orders((attrs['customer'], self.child.order_lines(attrs)) for attrs in validated_data)
+            self.after_save(orders, created=True)
+        return orders
+
+    def update(self, instance, validated_data):
+        # Orders whose products change get their items and total_amount resynced
+        changed = ['products' in attrs for attrs in validated_data]
+        with transaction.atomic():
+            orders = super().update(instance, validated_data)
+            sync_order_items(order for order, products in zip(orders, changed) if products)
+        return orders
+
+    def after_save(self, objects, created):
+        super().after_save(objects, created)
+        if created:
+            dispatch_order_emails([order.pk for order in objects], order_email)
+
+
+class ShippingListSerializer(BulkListSerializer):
+    def after_save(self, objects, created):
+        super().after_save(objects, created)
+        # The check the post_save receiver runs, with the emails queued in one batch
+        with batch_shipping_notifications():
+            for shipping in objects:
+                notify_if_shipped(shipping)
+
+
+def item_errors(errors):
+    return [{'index': index, 'errors': detail} for index, detail in sorted(errors.items())]
+
+
+class BulkModelMixin:
+    """
+    ViewSet mixin adding POST/PATCH/DELETE on `<prefix>/bulk/`. The body is a JSON
+    array or NDJSON; items are validated with the ViewSet's serializer in list mode,
+    so its Meta.list_serializer_class must be a BulkListSerializer. Valid items are
+    written and invalid ones are reported by index.
+    """
+
+    def bulk_items(self, request):
+        if not isinstance(request.data, list):
+            raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ["Ожидается список объектов."]})
+        return request.data
+
+    def bulk_response(self, serializer, objects, success_status):
+        body = {'ids': [obj.pk for obj in objects], 'errors': item_errors(serializer.item_errors)}
+        return Response(body, status=success_status if objects or not serializer.item_errors else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[FastJSONParser, NDJSONParser])
+    def bulk_create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=self.bulk_items(request), many=True)
+        serializer.is_valid(raise_exception=True)
+        objects = serializer.save() if serializer.validated_data else []
+        return self.bulk_response(serializer, objects, status.HTTP_201_CREATED)
+
+    @bulk_create.mapping.patch
+    def bulk_update(self, request, *args, **kwargs):
+        items = self.bulk_items(request)
+        model = self.queryset.model
+        ids = []
+        for item in items:
+            try:
+                ids.append(model._meta.pk.to_python(item.get('id')))
+            except (AttributeError, DjangoValidationError, TypeError):
+                pass
+        instances = model._default_manager.in_bulk([pk for pk in ids if pk is not None])
+        serializer = self.get_serializer(instances, data=items, many=True, partial=True)
+        serializer.is_valid(raise_exception=True)
+        objects = serializer.save() if serializer.validated_data else []
+        return self.bulk_response(serializer, objects, status.HTTP_200_OK)
+
+    @bulk_create.mapping.delete
+    def bulk_destroy(self, request, *args, **kwargs):
+        items = self.bulk_items(request)
+        model = self.queryset.model
+        raw, pks = {}, {}
+        for index, item in enumerate(items):
+            raw[index] = item.get('id') if isinstance(item, dict) else item
+            try:
+                pks[index] = model._meta.pk.to_python(raw[index])
+            except (DjangoValidationError, TypeError):
+                pks[index] = None
+        queryset = model._default_manager.filter(pk__in=[pk for pk in pks.values() if pk is not None])
+        found = set(queryset.values_list('pk', flat=True))
+        errors = {
+            index: {'id': [f"Объект с id={raw[index]} не найден."]}
+            for index, pk in pks.items() if pk not in found
+        }
+        queryset.delete()  # soft delete, one UPDATE; invalidates the response cache
+        body = {'ids': sorted(found), 'errors': item_errors(errors)}
+        return Response(body, status=status.HTTP_200_OK if found or not errors else status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,145 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Category, Product, Supplier, Promotion, Review
+from .promotions import active_promotions
+
+# Models whose changes invalidate cached responses
+TRACKED_MODELS = (Category, Product, Supplier, Promotion, Review)
+VERSION_KEY = "api-version:{}"
+
+
+def get_cache():
+    alias = getattr(settings, 'API_RESPONSE_CACHE_ALIAS', None)
+    return caches[alias] if alias else None
+
+
+def model_versions(models):
+    """Returns {label: version}; a version is the time the model last changed."""
+    cache = get_cache()
+    keys = {VERSION_KEY.format(model._meta.label): model._meta.label for model in models}
+    stored = cache.get_many(keys)
+    missing = {key: time.time() for key in keys if key not in stored}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        stored.update(missing)
+    return {keys[key]: version for key, version in stored.items()}
+
+
+def invalidate(*models):
+    cache = get_cache()
+    if cache is not None:
+        now = time.time()
+        cache.set_many({VERSION_KEY.format(model._meta.label): now for model in models}, timeout=None)
+
+
+def on_model_change(sender, **kwargs):
+    invalidate(sender)
+
+
+def on_m2m_change(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate(*{field.related_model for field in sender._meta.concrete_fields if field.is_relation})
+
+
+for model in TRACKED_MODELS:
+    post_save.connect(on_model_change, sender=model, dispatch_uid=f"api-cache-{model._meta.label}")
+    post_delete.connect(on_model_change, sender=model, dispatch_uid=f"api-cache-delete-{model._meta.label}")
+for through in (Product.categories.through, Supplier.products.through):
+    m2m_changed.connect(on_m2m_change, sender=through, dispatch_uid=f"api-cache-{through._meta.label}")
+
+
+class CachedResponseMixin:
+    """
+    Caches list/retrieve response data per URL, query params and role. The key
+    includes the versions of `cache_models`, so model signals invalidate entries
+    and a matching If-None-Match/If-Modified-Since returns 304 before any query runs.
+    With Promotion among them the key also includes the active discounts, which
+    change when a promotion starts or ends without any write.
+    """
+    cache_models = ()
+
+    def cache_entry(self, request):
+        """(key, validator headers, 304 response or None) for the request."""
+        versions = model_versions(self.cache_models)
+        # changed_at is per process, so only Last-Modified uses it; the key uses the marker
+        marker, changed_at = active_promotions.state() if Promotion in self.cache_models else (None, 0)
+        role = getattr(request.user, 'role', None)
+        params = sorted(request.query_params.lists())
+        raw_key = f"{request.path}|{params}|{role}|{sorted(versions.items())}|{marker}"
+        key = "api-response:" + hashlib.md5(raw_key.encode()).hexdigest()
+        etag = quote_etag(key.split(':')[1])
+        last_modified = int(max(*versions.values(), changed_at))
+        headers = {'ETag': etag, 'Last-Modified': http_date(last_modified)}
+
+        if_none_match = request.headers.get('If-None-Match')
+        if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        if (if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]) or (
+            not if_none_match and if_modified_since is not None and if_modified_since >= last_modified
+        ):
+            return key, headers, Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return key, headers, None
+
+    def with_headers(self, response, headers):
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        cache = get_cache()
+        if cache is None:
+            return handler(request, *args, **kwargs)
+        key, headers, not_modified = self.cache_entry(request)
+        if not_modified is not None:
+            return not_modified
+
+        data = cache.get(key)
+        if data is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            cache.set(key, response.data)
+        else:
+            response = Response(data)
+        return self.with_headers(response, headers)
+
+    async def acached_response(self, request, handler, *args, **kwargs):
+        """
+        cached_response() for the async views. Cache reads stay synchronous: the
+        'api' cache is in-process, and BaseCache.aget() would cost a thread hop.
+        """
+        cache = get_cache()
+        if cache is None:
+            return await handler(request, *args, **kwargs)
+        key, headers, not_modified = self.cache_entry(request)
+        if not_modified is not None:
+            return not_modified
+
+        data = cache.get(key)
+        if data is None:
+            response = await handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            cache.set(key, response.data)
+        else:
+            response = Response(data)
+        return self.with_headers(response, headers)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        return await self.acached_response(request, super().alist, *args, **kwargs)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        return await self.acached_response(request, super().aretrieve, *args, **kwargs)
@@ -0,0 +1,198 @@
+import decimal
+
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+from rest_framework.relations import PKOnlyObject
+from rest_framework.settings import api_settings
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+from .relations import NestedRelatedField
+
+# Field classes whose to_representation() is a plain type conversion
+CONVERSIONS = {
+    serializers.CharField: str,
+    serializers.EmailField: str,
+    serializers.IntegerField: int,
+    serializers.FloatField: float,
+    serializers.BooleanField: bool,
+}
+MAX_CONVERTERS = 512
+
+# Cached per shape_key() and shared across requests, so converters keep only names,
+# attnames and conversions; fields and nested serializers bound to the current
+# request (and its context) are looked up on the serializer passed to each call.
+_converters = {}
+
+
+def attribute_getter(field):
+    """Reads a plain `source` attribute, or returns None when DRF's dotted/`*` lookup is needed."""
+    if len(field.source_attrs) != 1:
+        return None
+    name = field.source_attrs[0]
+    return lambda instance: getattr(instance, name)
+
+
+def bound(name, *path):
+    """Finds the field `name` (then the `path` attributes) on the calling serializer."""
+    def get(serializer):
+        field = serializer.fields[name]
+        for attr in path:
+            field = getattr(field, attr)
+        return field
+    return get
+
+
+def related_list(source, convert, nested=None):
+    def get(instance, serializer):
+        # Read prefetched rows directly instead of building a related manager per instance
+        related = getattr(instance, '_prefetched_objects_cache', {}).get(source)
+        if related is None:
+            related = getattr(instance, source).all()
+        child = nested(serializer) if nested is not None else None
+        return [convert(obj, child) for obj in related]
+    return get
+
+
+def optional(getter, convert):
+    def get(instance, serializer):
+        value = getter(instance)
+        return None if value is None else convert(value)
+    return get
+
+
+def nested_object(getter, convert, nested):
+    def get(instance, serializer):
+        value = getter(instance)
+        return None if value is None else convert(value, nested(serializer))
+    return get
+
+
+def decimal_string(field):
+    """DecimalField.to_representation() with the quantize exponent and context computed once."""
+    if field.localize or field.decimal_places is None or not getattr(
+        field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING
+    ):
+        return None
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    exponent = decimal.Decimal('.1') ** field.decimal_places
+    rounding = field.rounding
+
+    def convert(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+    return convert
+
+
+def generic(name):
+    """The same steps Serializer.to_representation() runs for a field, on the caller's bound field."""
+    def get(instance, serializer):
+        field = serializer.fields[name]
+        attribute = field.get_attribute(instance)
+        check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+        return None if check_for_none is None else field.to_representation(attribute)
+    return get
+
+
+def compile_field(field, model):
+    getter = attribute_getter(field)
+    name = field.field_name
+    if getter is None:
+        return generic(name)
+
+    if isinstance(field, serializers.ManyRelatedField):
+        child = field.child_relation
+        if not isinstance(child, NestedRelatedField):
+            return generic(name)
+        if child.expanded:
+            return related_list(
+                field.source, compile_serializer(child.nested_serializer),
+                bound(name, 'child_relation', 'nested_serializer'),
+            )
+        return related_list(field.source, lambda obj, child: obj.pk)
+
+    if isinstance(field, NestedRelatedField):
+        if field.expanded:
+            return nested_object(getter, compile_serializer(field.nested_serializer), bound(name, 'nested_serializer'))
+        attname = model._meta.get_field(field.source).attname
+        return lambda instance, serializer: getattr(instance, attname)
+
+    if isinstance(field, serializers.ListSerializer) and isinstance(field.child, serializers.ModelSerializer):
+        return related_list(field.source, compile_serializer(field.child), bound(name, 'child'))
+    if isinstance(field, serializers.ModelSerializer):
+        return nested_object(getter, compile_serializer(field), bound(name))
+    if type(field) in CONVERSIONS:
+        return optional(getter, CONVERSIONS[type(field)])
+    if type(field) is serializers.DecimalField and decimal_string(field) is not None:
+        return optional(getter, decimal_string(field))
+    return generic(name)
+
+
+def compile_serializer(serializer):
+    """
+    Flattens a ModelSerializer into one function (instance, serializer) -> dict,
+    equal to serializer.to_representation(instance) for any serializer with the
+    same shape_key(). Only names are kept from the serializer compiled from.
+    """
+    model = serializer.Meta.model
+    fields = [(field.field_name, compile_field(field, model)) for field in serializer._readable_fields]
+
+    def convert(instance, serializer):
+        try:
+            return {name: get(instance, serializer) for name, get in fields}
+        except SkipField:
+            return serializer.to_representation(instance)
+    return convert
+
+
+def get_converter(serializer):
+    key = serializer.shape_key()
+    if key not in _converters:
+        if len(_converters) >= MAX_CONVERTERS:
+            _converters.clear()
+        _converters[key] = compile_serializer(serializer)
+    return _converters[key]
+
+
+class CompiledSerializer:
+    """
+    Read-only stand-in for a serializer whose `.data` is built by the compiled
+    converter. Everything else is delegated to the wrapped serializer.
+    """
+
+    def __init__(self, serializer):
+        self.serializer = serializer
+
+    def __getattr__(self, name):
+        return getattr(self.serializer, name)
+
+    @property
+    def data(self):
+        serializer = self.serializer
+        if isinstance(serializer, serializers.ListSerializer):
+            child = serializer.child
+            convert = get_converter(child)
+            return ReturnList([convert(instance, child) for instance in serializer.instance], serializer=serializer)
+        return ReturnDict(get_converter(serializer)(serializer.instance, serializer), serializer=serializer)
+
+
+class CompiledReadMixin:
+    """ViewSet mixin: JSON list/retrieve responses are rendered by compiled converters."""
+    compiled_actions = ('list', 'retrieve')
+
+    def use_compiled(self):
+        return (
+            getattr(settings, 'API_COMPILED_SERIALIZERS', True)
+            and self.action in self.compiled_actions
+            and getattr(getattr(self.request, 'accepted_renderer', None), 'format', None) == 'json'
+        )
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        child = getattr(serializer, 'child', serializer)
+        if 'data' not in kwargs and hasattr(child, 'shape_key') and self.use_compiled():
+            return CompiledSerializer(serializer)
+        return serializer
@@ -0,0 +1,195 @@
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from django.core.paginator import Paginator
+from django.core.signals import request_finished, request_started
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import User, Category, Product, Supplier, Customer, Order, Review, Shipping, Payment, Staff, Promotion, RowCount
+
+# Below this many rows an exact COUNT(*) is cheap and table statistics are too coarse
+ESTIMATE_THRESHOLD = 10000
+# Soft-deletable models whose live rows are kept in RowCount
+COUNTED_MODELS = (User, Category, Product, Supplier, Customer, Order, Review, Shipping, Payment, Staff, Promotion)
+# Buffered deltas are written at most this often; counters are re-read after MAX_AGE seconds
+FLUSH_INTERVAL = 5
+MAX_AGE = 10
+
+# True while the current context serves a request
+in_request = ContextVar('api_row_counter_in_request', default=False)
+
+
+def table_estimate(model, using='default'):
+    """Row count of the model's table from the planner statistics, or None when there are none."""
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", [table])
+            elif connection.vendor == 'sqlite':
+                # Filled in by ANALYZE: the first number of `stat` is the table's row count
+                cursor.execute("SELECT max(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s", [table])
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    # reltuples is -1 for a table that was never analyzed
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+
+class RowCounter:
+    """
+    Live row counts of COUNTED_MODELS, read from RowCount and cached in-process for
+    MAX_AGE. Committed creates and soft deletes are buffered as deltas; during a
+    request they are written with one UPDATE per model after it, at most every
+    FLUSH_INTERVAL. Commits outside requests (management commands, workers) are
+    written right away. Writes that send no signals (bulk_create, archive) drift
+    the counters until `manage.py refresh_counts` recounts them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = defaultdict(int)
+        self.cached = {}
+        self.flushed_at = time.monotonic()
+
+    def add(self, model, delta):
+        if delta and model in COUNTED_MODELS:
+            transaction.on_commit(lambda: self.buffer(model._meta.label, delta))
+
+    def buffer(self, label, delta):
+        with self.lock:
+            self.pending[label] += delta
+            if self.cached.get(label, (None,))[0] is not None:
+                rows, loaded_at = self.cached[label]
+                self.cached[label] = (rows + delta, loaded_at)
+        if not in_request.get():
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(int)
+            self.flushed_at = time.monotonic()
+        for label, delta in pending.items():
+            if delta:
+                RowCount.objects.filter(label=label).update(rows=F('rows') + delta)
+
+    def flush_if_due(self, **kwargs):
+        if self.pending and time.monotonic() - self.flushed_at >= FLUSH_INTERVAL:
+            self.flush()
+
+    def request_started(self, **kwargs):
+        in_request.set(True)
+
+    def request_finished(self, **kwargs):
+        in_request.set(False)
+        self.flush_if_due()
+
+    def rows(self, model):
+        """The counted live rows of the model, or None (cached like a count) when it has no RowCount."""
+        label, now = model._meta.label, time.monotonic()
+        with self.lock:
+            entry = self.cached.get(label)
+            if entry is not None and now - entry[1] < MAX_AGE:
+                return entry[0]
+        self.flush()
+        rows = RowCount.objects.filter(label=label).values_list('rows', flat=True).first()
+        with self.lock:
+            self.cached[label] = (rows, now)
+        return rows
+
+    def refresh(self, models=COUNTED_MODELS):
+        """Recounts the models exactly; returns {label: rows}."""
+        counts = {}
+        for model in models:
+            label = model._meta.label
+            with self.lock:
+                self.pending.pop(label, None)
+            counts[label] = model._default_manager.count()
+            RowCount.objects.update_or_create(label=label, defaults={'rows': counts[label], 'refreshed_at': timezone.now()})
+            with self.lock:
+                self.cached[label] = (counts[label], time.monotonic())
+        return counts
+
+    def invalidate(self):
+        with self.lock:
+            self.cached.clear()
+
+
+row_counter = RowCounter()
+
+
+def is_unfiltered(queryset):
+    """True when the queryset selects the same rows as the model's default manager."""
+    return queryset.query.where == queryset.model._default_manager.all().query.where
+
+
+def estimated_count(queryset):
+    """
+    Row count of an unfiltered queryset on a large table, from RowCount or else the
+    table statistics; None when the queryset is filtered or the table is small.
+    """
+    if not is_unfiltered(queryset):
+        return None
+    rows = row_counter.rows(queryset.model) if queryset.model in COUNTED_MODELS else None
+    if rows is None:
+        rows = table_estimate(queryset.model, queryset.db)
+    return rows if rows is not None and rows >= ESTIMATE_THRESHOLD else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that takes the count of an unfiltered large table from
+    estimated_count(); `exact=True` always runs COUNT(*).
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True, exact=False, **kwargs):
+        super().__init__(object_list, per_page, orphans, allow_empty_first_page, **kwargs)
+        self.exact = exact
+        self.estimated = False
+
+    def estimate(self):
+        if self.exact or not hasattr(self.object_list, 'query'):
+            return None
+        return estimated_count(self.object_list)
+
+    @cached_property
+    def count(self):
+        estimate = self.estimate()
+        self.estimated = estimate is not None
+        return super().count if estimate is None else estimate
+
+
+def remember_live(sender, instance, raw=False, **kwargs):
+    if not raw and not instance._state.adding and instance.is_deleted:
+        instance._counted_live = sender._base_manager.filter(pk=instance.pk, is_deleted=False).exists()
+
+
+def count_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        row_counter.add(sender, 0 if instance.is_deleted else 1)
+    elif instance.__dict__.pop('_counted_live', False):
+        row_counter.add(sender, -1)
+
+
+def count_delete(sender, instance, **kwargs):
+    if not instance.is_deleted:
+        row_counter.add(sender, -1)
+
+
+for model in COUNTED_MODELS:
+    pre_save.connect(remember_live, sender=model, dispatch_uid=f"api-count-pre-{model._meta.label}")
+    post_save.connect(count_save, sender=model, dispatch_uid=f"api-count-{model._meta.label}")
+    post_delete.connect(count_delete, sender=model, dispatch_uid=f"api-count-delete-{model._meta.label}")
+request_started.connect(row_counter.request_started, dispatch_uid='api-count-request')
+request_finished.connect(row_counter.request_finished, dispatch_uid='api-count-flush')
@@ -0,0 +1,285 @@
+import csv
+import datetime
+import decimal
+import io
+import logging
+import tempfile
+from itertools import islice
+
+import openpyxl
+from django.apps import apps
+from django.conf import settings
+from django.contrib.admin.models import LogEntry
+from django.core.files import File
+from django.db import models, transaction
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .models import ExportJob, ExportJobChunk, Order, Payment, Product, Review
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 2000
+# Selections larger than this are exported by the run_export_jobs worker
+BACKGROUND_THRESHOLD = getattr(settings, 'EXPORT_BACKGROUND_THRESHOLD', 50000)
+
+# format -> (file extension, content type)
+FORMATS = {
+    'csv': ('csv', "text/csv; charset=utf-8"),
+    'xlsx': ('xlsx', "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    'parquet': ('parquet', "application/vnd.apache.parquet"),
+    # Columnar fallback without pyarrow: machine-readable CSV with field names as the header
+    'compact_csv': ('csv', "text/csv; charset=utf-8"),
+}
+
+
+def resolve_format(file_format):
+    if file_format == 'parquet' and pyarrow is None:
+        return 'compact_csv'
+    return file_format
+
+
+def arrow_type(field):
+    if isinstance(field, (models.AutoField, models.IntegerField, models.ForeignKey)):
+        return pyarrow.int64()
+    if isinstance(field, models.FloatField):
+        return pyarrow.float64()
+    if isinstance(field, models.DecimalField):
+        return pyarrow.decimal128(field.max_digits, field.decimal_places)
+    if isinstance(field, models.BooleanField):
+        return pyarrow.bool_()
+    if isinstance(field, models.DateTimeField):
+        return pyarrow.timestamp('us', tz='UTC')
+    if isinstance(field, models.DateField):
+        return pyarrow.date32()
+    return pyarrow.string()
+
+
+# Exported columns per model; anything else (credentials, counters) is never written
+EXPORT_FIELDS = {
+    Order: ('id', 'customer', 'order_date', 'total_amount', 'is_deleted'),
+    Payment: ('id', 'order', 'payment_date', 'amount', 'is_deleted'),
+    Product: ('id', 'name', 'price', 'rating', 'review_count', 'is_deleted'),
+    Review: ('id', 'customer', 'product', 'rating', 'comment', 'review_date', 'is_deleted'),
+}
+
+
+class ModelExporter:
+    """Exports the listed fields of a model, reading plain tuples with values_list()."""
+
+    def __init__(self, model, field_names):
+        self.model = model
+        self.fields = [model._meta.get_field(name) for name in field_names]
+        self.title = str(model._meta.verbose_name_plural)[:31]  # Excel limits sheet titles to 31 characters
+        self.filename = model._meta.model_name
+        self.names = [field.attname for field in self.fields]
+        self.columns = [str(field.verbose_name) for field in self.fields]
+
+    def rows(self, queryset, chunk_size=CHUNK_SIZE):
+        # iterator() streams through a server-side cursor where the database supports one
+        return queryset.values_list(*self.names).iterator(chunk_size=chunk_size)
+
+    def arrow_schema(self):
+        return pyarrow.schema([(name, arrow_type(field)) for name, field in zip(self.names, self.fields)])
+
+
+class LogEntryExporter(ModelExporter):
+    def __init__(self, model):
+        super().__init__(model, ["id"])
+        self.title = "Логи действий"
+        self.filename = "log_entries"
+        self.names = ["id", "user", "action", "object", "action_time"]
+        self.columns = ["ID", "Пользователь", "Тип действия", "Объект", "Дата и время"]
+
+    def rows(self, queryset, chunk_size=CHUNK_SIZE):
+        for log_entry in queryset.select_related('user').iterator(chunk_size=chunk_size):
+            yield [
+                log_entry.id,
+                log_entry.user.username,
+                log_entry.get_action_flag_display(),
+                log_entry.object_repr,
+                log_entry.action_time.strftime("%Y-%m-%d %H:%M:%S"),
+            ]
+
+    def arrow_schema(self):
+        return pyarrow.schema([(name, pyarrow.int64() if name == "id" else pyarrow.string()) for name in self.names])
+
+
+EXPORTERS = {
+    LogEntry: LogEntryExporter,
+}
+
+
+def get_exporter(model):
+    """Raises ValueError for models without an explicit column list."""
+    if model in EXPORTERS:
+        return EXPORTERS[model](model)
+    if model in EXPORT_FIELDS:
+        return ModelExporter(model, EXPORT_FIELDS[model])
+    raise ValueError(f"Экспорт модели {model._meta.label} не поддерживается")
+
+
+class Echo:
+    """File-like object whose write() returns the value, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(columns, rows, bom=True):
+    writer = csv.writer(Echo())
+    if bom:
+        yield "\ufeff"  # BOM so Excel opens Cyrillic text correctly
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def xlsx_cell(value):
+    if isinstance(value, datetime.datetime) and timezone.is_aware(value):
+        return timezone.make_naive(value)  # openpyxl cannot store timezones
+    if value is None or isinstance(value, (str, int, float, decimal.Decimal, datetime.date, datetime.time)):
+        return value
+    return str(value)
+
+
+def write_csv(file, columns, rows, bom=True):
+    text = io.TextIOWrapper(file, encoding='utf-8-sig' if bom else 'utf-8', newline='')
+    writer = csv.writer(text)
+    writer.writerow(columns)
+    count = 0
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+    text.flush()
+    text.detach()
+    return count
+
+
+def write_xlsx(file, title, columns, rows):
+    # Write-only workbooks flush rows to disk instead of keeping cells in memory
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title)
+    worksheet.append(columns)
+    count = 0
+    for count, row in enumerate(rows, start=1):
+        worksheet.append([xlsx_cell(value) for value in row])
+    workbook.save(file)
+    return count
+
+
+def write_parquet(file, schema, rows, chunk_size=CHUNK_SIZE):
+    """Writes one row group per chunk, so only `chunk_size` rows are held in memory."""
+    as_text = [field.type == pyarrow.string() for field in schema]
+
+    def table(batch):
+        columns = [list(values) for values in zip(*batch)]
+        for column, text in zip(columns, as_text):
+            if text:
+                column[:] = [value if value is None or isinstance(value, str) else str(value) for value in column]
+        return pyarrow.Table.from_arrays(
+            [pyarrow.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+        )
+
+    count = 0
+    with pyarrow.parquet.ParquetWriter(file, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == chunk_size:
+                writer.write_table(table(batch))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(table(batch))
+            count += len(batch)
+    return count
+
+
+def write_export(file, queryset, file_format, chunk_size=CHUNK_SIZE):
+    """Writes `queryset` to a binary file in the given format; returns the number of rows."""
+    exporter = get_exporter(queryset.model)
+    return write_rows(file, exporter, exporter.rows(queryset, chunk_size), file_format, chunk_size)
+
+
+def write_rows(file, exporter, rows, file_format, chunk_size=CHUNK_SIZE):
+    file_format = resolve_format(file_format)
+    if file_format == 'csv':
+        return write_csv(file, exporter.columns, rows)
+    if file_format == 'compact_csv':
+        return write_csv(file, exporter.names, rows, bom=False)
+    if file_format == 'xlsx':
+        return write_xlsx(file, exporter.title, exporter.columns, rows)
+    return write_parquet(file, exporter.arrow_schema(), rows, chunk_size)
+
+
+def export_filename(model, file_format):
+    extension, content_type = FORMATS[resolve_format(file_format)]
+    return f"{get_exporter(model).filename}.{extension}", content_type
+
+
+def export_response(queryset, file_format):
+    """Streams the export: CSV is generated row by row, other formats are spooled to a temporary file."""
+    filename, content_type = export_filename(queryset.model, file_format)
+    file_format = resolve_format(file_format)
+    if file_format in ('csv', 'compact_csv'):
+        exporter = get_exporter(queryset.model)
+        bom = file_format == 'csv'
+        columns = exporter.columns if bom else exporter.names
+        response = StreamingHttpResponse(iter_csv(columns, exporter.rows(queryset), bom), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+    file = tempfile.TemporaryFile()
+    write_export(file, queryset, file_format)
+    file.seek(0)
+    return FileResponse(file, as_attachment=True, filename=filename, content_type=content_type)
+
+
+def queue_export(queryset, file_format, user=None, chunk_size=CHUNK_SIZE):
+    """
+    Queues the selection by its primary keys, streamed into ExportJobChunk rows of
+    `chunk_size` keys; the worker reloads the rows that still exist.
+    """
+    pks = queryset.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=chunk_size)
+    with transaction.atomic():
+        job = ExportJob.objects.create(model=queryset.model._meta.label, format=file_format, requested_by=user)
+        while object_ids := list(islice(pks, chunk_size)):
+            ExportJobChunk.objects.create(job=job, object_ids=object_ids)
+    return job
+
+
+def selected_rows(exporter, queryset, job, chunk_size=CHUNK_SIZE):
+    # One chunk of keys in memory at a time; pk__in per chunk keeps the parameter count within database limits
+    chunks = job.chunks.order_by('pk').values_list('object_ids', flat=True)
+    for object_ids in chunks.iterator(chunk_size=1):
+        yield from exporter.rows(queryset.filter(pk__in=object_ids).order_by('pk'), chunk_size)
+
+
+def run_export_job(job):
+    """Writes the job's file; only called by the run_export_jobs worker."""
+    job.status = 'running'
+    job.save(update_fields=['status'])
+    try:
+        model = apps.get_model(job.model)
+        exporter = get_exporter(model)
+        filename, _ = export_filename(model, job.format)
+        rows = selected_rows(exporter, model._default_manager.all(), job)
+        with tempfile.TemporaryFile() as file:
+            write_rows(file, exporter, rows, job.format)
+            file.seek(0)
+            job.file.save(f"{job.id}_{filename}", File(file), save=False)
+        job.status = 'done'
+        job.chunks.all().delete()
+    except Exception as e:
+        logger.error(f"Export job #{job.id} failed: {e}")
+        job.status = 'failed'
+        job.error = str(e)
+    job.finished_at = timezone.now()
+    job.save()
+    return job
@@ -0,0 +1,99 @@
+from datetime import datetime
+from decimal import Decimal
+
+from django.db import connections, transaction
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.test import APIRequestFactory
+
+# Placeholder filter values by internal field type; the planner only needs their type
+SAMPLE_VALUES = {
+    'AutoField': 1, 'BigAutoField': 1, 'ForeignKey': 1, 'OneToOneField': 1, 'ManyToManyField': 1,
+    'IntegerField': 1, 'PositiveIntegerField': 1, 'BigIntegerField': 1, 'FloatField': 1.0,
+    'DecimalField': Decimal('1'), 'BooleanField': True, 'DateField': datetime(2000, 1, 1).date(),
+}
+
+
+def sample_value(field):
+    internal_type = field.get_internal_type()
+    if internal_type == 'DateTimeField':
+        return timezone.make_aware(datetime(2000, 1, 1))
+    return SAMPLE_VALUES.get(internal_type, 'x')
+
+
+def filter_paths(viewset):
+    """(filter field or None, ordering field) for every combination a ViewSet's list accepts."""
+    orderings = list(dict.fromkeys(
+        [field.lstrip('-') for field in getattr(viewset, 'ordering', None) or []]
+        + list(getattr(viewset, 'ordering_fields', None) or [])
+    ))
+    for name in [None, *(getattr(viewset, 'filterset_fields', None) or [])]:
+        for ordering in orderings:
+            yield name, ordering
+
+
+def list_queryset(viewset):
+    """The ViewSet's list queryset, including the joins its eager loading adds."""
+    view = viewset()
+    view.request = Request(APIRequestFactory().get('/'))
+    view.action, view.format_kwarg, view.kwargs, view.args = 'list', None, {}, ()
+    return view.get_queryset()
+
+
+def explain(queryset):
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.explain()
+    # Small tables are cheaper to scan, so ask whether an index *can* serve the query
+    with transaction.atomic(using=queryset.db), connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        cursor.execute("SET LOCAL enable_sort = off")
+        return queryset.explain()
+
+
+def plan_problems(plan, table, filtered, vendor):
+    """'scan' when the table is read in full (or, with a filter, not searched by it), 'sort' for a sort step."""
+    lines = plan.splitlines()
+    problems = []
+    if vendor == 'postgresql':
+        if any(f"Seq Scan on {table}" in line for line in lines):
+            problems.append('scan')
+        if any(line.strip().startswith(('Sort', '->  Sort', '->  Incremental Sort')) for line in lines):
+            problems.append('sort')
+        return problems
+    scans = [line for line in lines if f"SCAN {table}" in line and f"SCAN {table}_" not in line]
+    if any(filtered or ' USING ' not in line for line in scans):
+        problems.append('scan')
+    if any('USE TEMP B-TREE FOR ORDER BY' in line or 'USE TEMP B-TREE FOR RIGHT PART OF ORDER BY' in line for line in lines):
+        problems.append('sort')
+    return problems
+
+
+def check_viewset(viewset):
+    """
+    Yields (filter, ordering, problems, plan) for every filter x ordering path of
+    the ViewSet, from the EXPLAIN of the first page's query. Sorting after a
+    many-to-many or unique filter is not reported: it cannot be (or need not be)
+    served by an index on the model's table.
+    """
+    base = list_queryset(viewset)
+    model = base.model
+    page_size = api_settings.PAGE_SIZE or 10
+    for name, ordering in filter_paths(viewset):
+        queryset = base
+        if name is not None:
+            queryset = queryset.filter(**{name: sample_value(model._meta.get_field(name))})
+        # Keyset pages break ties on the primary key, page numbers use the ordering alone
+        order_by = (ordering, 'pk') if getattr(viewset, 'keyset_pagination', False) else (ordering,)
+        plan = explain(queryset.order_by(*order_by)[:page_size])
+        problems = plan_problems(plan, model._meta.db_table, name is not None, connections[base.db].vendor)
+        field = model._meta.get_field(name) if name else None
+        if field is not None and (field.many_to_many or field.unique):
+            problems = [problem for problem in problems if problem != 'sort']
+        yield name, ordering, problems, plan
+
+
+def check_router(router):
+    """{basename: [(filter, ordering, problems, plan)]} for every ViewSet registered on the router."""
+    return {basename: list(check_viewset(viewset)) for prefix, viewset, basename in router.registry}
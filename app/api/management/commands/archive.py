@@ -0,0 +1,34 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from api.archive import CHUNK_SIZE, archive, restore
+
+
+class Command(BaseCommand):
+    help = "Moves soft-deleted rows and old orders into the archive table, or restores them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, help="Also archive orders older than this")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Rows archived per transaction")
+        parser.add_argument('--restore', metavar='MODEL', help="Restore archived rows of a model, e.g. api.Order")
+        parser.add_argument('--ids', nargs='+', default=[], help="Primary keys to restore")
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            try:
+                model = apps.get_model(options['restore'])
+            except (LookupError, ValueError) as e:
+                raise CommandError(e)
+            if not options['ids']:
+                raise CommandError("--restore needs --ids")
+            rows = restore(model, options['ids'])
+            self.stdout.write(self.style.SUCCESS(f"Restored {rows} rows"))
+            return
+
+        stats, elapsed = archive(options['retention_days'], options['chunk_size'])
+        total = 0
+        for label, (roots, rows) in stats.items():
+            self.stdout.write(f"{label:16}{roots} archived, {rows} rows moved")
+            total += rows
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f"Moved {total} rows in {elapsed:.2f}s ({rate:.0f} rows/s)"))
@@ -0,0 +1,72 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api.benchmark import (
+    seed_dataset, run_benchmark, measure_export, measure_bulk_create, measure_json,
+    measure_serializers, measure_search, measure_concurrency, compare, load_baseline, save_baseline, METRICS, DEFAULT_BASELINE
+)
+from api.models import Order, Review
+
+
+class Command(BaseCommand):
+    help = "Seeds a synthetic dataset in a test database and benchmarks every API endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100, help="Rows to seed per model")
+        parser.add_argument('--repeat', type=int, default=20, help="Requests per endpoint")
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help="Baseline JSON file")
+        parser.add_argument('--threshold', type=float, default=0.2, help="Allowed relative regression")
+        parser.add_argument('--search-rows', type=int, default=0, help="Products to add for the search benchmark (0 skips it)")
+        parser.add_argument('--concurrency', type=int, default=20, help="Concurrent requests for the ASGI/WSGI throughput test")
+        parser.add_argument('--update-baseline', action='store_true', help="Write results as the new baseline")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            seed_dataset(options['rows'])
+            results = run_benchmark(repeat=options['repeat'])
+            exports = {
+                (model.__name__, file_format): measure_export(model, file_format)
+                for model in (Order, Review) for file_format in ('csv', 'xlsx', 'parquet')
+            }
+            bulk_rates = measure_bulk_create(options['rows'])
+            json_rates = measure_json()
+            serializer_rates = measure_serializers()
+            throughput = measure_concurrency(concurrency=options['concurrency'])
+            search_timings = measure_search(options['search_rows']) if options['search_rows'] else {}
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        for name, metrics in results.items():
+            self.stdout.write(f"{name:24}" + "  ".join(f"{metric}={metrics[metric]}" for metric in METRICS))
+        for (model, file_format), rate in exports.items():
+            self.stdout.write(f"export {model} {file_format:8}{rate} rows/s")
+        for path, rate in bulk_rates.items():
+            self.stdout.write(f"create products {path:8}{rate} rows/s")
+        for name, rates in json_rates.items():
+            self.stdout.write(f"json {name:8}render {rates['render']} MB/s  parse {rates['parse']} MB/s")
+        for name, rates in serializer_rates.items():
+            self.stdout.write(f"serialize {name:9}" + "  ".join(f"{path} {rate} rows/s" for path, rate in rates.items()))
+        for name, rate in throughput.items():
+            self.stdout.write(f"throughput {name:12}{rate} req/s")
+        for name, timings in search_timings.items():
+            self.stdout.write(f"search {name:10}" + "  ".join(f"{metric}={value}" for metric, value in timings.items()))
+
+        baseline_path = Path(options['baseline'])
+        if options['update_baseline']:
+            save_baseline(baseline_path, results)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {baseline_path}"))
+            return
+        if not baseline_path.exists():
+            self.stdout.write(self.style.WARNING(f"No baseline at {baseline_path}, nothing to compare"))
+            return
+
+        regressions = compare(results, load_baseline(baseline_path), options['threshold'])
+        if regressions:
+            raise CommandError("Regressions:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions"))
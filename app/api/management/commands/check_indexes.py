@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.indexing import check_router
+from api.urls import router
+
+
+class Command(BaseCommand):
+    help = "EXPLAINs every ViewSet filter x ordering path and reports the ones no index serves"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plans', action='store_true', help="Print the plan of every path, not only unindexed ones")
+
+    def handle(self, *args, **options):
+        unindexed = 0
+        for basename, paths in check_router(router).items():
+            for name, ordering, problems, plan in paths:
+                label = f"{basename}: filter={name or '-'} ordering={ordering}"
+                if problems:
+                    unindexed += 1
+                    self.stdout.write(self.style.WARNING(f"{label}  {', '.join(problems)}"))
+                elif options['plans']:
+                    self.stdout.write(f"{label}  ok")
+                if problems or options['plans']:
+                    for line in plan.splitlines():
+                        self.stdout.write(f"    {line}")
+        if unindexed:
+            raise CommandError(f"{unindexed} unindexed filter/ordering paths")
+        self.stdout.write(self.style.SUCCESS("Every filter/ordering path uses an index"))
@@ -0,0 +1,32 @@
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from api.exports import CHUNK_SIZE, export_filename, get_exporter, write_export
+
+
+class Command(BaseCommand):
+    help = "Exports all rows of a model to CSV, XLSX or Parquet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help="Model label, e.g. api.Order")
+        parser.add_argument('--format', choices=['csv', 'xlsx', 'parquet'], default='csv')
+        parser.add_argument('--output', help="Output file (defaults to the model name)")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options['model'])
+            get_exporter(model)
+        except (LookupError, ValueError) as e:
+            raise CommandError(e)
+
+        output = options['output'] or export_filename(model, options['format'])[0]
+        started = time.perf_counter()
+        with open(output, 'wb') as file:
+            rows = write_export(file, model._default_manager.all(), options['format'], options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{rows} rows written to {output} in {elapsed:.2f}s ({rows / elapsed:.0f} rows/s)"
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = "Recomputes Product review counts, sums and ratings from the reviews"
+
+    def handle(self, *args, **options):
+        fixed = rebuild_ratings()
+        self.stdout.write(self.style.SUCCESS(f"Fixed {fixed} products"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Recreates the product full-text search index from the live products"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=None, help="Database alias (default: the one products are written to)")
+
+    def handle(self, *args, **options):
+        indexed = rebuild_index(options['database'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} products"))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api.counting import row_counter
+
+
+class Command(BaseCommand):
+    help = "Recounts the live rows behind the estimated list counts; run it periodically (e.g. from cron)"
+
+    def handle(self, *args, **options):
+        for label, rows in row_counter.refresh().items():
+            self.stdout.write(f"{label:20}{rows}")
+        self.stdout.write(self.style.SUCCESS("Row counts refreshed"))
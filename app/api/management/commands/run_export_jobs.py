@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.exports import run_export_job
+from api.models import ExportJob
+
+
+class Command(BaseCommand):
+    help = "Runs queued admin export jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Keep polling for new jobs")
+        parser.add_argument('--interval', type=float, default=5, help="Polling interval for --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            job = ExportJob.objects.filter(status='pending').order_by('created_at').first()
+            if job is not None:
+                job = run_export_job(job)
+                self.stdout.write(f"{job}: {job.get_status_display()} {job.file.name if job.file else job.error}")
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
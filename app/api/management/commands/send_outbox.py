@@ -0,0 +1,36 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.outbox import drain, MAX_ATTEMPTS, BACKOFF_SECONDS
+
+logger = logging.getLogger('api.outbox')
+
+
+class Command(BaseCommand):
+    help = "Sends queued emails from the outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS)
+        parser.add_argument('--backoff', type=int, default=BACKOFF_SECONDS, help="Base retry delay in seconds")
+        parser.add_argument('--loop', action='store_true', help="Keep polling the outbox")
+        parser.add_argument('--interval', type=float, default=5, help="Polling interval for --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                sent, failed = drain(options['batch_size'], options['max_attempts'], options['backoff'])
+            except Exception as e:
+                if not options['loop']:
+                    raise
+                # A database hiccup must not stop the worker; a claimed batch is retried after its lease
+                logger.exception(f"Outbox batch failed: {e}")
+                sent = failed = 0
+            if sent or failed:
+                self.stdout.write(f"Sent {sent}, failed {failed}")
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:17
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_rowcount'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='exportjob',
+            options={'permissions': [('export_data', 'Может экспортировать данные')], 'verbose_name': 'Экспорт', 'verbose_name_plural': 'Экспорты'},
+        ),
+    ]
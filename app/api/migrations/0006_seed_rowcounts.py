@@ -0,0 +1,27 @@
+from django.db import migrations
+
+# api.counting.COUNTED_MODELS at the time of this migration
+COUNTED_MODELS = (
+    'User', 'Category', 'Product', 'Supplier', 'Customer', 'Order', 'Review', 'Shipping', 'Payment', 'Staff', 'Promotion',
+)
+
+
+def seed_rowcounts(apps, schema_editor):
+    # Counters only move by deltas, so every counted model needs its row from the start
+    RowCount = apps.get_model('api', 'RowCount')
+    using = schema_editor.connection.alias
+    for name in COUNTED_MODELS:
+        model = apps.get_model('api', name)
+        rows = model._base_manager.using(using).filter(is_deleted=False).count()
+        RowCount.objects.using(using).get_or_create(label=f"api.{name}", defaults={'rows': rows})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_exportjob_object_ids'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_rowcounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_seed_rowcounts'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='exportjob',
+            name='object_ids',
+        ),
+        migrations.CreateModel(
+            name='ExportJobChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_ids', models.JSONField()),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='api.exportjob')),
+            ],
+            options={
+                'verbose_name': 'Часть экспорта',
+                'verbose_name_plural': 'Части экспорта',
+            },
+        ),
+    ]
@@ -1,11 +1,129 @@
-from django.db import models
-from django.contrib.auth.models import AbstractUser
+from django.db import models, transaction
+from django.contrib.auth.models import AbstractUser, UserManager
+from django.db.models import Count, F, Q, Sum
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.core.mail import send_mail
+from django.utils import timezone
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 import logging 
 
+
+class SoftDeleteQuerySet(models.QuerySet):
+    def delete(self):
+        """
+        Soft-deletes every row in the queryset with a single UPDATE. update() sends
+        no signals, so cached responses are invalidated here.
+        """
+        from .cache import invalidate
+        from .counting import row_counter
+        count = self.filter(is_deleted=False).update(is_deleted=True)
+        row_counter.add(self.model, -count)
+        if count:
+            invalidate(self.model)
+        return count, {self.model._meta.label: count}
+
+    delete.queryset_only = True
+
+    def hard_delete(self):
+        return super().delete()
+
+    hard_delete.queryset_only = True
+
+    def restore(self):
+        from .cache import invalidate
+        from .counting import row_counter
+        count = self.filter(is_deleted=True).update(is_deleted=False)
+        row_counter.add(self.model, count)
+        if count:
+            invalidate(self.model)
+        return count
+
+
+class SoftDeleteManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    """Default manager that hides soft-deleted rows; all_with_deleted() is the escape hatch."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
+    def all_with_deleted(self):
+        return super().get_queryset()
+
+
+class UserQuerySet(SoftDeleteQuerySet):
+    def delete(self):
+        # Revokes the deleted users' tokens; instance saves bump the version in User.save()
+        from .counting import row_counter
+        from .tokens import token_versions
+        ids = list(self.filter(is_deleted=False).values_list('pk', flat=True))
+        count = self.model.objects.all_with_deleted().filter(pk__in=ids).update(
+            is_deleted=True, token_version=F('token_version') + 1
+        )
+        token_versions.invalidate(*ids)
+        row_counter.add(self.model, -count)
+        return count, {self.model._meta.label: count}
+
+    delete.queryset_only = True
+
+
+class SoftDeleteUserManager(UserManager.from_queryset(UserQuerySet)):
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
+    def all_with_deleted(self):
+        return super().get_queryset()
+
+
+class ReviewQuerySet(SoftDeleteQuerySet):
+    def delete(self):
+        # Bulk deletes bypass post_save, so the product aggregates are adjusted here
+        from .ratings import adjust_product
+        with transaction.atomic():
+            live = self.filter(is_deleted=False)
+            totals = list(live.values('product').annotate(count=Count('id'), total=Sum('rating')).order_by())
+            result = super().delete()
+            for row in totals:
+                adjust_product(row['product'], -row['count'], -row['total'])
+        return result
+
+    delete.queryset_only = True
+
+    def restore(self):
+        from .ratings import adjust_product
+        with transaction.atomic():
+            deleted = self.filter(is_deleted=True)
+            totals = list(deleted.values('product').annotate(count=Count('id'), total=Sum('rating')).order_by())
+            result = super().restore()
+            for row in totals:
+                adjust_product(row['product'], row['count'], row['total'])
+        return result
+
+
+class PromotionQuerySet(SoftDeleteQuerySet):
+    def delete(self):
+        from .promotions import active_promotions
+        result = super().delete()
+        active_promotions.invalidate()
+        return result
+
+    delete.queryset_only = True
+
+    def restore(self):
+        from .promotions import active_promotions
+        result = super().restore()
+        active_promotions.invalidate()
+        return result
+
+
+ReviewManager = SoftDeleteManager.from_queryset(ReviewQuerySet)
+PromotionManager = SoftDeleteManager.from_queryset(PromotionQuerySet)
+
+
+def live_index(*fields, name):
+    """Partial index over rows that are not soft-deleted."""
+    return models.Index(fields=list(fields), condition=Q(is_deleted=False), name=name)
+
+
 class User(AbstractUser):
     ROLE_CHOICES = (
         ('admin', 'Администратор'),
@@ -14,6 +132,28 @@ class User(AbstractUser):
     )
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='customer')
     is_deleted = models.BooleanField(default=False)
+    # Carried in JWTs (api/tokens.py); bumped when role or access changes, which revokes issued tokens
+    token_version = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = SoftDeleteUserManager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_token_state = instance.token_state()
+        return instance
+
+    def token_state(self):
+        return tuple(self.__dict__.get(name) for name in ('role', 'is_active', 'is_deleted'))
+
+    def save(self, *args, **kwargs):
+        state = self.token_state()
+        if state != getattr(self, '_loaded_token_state', state):
+            self.token_version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'token_version'}
+        super().save(*args, **kwargs)
+        self._loaded_token_state = state
 
     def delete(self, using=None, keep_parents=False):
         self.is_deleted = True
@@ -25,6 +165,13 @@ class User(AbstractUser):
     class Meta:
         verbose_name = "Пользователи"
         verbose_name_plural = "Пользователи"
+        # Filter x ordering paths of UserViewSet (checked by `manage.py check_indexes`)
+        indexes = [
+            live_index('username', name='user_live_username_idx'),
+            live_index('date_joined', name='user_live_joined_idx'),
+            live_index('role', 'username', name='user_live_role_username_idx'),
+            live_index('role', 'date_joined', name='user_live_role_joined_idx'),
+        ]
 
 
 
@@ -32,6 +179,8 @@ class Category(models.Model):
     name = models.CharField(max_length=100)
     is_deleted = models.BooleanField(default=False)
 
+    objects = SoftDeleteManager()
+
     def delete(self, using=None, keep_parents=False):
         self.is_deleted = True
         self.save()
@@ -42,6 +191,7 @@ class Category(models.Model):
     class Meta:
         verbose_name = "Категория"
         verbose_name_plural = "Категории"
+        indexes = [live_index('name', name='category_live_name_idx')]
 
 
 class Product(models.Model):
@@ -49,9 +199,14 @@ class Product(models.Model):
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     rating = models.FloatField(default=0)
+    # Maintained from Review by api/ratings.py, so listings never aggregate reviews
+    review_count = models.PositiveIntegerField(default=0)
+    review_sum = models.IntegerField(default=0)
     categories = models.ManyToManyField(Category, related_name="products")
     is_deleted = models.BooleanField(default=False)
 
+    objects = SoftDeleteManager()
+
     def delete(self, using=None, keep_parents=False):
         self.is_deleted = True
         self.save()
@@ -62,6 +217,12 @@ class Product(models.Model):
     class Meta:
         verbose_name = "Продукт"
         verbose_name_plural = "Продукты"
+        indexes = [
+            live_index('name', name='product_live_name_idx'),
+            live_index('price', name='product_live_price_idx'),
+            live_index('name', 'price', name='product_live_name_price_idx'),
+            live_index('price', 'name', name='product_live_price_name_idx'),
+        ]
 
 
 class Supplier(models.Model):
@@ -69,6 +230,8 @@ class Supplier(models.Model):
     products = models.ManyToManyField(Product, related_name="suppliers")
     is_deleted = models.BooleanField(default=False)
 
+    objects = SoftDeleteManager()
+
     def delete(self, using=None, keep_parents=False):
         self.is_deleted = True
         self.save()
@@ -79,6 +242,7 @@ class Supplier(models.Model):
     class Meta:
         verbose_name = "Поставщик"
         verbose_name_plural = "Поставщики"
+        indexes = [live_index('name', name='supplier_live_name_idx')]
 
 
 class Customer(models.Model):
@@ -86,6 +250,8 @@ class Customer(models.Model):
     phone = models.CharField(max_length=20, blank=True, null=True)
     is_deleted = models.BooleanField(default=False)
 
+    objects = SoftDeleteManager()
+
     def delete(self, using=None, keep_parents=False):
         self.is_deleted = True
         self.save()
@@ -96,6 +262,7 @@ class Customer(models.Model):
     class Meta:
         verbose_name = "Клиент"
         verbose_name_plural = "Клиенты"
+        indexes = [live_index('phone', 'user', name='customer_live_phone_user_idx')]
 
 
 class Order(models.Model):
@@ -105,6 +272,8 @@ class Order(models.Model):
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     is_deleted = models.BooleanField(default=False)
 
+    objects = SoftDeleteManager()
+
     def delete(self, using=None, keep_parents=False):
         self.is_deleted = True
         self.save()
@@ -115,6 +284,39 @@ class Order(models.Model):
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
+        # Keyset pages order by (field, id), so the ordering indexes end with id
+        indexes = [
+            live_index('order_date', 'id', name='order_live_date_idx'),
+            live_index('total_amount', 'id', name='order_live_amount_idx'),
+            live_index('customer', 'order_date', 'id', name='order_live_customer_date_idx'),
+            live_index('customer', 'total_amount', 'id', name='order_live_customer_amount_idx'),
+            live_index('order_date', 'total_amount', 'id', name='order_live_date_amount_idx'),
+            live_index('total_amount', 'order_date', 'id', name='order_live_amount_date_idx'),
+        ]
+
+
+class OrderItem(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    # Снимок цены и скидки на момент заказа, заполняется api/pricing.py
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    discount_percent = models.IntegerField(default=0)
+    is_deleted = models.BooleanField(default=False)
+
+    objects = SoftDeleteManager()
+
+    def delete(self, using=None, keep_parents=False):
+        self.is_deleted = True
+        self.save()
+
+    def __str__(self):
+        return f"{self.product.name} x{self.quantity}"
+
+    class Meta:
+        verbose_name = "Позиция заказа"
+        verbose_name_plural = "Позиции заказа"
+        indexes = [live_index('order', name='orderitem_live_order_idx')]
 
 
 class Review(models.Model):
@@ -125,16 +327,39 @@ class Review(models.Model):
     review_date = models.DateTimeField(auto_now_add=True)
     is_deleted = models.BooleanField(default=False)
 
+    objects = ReviewManager()
+
     def delete(self, using=None, keep_parents=False):
         self.is_deleted = True
         self.save()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_rating_state = instance.rating_state()
+        return instance
+
+    def rating_state(self):
+        """(product_id, rating) this review contributes to the product aggregate, or None."""
+        if self.__dict__.get('is_deleted', False):
+            return None
+        return self.__dict__.get('product_id'), self.__dict__.get('rating')
+
     def __str__(self):
         return f"Отзыв от {self.customer.user.username} на {self.product.name}"
 
     class Meta:
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
+        indexes = [
+            live_index('review_date', 'id', name='review_live_date_idx'),
+            live_index('rating', 'id', name='review_live_rating_idx'),
+            live_index('customer', 'review_date', 'id', name='review_live_cust_date_idx'),
+            live_index('customer', 'rating', 'id', name='review_live_cust_rating_idx'),
+            live_index('product', 'review_date', 'id', name='review_live_product_date_idx'),
+            live_index('product', 'rating', 'id', name='review_live_product_rating_idx'),
+            live_index('rating', 'review_date', 'id', name='review_live_rating_date_idx'),
+        ]
 
 
 class Shipping(models.Model):
@@ -143,16 +368,26 @@ class Shipping(models.Model):
     shipped_date = models.DateTimeField(null=True, blank=True)
     is_deleted = models.BooleanField(default=False)
 
+    objects = SoftDeleteManager()
+
     def delete(self, using=None, keep_parents=False):
         self.is_deleted = True
         self.save()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so the post_save signal can detect the shipped transition without a SELECT
+        instance._loaded_shipped_date = instance.__dict__.get('shipped_date')
+        return instance
+
     def __str__(self):
-        return f"Доставка для Заказа #{self.order.id}"
+        return f"Доставка для Заказа #{self.order_id}"
 
     class Meta:
         verbose_name = "Доставка"
         verbose_name_plural = "Доставки"
+        indexes = [live_index('shipped_date', name='shipping_live_shipped_idx')]
 
 
 class Payment(models.Model):
@@ -161,16 +396,24 @@ class Payment(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     is_deleted = models.BooleanField(default=False)
 
+    objects = SoftDeleteManager()
+
     def delete(self, using=None, keep_parents=False):
         self.is_deleted = True
         self.save()
 
     def __str__(self):
-        return f"Оплата для Заказа #{self.order.id}"
+        return f"Оплата для Заказа #{self.order_id}"
 
     class Meta:
         verbose_name = "Оплата"
         verbose_name_plural = "Оплаты"
+        indexes = [
+            live_index('payment_date', 'id', name='payment_live_date_idx'),
+            live_index('amount', 'id', name='payment_live_amount_idx'),
+            live_index('payment_date', 'amount', 'id', name='payment_live_date_amount_idx'),
+            live_index('amount', 'payment_date', 'id', name='payment_live_amount_date_idx'),
+        ]
 
 
 class Staff(models.Model):
@@ -178,6 +421,8 @@ class Staff(models.Model):
     phone = models.CharField(max_length=20, blank=True, null=True)
     is_deleted = models.BooleanField(default=False)
 
+    objects = SoftDeleteManager()
+
     def delete(self, using=None, keep_parents=False):
         self.is_deleted = True
         self.save()
@@ -188,6 +433,7 @@ class Staff(models.Model):
     class Meta:
         verbose_name = "Сотрудник"
         verbose_name_plural = "Сотрудники"
+        indexes = [live_index('phone', 'user', name='staff_live_phone_user_idx')]
 
 
 class Promotion(models.Model):
@@ -197,6 +443,8 @@ class Promotion(models.Model):
     end_date = models.DateTimeField()
     is_deleted = models.BooleanField(default=False)
 
+    objects = PromotionManager()
+
     def delete(self, using=None, keep_parents=False):
         self.is_deleted = True
         self.save()
@@ -207,35 +455,143 @@ class Promotion(models.Model):
     class Meta:
         verbose_name = "Акция"
         verbose_name_plural = "Акции"
-        
+        indexes = [
+            models.Index(fields=['product', 'start_date', 'end_date', 'is_deleted']),
+            live_index('discount_percent', name='promotion_live_discount_idx'),
+            live_index('product', 'discount_percent', name='promotion_live_prod_disc_idx'),
+        ]
+
+
+class EmailOutbox(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Ожидает отправки'),
+        ('sending', 'Отправляется'),
+        ('sent', 'Отправлено'),
+        ('dead', 'Не доставлено'),
+    )
+    subject = models.CharField(max_length=255)
+    message = models.TextField()
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # Batch that last claimed the email (api/outbox.py)
+    claim = models.UUIDField(null=True, blank=True, editable=False)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)}"
+
+    class Meta:
+        verbose_name = "Исходящее письмо"
+        verbose_name_plural = "Исходящие письма"
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+
+class ExportJob(models.Model):
+    FORMAT_CHOICES = (
+        ('xlsx', 'Excel'),
+        ('csv', 'CSV'),
+        ('parquet', 'Parquet'),
+    )
+    STATUS_CHOICES = (
+        ('pending', 'В очереди'),
+        ('running', 'Выполняется'),
+        ('done', 'Готово'),
+        ('failed', 'Ошибка'),
+    )
+    model = models.CharField(max_length=100)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='xlsx')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    file = models.FileField(upload_to='exports/', blank=True)
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Экспорт {self.model} #{self.id}"
+
+    class Meta:
+        verbose_name = "Экспорт"
+        verbose_name_plural = "Экспорты"
+        permissions = [('export_data', "Может экспортировать данные")]
+
+
+class ExportJobChunk(models.Model):
+    """A slice of an export job's selection, so neither queuing nor the worker holds all primary keys at once."""
+    job = models.ForeignKey(ExportJob, on_delete=models.CASCADE, related_name='chunks')
+    # Primary keys of the selected rows, in export order
+    object_ids = models.JSONField()
+
+    def __str__(self):
+        return f"Часть экспорта #{self.job_id}"
+
+    class Meta:
+        verbose_name = "Часть экспорта"
+        verbose_name_plural = "Части экспорта"
+
+
+class ArchivedRecord(models.Model):
+    # Строка, перенесённая из рабочей таблицы командой archive (см. api/archive.py)
+    root = models.CharField(max_length=150, db_index=True)
+    model = models.CharField(max_length=100)
+    object_id = models.CharField(max_length=50)
+    position = models.PositiveIntegerField()
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id}"
+
+    class Meta:
+        verbose_name = "Архивная запись"
+        verbose_name_plural = "Архив"
+
+
+class RowCount(models.Model):
+    # Число неудалённых строк модели для пагинаторов (см. api/counting.py)
+    label = models.CharField(max_length=100, primary_key=True)
+    rows = models.BigIntegerField(default=0)
+    refreshed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.label}: {self.rows}"
+
+    class Meta:
+        verbose_name = "Счётчик строк"
+        verbose_name_plural = "Счётчики строк"
+
 
 logger = logging.getLogger(__name__)
 
-@receiver(post_save, sender=Order)
-def send_order_email(sender, instance, created, **kwargs):
-    if created:
-        subject = "Спасибо за ваш заказ!"
-        message = (
-            f"Уважаемый {instance.customer.user.username},\n\n"
-            f"Ваш заказ №{instance.id} успешно создан.\n"
-            f"Общая сумма заказа: {instance.total_amount}.\n\n"
-            "Спасибо за покупку!"
-        )
-        recipient_email = instance.customer.user.email
-        sender_email = settings.EMAIL_HOST_USER
 
-        if recipient_email and sender_email:
-            try:
-                send_mail(subject, message, sender_email, [recipient_email])
-                logger.info("Письмо было отправлено")
+def queue_email(subject, message, recipients):
+    """Stores the email in the outbox once the current transaction commits; see api/outbox.py."""
+    sender_email = settings.EMAIL_HOST_USER
+    recipients = [recipient for recipient in recipients if recipient]
+    if not (sender_email and recipients):
+        return
+    transaction.on_commit(lambda: EmailOutbox.objects.create(
+        subject=subject, message=message, from_email=sender_email, recipients=recipients,
+    ))
+
 
-            except Exception as e:
-                logger.error(f"Failed to send order email: {e}")
+@receiver(post_save, sender=Order)
+def send_order_email(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        # Built on commit: total_amount is priced on this instance after the row is saved
+        # (OrderAdmin.save_related, price_orders)
+        from .notifications import order_email
+        transaction.on_commit(lambda: queue_email(*order_email(instance), [instance.customer.user.email]))
 
 
 @receiver(post_save, sender=Review)
-def send_review_notification(sender, instance, created, **kwargs):
-    if created:
+def send_review_notification(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
         subject = f"Новый отзыв на продукт {instance.product.name}"
         message = (
             f"Уважаемый менеджер,\n\nНа продукт '{instance.product.name}' "
@@ -243,33 +599,22 @@ def send_review_notification(sender, instance, created, **kwargs):
             f"Рейтинг: {instance.rating}/5\nКомментарий: {instance.comment}\n\n"
             "Проверьте панель управления для получения более подробной информации."
         )
-        manager_email = getattr(settings, 'MANAGER_EMAIL', None)
-        sender_email = settings.EMAIL_HOST_USER
+        queue_email(subject, message, [getattr(settings, 'MANAGER_EMAIL', None)])
 
-        if manager_email and sender_email:
-            try:
-                send_mail(subject, message, sender_email, [manager_email])
-                logger.info("Письмо было отправлено")
 
-            except Exception as e:
-                logger.error(f"Failed to send review notification: {e}")
+@receiver(post_save, sender=Review)
+def update_product_rating(sender, instance, **kwargs):
+    from .ratings import apply_rating_change
+    state = instance.rating_state()
+    apply_rating_change(getattr(instance, '_loaded_rating_state', None), state)
+    instance._loaded_rating_state = state
 
 
 @receiver(post_save, sender=Shipping)
-def send_shipping_update_notification(sender, instance, **kwargs):
-    if instance.shipped_date:  # Проверяем, указана ли дата отправки
-        subject = f"Ваш заказ №{instance.order.id} доставлен"
-        message = (
-            f"Уважаемый {instance.order.customer.user.username},\n\n"
-            f"Ваш заказ №{instance.order.id} был успешно доставлен.\n\n"
-            "Спасибо, что выбрали наш магазин. Желаем вам приятных покупок!"
-        )
-        customer_email = instance.order.customer.user.email
-        sender_email = settings.EMAIL_HOST_USER
-
-        if customer_email and sender_email:
-            try:
-                send_mail(subject, message, sender_email, [customer_email])
-                logger.info("Письмо было отправлено")
-            except Exception as e:
-                logger.error(f"Failed to send shipping update notification: {e}")
\ No newline at end of file
+def send_shipping_update_notification(sender, instance, raw=False, **kwargs):
+    # Уведомляем только когда дата отправки впервые указана
+    if raw:
+        instance._loaded_shipped_date = instance.shipped_date
+        return
+    from .notifications import notify_if_shipped
+    notify_if_shipped(instance)
@@ -0,0 +1,111 @@
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order, Shipping, EmailOutbox
+
+CHUNK_SIZE = 1000
+
+_local = threading.local()
+
+
+def shipping_email(order):
+    subject = f"Ваш заказ №{order.id} доставлен"
+    message = (
+        f"Уважаемый {order.customer.user.username},\n\n"
+        f"Ваш заказ №{order.id} был успешно доставлен.\n\n"
+        "Спасибо, что выбрали наш магазин. Желаем вам приятных покупок!"
+    )
+    return subject, message
+
+
+def order_email(order):
+    subject = "Спасибо за ваш заказ!"
+    message = (
+        f"Уважаемый {order.customer.user.username},\n\n"
+        f"Ваш заказ №{order.id} успешно создан.\n"
+        f"Общая сумма заказа: {order.total_amount}.\n\n"
+        "Спасибо за покупку!"
+    )
+    return subject, message
+
+
+def dispatch_order_emails(order_ids, build_email, chunk_size=CHUNK_SIZE):
+    """Queues one email per order built by `build_email`, reading orders in chunks of `chunk_size`."""
+    sender_email = settings.EMAIL_HOST_USER
+    order_ids = sorted(set(order_ids))
+    if not (sender_email and order_ids):
+        return
+
+    emails = []
+    for start in range(0, len(order_ids), chunk_size):
+        orders = Order.objects.select_related('customer__user').filter(pk__in=order_ids[start:start + chunk_size])
+        for order in orders:
+            if order.customer.user.email:
+                subject, message = build_email(order)
+                emails.append(EmailOutbox(
+                    subject=subject, message=message, from_email=sender_email,
+                    recipients=[order.customer.user.email],
+                ))
+    transaction.on_commit(lambda: EmailOutbox.objects.bulk_create(emails, batch_size=chunk_size))
+
+
+def dispatch_shipping_notifications(order_ids, chunk_size=CHUNK_SIZE):
+    """Queues one shipping email per order."""
+    dispatch_order_emails(order_ids, shipping_email, chunk_size)
+
+
+def notify_shipped(order_id):
+    buffered = getattr(_local, 'order_ids', None)
+    if buffered is not None:
+        buffered.add(order_id)
+    else:
+        dispatch_shipping_notifications([order_id])
+
+
+def notify_if_shipped(shipping):
+    """Notifies about a saved shipping whose shipped_date was set for the first time."""
+    shipped_now = shipping.shipped_date and not getattr(shipping, '_loaded_shipped_date', None)
+    shipping._loaded_shipped_date = shipping.shipped_date
+    if shipped_now:
+        notify_shipped(shipping.order_id)
+
+
+@contextmanager
+def batch_shipping_notifications():
+    """
+    Collects shipping notifications sent while the block runs and dispatches
+    them together on exit, one email per order.
+    """
+    if getattr(_local, 'order_ids', None) is not None:
+        yield
+        return
+    _local.order_ids = set()
+    try:
+        yield
+        order_ids = _local.order_ids
+    finally:
+        _local.order_ids = None
+    dispatch_shipping_notifications(order_ids)
+
+
+def mark_shipped(queryset, shipped_date=None, chunk_size=CHUNK_SIZE):
+    """
+    Sets shipped_date on every unshipped shipping in `queryset` with chunked UPDATEs
+    and queues their notifications in one batch. Returns the number of shippings updated.
+    """
+    shipped_date = shipped_date or timezone.now()
+    with transaction.atomic():
+        pending = list(
+            queryset.filter(shipped_date__isnull=True).select_for_update().values_list('pk', 'order_id')
+        )
+        with batch_shipping_notifications():
+            for start in range(0, len(pending), chunk_size):
+                pks = [pk for pk, _ in pending[start:start + chunk_size]]
+                Shipping.objects.filter(pk__in=pks).update(shipped_date=shipped_date)
+            for _, order_id in pending:
+                notify_shipped(order_id)
+    return len(pending)
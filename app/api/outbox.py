@@ -0,0 +1,91 @@
+import logging
+import uuid
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 30
+# How long a claimed batch is reserved for its worker before it is due again
+LEASE_SECONDS = 300
+
+
+def claim_batch(batch_size, lease=LEASE_SECONDS):
+    """
+    Claims a batch of due emails with a conditional UPDATE, which works on every
+    backend (SQLite has no SKIP LOCKED): a row goes only to the worker whose UPDATE
+    still finds it due, and the claim moves next_attempt_at `lease` seconds ahead.
+    Emails left 'sending' by a worker that died are due again once the lease ends.
+    """
+    now = timezone.now()
+    due = Q(status__in=('pending', 'sending'), next_attempt_at__lte=now)
+    pks = list(EmailOutbox.objects.filter(due).order_by('next_attempt_at', 'id').values_list('pk', flat=True)[:batch_size])
+    if not pks:
+        return []
+    claim = uuid.uuid4()
+    EmailOutbox.objects.filter(due, pk__in=pks).update(
+        status='sending', claim=claim, attempts=F('attempts') + 1, next_attempt_at=now + timedelta(seconds=lease),
+    )
+    return list(EmailOutbox.objects.filter(pk__in=pks, claim=claim).order_by('id'))
+
+
+def record_failure(email, error, max_attempts, backoff):
+    email.last_error = str(error)
+    if email.attempts >= max_attempts:
+        email.status = 'dead'
+    else:
+        email.status = 'pending'
+        email.next_attempt_at = timezone.now() + timedelta(seconds=backoff * 2 ** (email.attempts - 1))
+
+
+def drain(batch_size=100, max_attempts=MAX_ATTEMPTS, backoff=BACKOFF_SECONDS):
+    """
+    Sends one batch of due emails over a single SMTP connection. Failed emails,
+    including a whole batch the connection could not be opened for, are retried
+    with exponential backoff and marked dead after `max_attempts`.
+    Returns (sent, failed).
+    """
+    sent = failed = 0
+    # The claim commits on its own, so other workers skip the batch while it is sent
+    batch = claim_batch(batch_size)
+    if not batch:
+        return sent, failed
+
+    mail_connection = get_connection(fail_silently=False)
+    try:
+        mail_connection.open()
+    except Exception as e:
+        logger.error(f"Failed to connect to the mail server: {e}")
+        failed = len(batch)
+        for email in batch:
+            record_failure(email, e, max_attempts, backoff)
+    else:
+        for email in batch:
+            try:
+                EmailMessage(
+                    email.subject, email.message, email.from_email, email.recipients,
+                    connection=mail_connection,
+                ).send()
+            except Exception as e:
+                logger.error(f"Failed to send email #{email.id}: {e}")
+                failed += 1
+                record_failure(email, e, max_attempts, backoff)
+            else:
+                sent += 1
+                email.status = 'sent'
+                email.sent_at = timezone.now()
+        try:
+            mail_connection.close()
+        except Exception as e:
+            # The messages were already handed over; only the QUIT failed
+            logger.warning(f"Failed to close the mail connection: {e}")
+
+    EmailOutbox.objects.bulk_update(batch, ['status', 'next_attempt_at', 'last_error', 'sent_at'])
+    logger.info(f"Outbox batch: {sent} sent, {failed} failed")
+    return sent, failed
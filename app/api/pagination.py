@@ -0,0 +1,182 @@
+import base64
+import json
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .counting import EstimatedCountPaginator, is_unfiltered
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seeks on (ordering field, id) instead of using OFFSET, and never runs COUNT(*).
+    The cursor is an opaque token holding the last row's ordering value and id.
+    """
+    page_size = PageNumberPagination.page_size
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = "Invalid cursor"
+
+    def get_ordering(self, queryset, view):
+        ordering = list(queryset.query.order_by) or list(getattr(view, 'ordering', None) or ['pk'])
+        field = ordering[0]
+        descending = field.startswith('-')
+        return field.lstrip('-'), descending
+
+    def encode_cursor(self, field, value, pk):
+        # isoformat() keeps the microseconds that DjangoJSONEncoder would truncate
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        raw = json.dumps([field, value, pk], cls=DjangoJSONEncoder)
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    def decode_cursor(self, request, field, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor_field, value, pk = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if cursor_field != field:
+                raise ValueError(cursor_field)
+            # 'pk' is an alias Options.get_field() does not resolve
+            model_field = model._meta.pk if field == 'pk' else model._meta.get_field(field)
+            return model_field.to_python(value), pk
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def seek(self, queryset, request, view):
+        """The queryset ordered by (field, pk) and positioned after the cursor."""
+        self.request = request
+        self.field, descending = self.get_ordering(queryset, view)
+        lookup = 'lt' if descending else 'gt'
+        prefix = '-' if descending else ''
+
+        queryset = queryset.order_by(f"{prefix}{self.field}", f"{prefix}pk")
+        cursor = self.decode_cursor(request, self.field, queryset.model)
+        if cursor is not None:
+            value, pk = cursor
+            queryset = queryset.filter(
+                Q(**{f"{self.field}__{lookup}": value}) | Q(**{self.field: value, f"pk__{lookup}": pk})
+            )
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.seek(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        rows = self.seek(queryset, request, view)
+        return self.set_page([obj async for obj in rows.aiterator(chunk_size=self.page_size + 1)])
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        cursor = self.encode_cursor(self.field, getattr(last, self.field), last.pk)
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class PageNumberOrKeysetPagination(PageNumberPagination):
+    """
+    Page number pagination by default. ViewSets with `keyset_pagination = True`
+    switch to KeysetPagination when the request passes `?pagination=keyset` or a cursor.
+    Unfiltered lists of large tables report an estimated count (api/counting.py)
+    and `count_estimated: true`, unless the request passes `?exact_count=1`.
+    """
+    mode_query_param = 'pagination'
+    exact_count_query_param = 'exact_count'
+    django_paginator_class = EstimatedCountPaginator
+
+    def use_keyset(self, request, view):
+        return getattr(view, 'keyset_pagination', False) and (
+            request.query_params.get(self.mode_query_param) == 'keyset'
+            or KeysetPagination.cursor_query_param in request.query_params
+        )
+
+    def get_django_paginator(self, queryset, page_size, request):
+        exact = request.query_params.get(self.exact_count_query_param) in ('1', 'true')
+        return self.django_paginator_class(queryset, page_size, exact=exact)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = KeysetPagination() if self.use_keyset(request, view) else None
+        if self.keyset is not None:
+            return self.keyset.paginate_queryset(queryset, request, view)
+
+        # PageNumberPagination.paginate_queryset() with the exact/estimated paginator
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = self.get_django_paginator(queryset, page_size, request)
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() with acount() and aiterator()."""
+        self.keyset = KeysetPagination() if self.use_keyset(request, view) else None
+        if self.keyset is not None:
+            return await self.keyset.apaginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = self.get_django_paginator(queryset, page_size, request)
+        # count is a cached_property, so Paginator never counts again
+        estimate = await sync_to_async(paginator.estimate)() if not paginator.exact and is_unfiltered(queryset) else None
+        paginator.count = estimate if estimate is not None else await queryset.acount()
+        paginator.estimated = estimate is not None
+        page_number = self.get_page_number(request, paginator)
+        try:
+            number = paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        bottom = (number - 1) * page_size
+        top = bottom + page_size
+        if top + paginator.orphans >= paginator.count:
+            top = paginator.count
+        rows = [obj async for obj in queryset[bottom:top].aiterator(chunk_size=page_size + paginator.orphans)]
+        self.page = paginator._get_page(rows, number, paginator)
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return rows
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        response = super().get_paginated_response(data)
+        if self.page.paginator.estimated:
+            response.data['count_estimated'] = True
+        return response
@@ -1,9 +1,9 @@
 from rest_framework import permissions
 
+# Checks only read request.user, so the async views (api/asyncviews.py) run them on the event loop
+
 class IsAdmin(permissions.BasePermission):
     def has_permission(self, request, view):
-        print(f"Authenticated: {request.user.is_authenticated}")  # Debugging authentication
-        print(f"User Role: {request.user.role}")  # Debugging user role
         return request.user.is_authenticated and request.user.role == 'admin'
 
 class IsAdminOrManager(permissions.BasePermission):
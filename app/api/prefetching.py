@@ -0,0 +1,96 @@
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+def _model_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except Exception:
+        return None
+
+
+def build_plan(serializer, model=None):
+    """
+    Walks the fields of a ModelSerializer and returns a plan describing the
+    relations it renders: (select_related paths, prefetch specs). A prefetch
+    spec is (lookup, related model, nested plan).
+    """
+    model = model or serializer.Meta.model
+    select, prefetch = [], []
+
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*' or '.' in field.source:
+            continue
+        model_field = _model_field(model, field.source)
+        if model_field is None or not model_field.is_relation:
+            continue
+        related_model = model_field.related_model
+
+        if isinstance(field, serializers.ListSerializer):
+            child = field.child
+            nested = build_plan(child, related_model) if isinstance(child, serializers.ModelSerializer) else ([], [])
+            prefetch.append((field.source, related_model, nested))
+        elif isinstance(field, serializers.ManyRelatedField):
+            # An expanded NestedRelatedField renders through a serializer, which needs its own plan
+            child = field.child_relation
+            nested = build_plan(child.nested_serializer, related_model) if getattr(child, 'expanded', False) else ([], [])
+            prefetch.append((field.source, related_model, nested))
+        elif isinstance(field, serializers.ModelSerializer) or getattr(field, 'expanded', False):
+            if model_field.many_to_many or model_field.one_to_many:
+                continue
+            select.append(field.source)
+            nested_select, nested_prefetch = build_plan(getattr(field, 'nested_serializer', field), related_model)
+            select.extend(f"{field.source}__{path}" for path in nested_select)
+            prefetch.extend(
+                (f"{field.source}__{lookup}", related, plan)
+                for lookup, related, plan in nested_prefetch
+            )
+
+    return select, prefetch
+
+
+def apply_plan(queryset, plan):
+    select, prefetch = plan
+    if select:
+        queryset = queryset.select_related(*select)
+    lookups = [
+        Prefetch(lookup, queryset=apply_plan(related._default_manager.all(), nested))
+        for lookup, related, nested in prefetch
+    ]
+    if lookups:
+        queryset = queryset.prefetch_related(*lookups)
+    return queryset
+
+
+MAX_PLANS = 512
+_plans = {}
+
+
+def eager_load(queryset, serializer):
+    """Applies select_related/prefetch_related matching the serializer's shape."""
+    key = serializer.shape_key() if hasattr(serializer, 'shape_key') else type(serializer)
+    if key not in _plans:
+        if len(_plans) >= MAX_PLANS:
+            _plans.clear()  # ?fields=/?expand= values are client-controlled
+        _plans[key] = build_plan(serializer)
+    return apply_plan(queryset, _plans[key])
+
+
+class EagerLoadingMixin:
+    """ViewSet mixin: loads every relation the serializer renders in a fixed number of queries."""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if not issubclass(serializer_class, serializers.ModelSerializer):
+            return queryset
+        return eager_load(queryset, serializer_class(context=self.get_serializer_context()))
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        # Re-read the saved object with eager loading, so rendering it runs a fixed number of queries
+        serializer.instance = self.get_queryset().get(pk=serializer.instance.pk)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        serializer.instance = self.get_queryset().get(pk=serializer.instance.pk)
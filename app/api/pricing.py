@@ -0,0 +1,128 @@
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+
+from .counting import row_counter
+from .models import Product, Order, OrderItem, Promotion
+
+CENT = Decimal('0.01')
+BATCH_SIZE = 1000
+
+
+def line_total(unit_price, quantity, discount_percent):
+    return (unit_price * quantity * (100 - discount_percent) / 100).quantize(CENT, ROUND_HALF_UP)
+
+
+def load_promotions(product_ids, start, end):
+    """Returns {product_id: [(start_date, end_date, discount_percent)]} for promotions overlapping [start, end]."""
+    promotions = defaultdict(list)
+    rows = Promotion.objects.filter(
+        product_id__in=product_ids, is_deleted=False, start_date__lte=end, end_date__gte=start,
+    ).values_list('product_id', 'start_date', 'end_date', 'discount_percent')
+    for product_id, start_date, end_date, discount_percent in rows:
+        promotions[product_id].append((start_date, end_date, discount_percent))
+    return promotions
+
+
+def discount_at(promotions, product_id, moment):
+    return max(
+        (discount for start, end, discount in promotions.get(product_id, ()) if start <= moment <= end),
+        default=0,
+    )
+
+
+def _price_batch(orders):
+    orders_by_id = {order.pk: order for order in orders}
+    items = list(OrderItem.objects.filter(order_id__in=orders_by_id, is_deleted=False))
+
+    unpriced = {item.product_id for item in items if item.unit_price is None}
+    prices, promotions = {}, {}
+    if unpriced:
+        prices = dict(Product.objects.filter(pk__in=unpriced).values_list('pk', 'price'))
+        dates = [order.order_date for order in orders]
+        promotions = load_promotions(unpriced, min(dates), max(dates))
+
+    totals = {order_id: Decimal('0.00') for order_id in orders_by_id}
+    snapshotted = []
+    for item in items:
+        if item.unit_price is None:
+            item.unit_price = prices[item.product_id]
+            item.discount_percent = discount_at(promotions, item.product_id, orders_by_id[item.order_id].order_date)
+            snapshotted.append(item)
+        totals[item.order_id] += line_total(item.unit_price, item.quantity, item.discount_percent)
+
+    OrderItem.objects.bulk_update(snapshotted, ['unit_price', 'discount_percent'])
+    for order in orders:
+        order.total_amount = totals[order.pk]
+    Order.objects.bulk_update(orders, ['total_amount'])
+
+
+def price_orders(orders, batch_size=BATCH_SIZE):
+    """
+    Snapshots the current price and the promotion valid at order_date into every
+    unpriced item, and recomputes total_amount from the snapshots. Runs a fixed
+    number of queries per `batch_size` orders.
+    """
+    orders = list(orders)
+    with transaction.atomic():
+        for start in range(0, len(orders), batch_size):
+            _price_batch(orders[start:start + batch_size])
+    return orders
+
+
+def create_orders(specs, batch_size=BATCH_SIZE):
+    """
+    Bulk-creates and prices orders from (customer, [(product, quantity), ...]) pairs.
+    Products may be instances or ids. post_save signals (and order emails) are not
+    sent; the Order row counter is updated here instead.
+    """
+    specs = list(specs)
+    with transaction.atomic():
+        orders = Order.objects.bulk_create([Order(customer=customer) for customer, _ in specs], batch_size)
+        row_counter.add(Order, len(orders))
+        items, links = [], set()
+        for order, (_, lines) in zip(orders, specs):
+            for product, quantity in lines:
+                product_id = getattr(product, 'pk', product)
+                items.append(OrderItem(order=order, product_id=product_id, quantity=quantity))
+                links.add((order.pk, product_id))
+        OrderItem.objects.bulk_create(items, batch_size)
+        Order.products.through.objects.bulk_create(
+            [Order.products.through(order_id=order_id, product_id=product_id) for order_id, product_id in links],
+            batch_size,
+        )
+        price_orders(orders, batch_size)
+    return orders
+
+
+def sync_order_items(orders, batch_size=BATCH_SIZE):
+    """
+    Brings the items of saved orders in line with their products after the
+    products changed: items of removed products are soft-deleted, added products
+    get one unpriced item, then the orders are repriced. Items of kept products
+    keep their price snapshot.
+    """
+    orders = list(orders)
+    if not orders:
+        return orders
+    order_ids = [order.pk for order in orders]
+    with transaction.atomic():
+        wanted = defaultdict(set)
+        for order_id, product_id in Order.products.through.objects.filter(order_id__in=order_ids).values_list('order_id', 'product_id'):
+            wanted[order_id].add(product_id)
+        present, stale = defaultdict(set), []
+        for item_id, order_id, product_id in OrderItem.objects.filter(order_id__in=order_ids).values_list('pk', 'order_id', 'product_id'):
+            if product_id in wanted[order_id]:
+                present[order_id].add(product_id)
+            else:
+                stale.append(item_id)
+        if stale:
+            OrderItem.objects.filter(pk__in=stale).delete()
+        OrderItem.objects.bulk_create(
+            [OrderItem(order_id=order_id, product_id=product_id, quantity=1)
+             for order_id in order_ids for product_id in wanted[order_id] - present[order_id]],
+            batch_size,
+        )
+        price_orders(orders, batch_size)
+    return orders
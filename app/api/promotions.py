@@ -0,0 +1,87 @@
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db.models import Min
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Promotion
+
+# Other processes only learn about promotion changes through this expiry
+MAX_AGE = timedelta(seconds=60)
+
+
+class ActivePromotionCache:
+    """
+    In-process map of product id -> discount of the promotions active right now.
+    It reloads (two queries) when a promotion changes in this process, when the
+    next promotion starts or ends, or after MAX_AGE. `state()` identifies the
+    loaded discounts, so response caches can key on them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.discounts = {}
+        self.valid_until = None
+        self.marker = None
+        self.changed_at = time.time()
+
+    def invalidate(self):
+        with self.lock:
+            self.valid_until = None
+
+    def load(self, now):
+        discounts = {}
+        next_boundary = now + MAX_AGE
+        active = Promotion.objects.filter(is_deleted=False, start_date__lte=now, end_date__gte=now)
+        for product_id, discount, end_date in active.values_list('product_id', 'discount_percent', 'end_date'):
+            discounts[product_id] = max(discounts.get(product_id, 0), discount)
+            next_boundary = min(next_boundary, end_date + timedelta(microseconds=1))
+        next_start = Promotion.objects.filter(is_deleted=False, start_date__gt=now).aggregate(
+            next_start=Min('start_date')
+        )['next_start']
+        if next_start is not None:
+            next_boundary = min(next_boundary, next_start)
+        self.discounts, self.valid_until = discounts, next_boundary
+        # Same discounts give the same marker in every process; ints hash deterministically
+        marker = hash(frozenset(discounts.items()))
+        if marker != self.marker:
+            self.marker, self.changed_at = marker, time.time()
+
+    def get(self, product_id, now=None):
+        now = now or timezone.now()
+        with self.lock:
+            if self.valid_until is None or now >= self.valid_until:
+                self.load(now)
+            return self.discounts.get(product_id, 0)
+
+    def state(self, now=None):
+        """(marker of the active discounts, time.time() they last changed), reloading like get()."""
+        now = now or timezone.now()
+        with self.lock:
+            if self.valid_until is None or now >= self.valid_until:
+                self.load(now)
+            return self.marker, self.changed_at
+
+
+active_promotions = ActivePromotionCache()
+
+
+def active_discount(product_id, now=None):
+    return active_promotions.get(product_id, now)
+
+
+def effective_price(product, now=None):
+    discount = active_discount(product.pk, now)
+    if not discount:
+        return product.price
+    return (product.price * (100 - discount) / 100).quantize(Decimal('0.01'), ROUND_HALF_UP)
+
+
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+def invalidate_active_promotions(sender, **kwargs):
+    active_promotions.invalidate()
@@ -0,0 +1,55 @@
+from collections import defaultdict
+
+from django.db.models import Count, F, FloatField, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .models import Product, Review
+
+
+def adjust_product(product_id, count_delta, sum_delta):
+    """Applies a review delta with a single UPDATE using F() expressions, so concurrent reviews don't race."""
+    count = F('review_count') + count_delta
+    total = F('review_sum') + sum_delta
+    Product.objects.filter(pk=product_id).update(
+        review_count=count,
+        review_sum=total,
+        rating=Coalesce(Cast(total, FloatField()) / NullIf(count, 0), Value(0.0)),
+    )
+
+
+def apply_rating_change(old, new):
+    """
+    Moves a review's contribution from `old` to `new`, both (product_id, rating)
+    or None when the review doesn't count (not yet saved or soft-deleted).
+    """
+    if old == new:
+        return
+    deltas = defaultdict(lambda: [0, 0])
+    if old is not None:
+        deltas[old[0]][0] -= 1
+        deltas[old[0]][1] -= old[1]
+    if new is not None:
+        deltas[new[0]][0] += 1
+        deltas[new[0]][1] += new[1]
+    for product_id, (count_delta, sum_delta) in deltas.items():
+        if count_delta or sum_delta:
+            adjust_product(product_id, count_delta, sum_delta)
+
+
+def rebuild_ratings(batch_size=1000):
+    """Recomputes every product aggregate from one grouped query; returns the number of products fixed."""
+    totals = {
+        row['product']: (row['count'], row['total'])
+        for row in Review.objects.filter(is_deleted=False).values('product').annotate(
+            count=Count('id'), total=Sum('rating')
+        ).order_by()
+    }
+    changed = []
+    for product in Product.objects.only('id', 'review_count', 'review_sum', 'rating').iterator(chunk_size=batch_size):
+        count, total = totals.get(product.id, (0, 0))
+        rating = total / count if count else 0
+        if (product.review_count, product.review_sum, product.rating) != (count, total, rating):
+            product.review_count, product.review_sum, product.rating = count, total, rating
+            changed.append(product)
+    Product.objects.bulk_update(changed, ['review_count', 'review_sum', 'rating'], batch_size=batch_size)
+    return len(changed)
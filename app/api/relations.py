@@ -0,0 +1,189 @@
+from collections import defaultdict
+from functools import cached_property
+
+from django.core.exceptions import ObjectDoesNotExist, ValidationError as DjangoValidationError
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+def parse_paths(value):
+    return frozenset(path.strip() for path in (value or '').split(',') if path.strip())
+
+
+def owner_of(field):
+    """(serializer declaring `field`, its name there), looking through list wrappers."""
+    parent, name = field.parent, field.field_name
+    if isinstance(parent, (serializers.ListSerializer, serializers.ManyRelatedField)):
+        parent, name = parent.parent, parent.field_name
+    return parent, name
+
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    Renders only the fields listed in `?fields=` (dotted for nested objects, e.g.
+    `fields=id,categories.name`). NestedRelatedFields render as primary keys unless
+    `?expand=` names them (e.g. `expand=order.customer`) or `?fields=` selects inside them.
+    """
+
+    @property
+    def prefix(self):
+        """Dotted path of this serializer in the response, e.g. "order.customer."."""
+        owner, name = owner_of(self)
+        if isinstance(owner, DynamicFieldsModelSerializer):
+            return f"{owner.prefix}{name}."
+        return getattr(self, '_prefix', '')
+
+    def requested(self, param):
+        request = self.context.get('request')
+        return parse_paths(request.query_params.get(param)) if request is not None else frozenset()
+
+    def shape_key(self):
+        """What the rendered shape depends on; used to cache eager loading plans."""
+        request = self.context.get('request')
+        safe = request is not None and request.method in SAFE_METHODS
+        return type(self), self.requested('fields') if safe else None, self.requested('expand')
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        # Writes validate every field, so sparse fieldsets only apply to reads
+        if request is None or request.method not in SAFE_METHODS:
+            return fields
+        prefix = self.prefix
+        selected = {path[len(prefix):].split('.')[0] for path in self.requested('fields') if path.startswith(prefix)}
+        if not selected:
+            return fields
+        return {name: field for name, field in fields.items() if name in selected}
+
+    def is_expanded(self, name):
+        path = f"{self.prefix}{name}"
+        return path in self.requested('expand') or any(
+            requested.startswith(f"{path}.") for requested in self.requested('expand') | self.requested('fields')
+        )
+
+
+class NestedRelatedField(serializers.RelatedField):
+    """
+    Renders the related object's id, or the object itself with `serializer` when the
+    request expands it. Accepts either the id or a nested object carrying the id.
+    Ids are looked up in the rows load_related() fetched with one in_bulk() per
+    model; without them each id costs a query.
+    """
+    default_error_messages = {
+        'required': serializers.Field.default_error_messages['required'],
+        'does_not_exist': "Объект с id={pk_value} не найден.",
+        'incorrect_type': "Ожидается id или объект с полем id, получено {data_type}.",
+    }
+
+    def __init__(self, serializer, **kwargs):
+        self.serializer = serializer
+        if not kwargs.get('read_only'):
+            kwargs.setdefault('queryset', serializer.Meta.model._default_manager.all())
+        super().__init__(**kwargs)
+
+    @cached_property
+    def expanded(self):
+        owner, name = owner_of(self)
+        return isinstance(owner, DynamicFieldsModelSerializer) and owner.is_expanded(name)
+
+    @cached_property
+    def nested_serializer(self):
+        """`serializer` placed at this field's path, so it applies the request's fields/expand."""
+        owner, name = owner_of(self)
+        self.serializer._prefix = f"{owner.prefix}{name}."
+        self.serializer._context = self.context
+        return self.serializer
+
+    def use_pk_only_optimization(self):
+        # Unexpanded foreign keys render from the *_id column without loading the row
+        return not self.expanded
+
+    def pk_of(self, data):
+        return data.get('id') if isinstance(data, dict) else data
+
+    def to_internal_value(self, data):
+        model = self.get_queryset().model
+        try:
+            if isinstance(self.pk_of(data), (bool, dict, list)):
+                raise TypeError
+            pk = model._meta.pk.to_python(self.pk_of(data))
+        except (DjangoValidationError, TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk is None:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+        loaded = self.context.get('related_objects', {}).get(model)
+        if loaded is None:
+            try:
+                return self.get_queryset().get(pk=pk)
+            except ObjectDoesNotExist:
+                self.fail('does_not_exist', pk_value=pk)
+        if pk not in loaded:
+            self.fail('does_not_exist', pk_value=pk)
+        return loaded[pk]
+
+    def to_representation(self, value):
+        if self.expanded:
+            return self.nested_serializer.to_representation(value)
+        return value.pk
+
+    def get_choices(self, cutoff=None):
+        # Keyed by pk: the nested representation is a dict and cannot be a choice key
+        queryset = self.get_queryset()
+        if cutoff is not None:
+            queryset = queryset[:cutoff]
+        return {item.pk: self.display_value(item) for item in queryset}
+
+
+def related_fields(serializer):
+    for name, field in serializer.fields.items():
+        relation = getattr(field, 'child_relation', field)
+        if not field.read_only and isinstance(relation, NestedRelatedField):
+            yield name, relation
+
+
+def nested_serializers(serializer):
+    for name, field in serializer.fields.items():
+        if not field.read_only and isinstance(field, serializers.ListSerializer) and isinstance(field.child, serializers.ModelSerializer):
+            yield name, field.child
+
+
+def collect_ids(serializer, items, ids, querysets):
+    for name, relation in related_fields(serializer):
+        queryset = relation.get_queryset()
+        model = queryset.model
+        querysets[model] = queryset
+        for item in items:
+            value = item.get(name) if isinstance(item, dict) else None
+            for data in value if isinstance(value, list) else [value]:
+                try:
+                    ids[model].add(model._meta.pk.to_python(relation.pk_of(data)))
+                except (DjangoValidationError, TypeError, ValueError):
+                    pass
+    # Writable nested lists (e.g. order items) reference rows too
+    for name, child in nested_serializers(serializer):
+        nested = [
+            data for item in items if isinstance(item, dict) and isinstance(item.get(name), list)
+            for data in item[name]
+        ]
+        collect_ids(child, nested, ids, querysets)
+
+
+def load_related(serializer, items):
+    """Returns {model: {pk: instance}} for every row the items reference, with one in_bulk() per model."""
+    ids, querysets = defaultdict(set), {}
+    collect_ids(serializer, items, ids, querysets)
+    return {
+        model: queryset.in_bulk([pk for pk in ids[model] if pk is not None])
+        for model, queryset in querysets.items()
+    }
+
+
+class NestedWritableModelSerializer(DynamicFieldsModelSerializer):
+    """ModelSerializer that resolves all ids referenced by its NestedRelatedFields up front."""
+
+    def to_internal_value(self, data):
+        # A list serializer loads the rows for all items itself
+        if self.parent is None and 'related_objects' not in self.context:
+            self.context['related_objects'] = load_related(self, [data])
+        return super().to_internal_value(data)
@@ -0,0 +1,60 @@
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# DRF's encoder formats datetimes ("...Z"), Decimals, lazy strings and querysets;
+# orjson calls it for every type it does not serialize itself
+_encoder = JSONEncoder()
+ORJSON_OPTIONS = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+
+def dumps(data):
+    """Compact UTF-8 JSON bytes, identical to DRF's JSONRenderer output for finite values."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, default=_encoder.default, option=ORJSON_OPTIONS)
+        except TypeError:
+            pass  # e.g. integers above 64 bits
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode()
+
+
+def reject_constant(name):
+    raise ValueError(f"Out of range float values are not JSON compliant: {name}")
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)  # rejects NaN and Infinity like DRF's strict parser
+    return json.loads(data, parse_constant=reject_constant)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer on orjson when it is installed; indented output still goes through stdlib json."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping as JSONRenderer: U+2028/U+2029 are not valid inside JavaScript strings
+        return dumps(data).replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            return loads(stream.read().decode(encoding))
+        except ValueError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
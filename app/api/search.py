@@ -0,0 +1,377 @@
+import re
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+from django.db.models.signals import post_delete, post_migrate, post_save
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .models import Category, Product
+
+BATCH_SIZE = 1000
+MAX_TERMS = 8
+FACETS = 20
+# Counts and facets stop after this many matches; the response flags it in `count_is_capped`
+MAX_MATCHES = 10000
+
+PRODUCT = Product._meta.db_table
+PRODUCT_CATEGORIES = Product.categories.through._meta.db_table
+PRODUCT_COLUMN = Product.categories.field.m2m_column_name()
+CATEGORY_COLUMN = Product.categories.field.m2m_reverse_name()
+
+
+def terms(query):
+    """
+    Words of a user query, lowercased; everything else (operators, quotes) is dropped.
+    Every word must match, the last one as a prefix (the user may still be typing it).
+    """
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+def is_prefix(words):
+    # One-letter prefixes would match most of the catalog
+    return len(words[-1]) >= 2
+
+
+def chunks(values, size=BATCH_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class FullTextBackend:
+    """
+    A full-text table with one row per live product, keyed by product id. Subclasses
+    give the DDL, the document expression and the match/rank SQL; the queries join
+    api_product so rows of products soft-deleted by a bulk UPDATE never match.
+    """
+    table = None
+    key = None
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, sql, params=()):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall() if cursor.description else None
+
+    def ensure_schema(self):
+        for statement in self.schema:
+            self.execute(statement)
+
+    def remove(self, ids):
+        for chunk in chunks(ids):
+            self.execute(f"DELETE FROM {self.table} WHERE {self.key} IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+    def index(self, ids):
+        """Re-reads the given products into the index with INSERT ... SELECT, one per batch."""
+        for chunk in chunks(ids):
+            self.remove(chunk)
+            self.execute(
+                f"INSERT INTO {self.table} ({self.columns}) SELECT {self.document} FROM {PRODUCT} "
+                f"WHERE id IN ({', '.join(['%s'] * len(chunk))}) AND is_deleted = %s",
+                [*chunk, False],
+            )
+
+    def rebuild(self):
+        # Recreated rather than emptied, so schema changes (e.g. prefix sizes) apply
+        self.execute(f"DROP TABLE IF EXISTS {self.table}")
+        self.ensure_schema()
+        self.execute(
+            f"INSERT INTO {self.table} ({self.columns}) SELECT {self.document} FROM {PRODUCT} WHERE is_deleted = %s",
+            [False],
+        )
+        self.optimize()
+        return self.execute(f"SELECT COUNT(*) FROM {self.table}")[0][0]
+
+    def optimize(self):
+        pass
+
+    def matches(self, words, category=None, scored=False):
+        """
+        SQL selecting the live products matching every word (and `category`), with
+        their `score` (lower is better) when `scored`.
+        """
+        match, params = self.match(words)
+        score, score_params = self.score(words) if scored else ('NULL', [])
+        sql = (
+            f"SELECT {self.table}.{self.key} AS id, {score} AS score FROM {self.table} "
+            f"JOIN {PRODUCT} p ON p.id = {self.table}.{self.key} WHERE {match} AND p.is_deleted = %s"
+        )
+        params = [*score_params, *params, False]
+        if category is not None:
+            sql += (
+                f" AND EXISTS (SELECT 1 FROM {PRODUCT_CATEGORIES} pc"
+                f" WHERE pc.{PRODUCT_COLUMN} = p.id AND pc.{CATEGORY_COLUMN} = %s)"
+            )
+            params.append(category)
+        return sql, params
+
+    def ranked_ids(self, words, category, offset, limit):
+        """One page of the whole match set by score; LIMIT keeps the sort to a top-N heap."""
+        sql, params = self.matches(words, category, scored=True)
+        rows = self.execute(f"SELECT id FROM ({sql}) c ORDER BY score, id DESC LIMIT %s OFFSET %s", [*params, limit, offset])
+        return [row[0] for row in rows]
+
+    def count(self, words, category=None):
+        """Matching products, counted up to MAX_MATCHES + 1 so the caller can tell the cap was hit."""
+        sql, params = self.matches(words, category)
+        return self.execute(f"SELECT COUNT(*) FROM ({sql} LIMIT %s) c", [*params, MAX_MATCHES + 1])[0][0]
+
+    def facets(self, words, limit=FACETS):
+        """
+        [(category id, matching products)] for the categories with the most matches,
+        among the first MAX_MATCHES matches (all of them unless the count is capped).
+        """
+        sql, params = self.matches(words)
+        return self.execute(
+            f"SELECT pc.{CATEGORY_COLUMN}, COUNT(*) FROM ({sql} LIMIT %s) c "
+            f"JOIN {PRODUCT_CATEGORIES} pc ON pc.{PRODUCT_COLUMN} = c.id "
+            f"GROUP BY pc.{CATEGORY_COLUMN} ORDER BY COUNT(*) DESC, pc.{CATEGORY_COLUMN} LIMIT %s",
+            [*params, MAX_MATCHES, limit],
+        )
+
+
+class SQLiteBackend(FullTextBackend):
+    """FTS5 table with the name and description; bm25 ranks name matches ten times higher."""
+    table = 'api_product_fts'
+    key = 'rowid'
+    columns = 'rowid, name, description'
+    document = 'id, name, description'
+    # Prefix indexes for 2-6 letters keep "word*" from merging every matching term
+    # (about twice the index size; a 4-letter prefix at 1M products: 70 ms -> 1 ms)
+    schema = [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+        "name, description, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4 5 6')",
+    ]
+
+    def match(self, words):
+        return f"{self.table} MATCH %s", [' '.join(f'"{word}"' for word in words) + ('*' if is_prefix(words) else '')]
+
+    def score(self, words):
+        return f"bm25({self.table}, 10.0, 1.0)", []
+
+    def optimize(self):
+        self.execute(f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')")
+
+
+class PostgresBackend(FullTextBackend):
+    """tsvector table with a GIN index; names are weighted A and descriptions B."""
+    table = 'api_product_search'
+    key = 'product_id'
+    columns = 'product_id, document'
+
+    @property
+    def config(self):
+        return getattr(settings, 'API_SEARCH_CONFIG', 'russian')
+
+    @property
+    def document(self):
+        return (
+            f"id, setweight(to_tsvector('{self.config}', name), 'A')"
+            f" || setweight(to_tsvector('{self.config}', description), 'B')"
+        )
+
+    @property
+    def schema(self):
+        return [
+            f"CREATE TABLE IF NOT EXISTS {self.table} (product_id bigint PRIMARY KEY, document tsvector NOT NULL)",
+            f"CREATE INDEX IF NOT EXISTS {self.table}_document_idx ON {self.table} USING gin (document)",
+        ]
+
+    def tsquery(self, words):
+        return ' & '.join(words) + (':*' if is_prefix(words) else '')
+
+    def match(self, words):
+        return f"{self.table}.document @@ to_tsquery(%s, %s)", [self.config, self.tsquery(words)]
+
+    def score(self, words):
+        return f"-ts_rank({self.table}.document, to_tsquery(%s, %s))", [self.config, self.tsquery(words)]
+
+
+class FallbackBackend:
+    """Other databases: icontains over name and description, name matches first. Not indexed."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def ensure_schema(self):
+        pass
+
+    def index(self, ids):
+        pass
+
+    def remove(self, ids):
+        pass
+
+    def rebuild(self):
+        return Product.objects.count()
+
+    def matching(self, words, category=None):
+        queryset = Product.objects.using(self.connection.alias)
+        for word in words:
+            queryset = queryset.filter(Q(name__icontains=word) | Q(description__icontains=word))
+        if category is not None:
+            queryset = queryset.filter(categories=category)
+        return queryset
+
+    def ranked_ids(self, words, category, offset, limit):
+        in_name = Q()
+        for word in words:
+            in_name &= Q(name__icontains=word)
+        rank = Case(When(in_name, then=Value(0)), default=Value(1), output_field=IntegerField())
+        queryset = self.matching(words, category).annotate(search_rank=rank).order_by('search_rank', 'pk')
+        return list(queryset.values_list('pk', flat=True)[offset:offset + limit])
+
+    def count(self, words, category=None):
+        return self.matching(words, category)[:MAX_MATCHES + 1].count()
+
+    def facets(self, words, limit=FACETS):
+        through = Product.categories.through.objects.using(self.connection.alias)
+        rows = (
+            through.filter(product__in=self.matching(words)).values('category')
+            .annotate(count=Count('pk')).order_by('-count', 'category')
+        )
+        return [(row['category'], row['count']) for row in rows[:limit]]
+
+
+def has_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+_backends = {}
+
+
+def get_backend(using=None):
+    using = using or router.db_for_write(Product)
+    if using not in _backends:
+        connection = connections[using]
+        if connection.vendor == 'postgresql':
+            _backends[using] = PostgresBackend(connection)
+        elif connection.vendor == 'sqlite' and has_fts5(connection):
+            _backends[using] = SQLiteBackend(connection)
+        else:
+            _backends[using] = FallbackBackend(connection)
+    return _backends[using]
+
+
+def index_products(ids, using=None):
+    get_backend(using).index(ids)
+
+
+def remove_products(ids, using=None):
+    get_backend(using).remove(ids)
+
+
+def rebuild_index(using=None):
+    """Recreates the index from every live product; returns the number of indexed products."""
+    return get_backend(using).rebuild()
+
+
+class SearchResults:
+    """
+    Ranked products matching a query. Supports count() and slicing, so Django's
+    Paginator pages it like a queryset: each page is one ranked id query plus
+    `queryset.in_bulk()` (which keeps the queryset's eager loading). Ranking covers
+    every match, but count() stops at MAX_MATCHES (`is_capped` is then True), so
+    pages only reach the first MAX_MATCHES ranked products.
+    """
+
+    def __init__(self, words, queryset, category=None):
+        self.words = words
+        self.queryset = queryset
+        self.category = category
+        self.backend = get_backend(queryset.db)
+        self._count = None
+        self.is_capped = False
+
+    def count(self):
+        if self._count is None:
+            count = self.backend.count(self.words, self.category)
+            self.is_capped = count > MAX_MATCHES
+            self._count = min(count, MAX_MATCHES)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop if index.stop is not None else self.count()
+        ids = self.backend.ranked_ids(self.words, self.category, start, max(stop - start, 0))
+        rows = self.queryset.in_bulk(ids)
+        return [rows[pk] for pk in ids if pk in rows]
+
+
+def category_facets(words, using=None):
+    """[{'id', 'name', 'count'}] of live categories among the products matching `words`."""
+    counts = get_backend(using).facets(words)
+    names = Category.objects.in_bulk([category for category, _ in counts])
+    return [
+        {'id': category, 'name': names[category].name, 'count': count}
+        for category, count in counts if category in names
+    ]
+
+
+class SearchMixin:
+    """
+    ViewSet mixin adding GET `<prefix>/search/?q=...[&category=<id>]`: products ranked
+    by relevance, paginated like the list, with per-category counts in `facets`.
+    `count_is_capped` is true when more than MAX_MATCHES products match; `count` and
+    the facet counts are then lower bounds.
+    """
+    compiled_actions = ('list', 'retrieve', 'search')
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request, *args, **kwargs):
+        words = terms(request.query_params.get('q'))
+        if not words:
+            raise ValidationError({'q': ["Укажите поисковый запрос."]})
+        category = request.query_params.get('category')
+        if category is not None:
+            try:
+                category = int(category)
+            except ValueError:
+                raise ValidationError({'category': ["Ожидается id категории."]})
+
+        queryset = self.get_queryset()
+        results = SearchResults(words, queryset, category)
+        facets = {'categories': category_facets(words, queryset.db)}
+        page = self.paginate_queryset(results)
+        if page is None:
+            data = self.get_serializer(results[:], many=True).data
+            return Response({'results': data, 'count_is_capped': results.is_capped, 'facets': facets})
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        response.data['count_is_capped'] = results.is_capped
+        response.data['facets'] = facets
+        return response
+
+
+def on_product_save(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    if instance.is_deleted:
+        remove_products([instance.pk], using)
+    else:
+        index_products([instance.pk], using)
+
+
+def on_product_delete(sender, instance, using=None, **kwargs):
+    remove_products([instance.pk], using)
+
+
+def create_search_schema(sender, using=None, **kwargs):
+    # The index is not a model, so it is created after every migrate (IF NOT EXISTS)
+    if sender.label == Product._meta.app_label:
+        get_backend(using).ensure_schema()
+
+
+post_save.connect(on_product_save, sender=Product, dispatch_uid='api-search-save')
+post_delete.connect(on_product_delete, sender=Product, dispatch_uid='api-search-delete')
+post_migrate.connect(create_search_schema, dispatch_uid='api-search-schema')
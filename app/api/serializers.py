@@ -1,14 +1,21 @@
 # serializers.py
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
 from django.contrib.auth import get_user_model
+from django.db import transaction
 
-from .models import Category, Product, Supplier, Customer, Order, Review, Shipping, Payment, Staff, Promotion
+from .bulk import OrderListSerializer, ProductListSerializer, ShippingListSerializer
+from .notifications import dispatch_order_emails, order_email
+from .pricing import create_orders, sync_order_items
+from .relations import DynamicFieldsModelSerializer, NestedRelatedField, NestedWritableModelSerializer
+from .promotions import effective_price
+from .models import Category, Product, Supplier, Customer, Order, OrderItem, Review, Shipping, Payment, Staff, Promotion
 
 User = get_user_model()
 
 
 # User Serializer for Authentication and Registration
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'role')
@@ -18,83 +25,141 @@ class RegisterSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['username', 'password', 'email']
-        extra_kwargs = {'password': {'write_only': True}}
+        extra_kwargs = {
+            'password': {'write_only': True},
+            # Soft-deleted users still own their username
+            'username': {'validators': [UniqueValidator(queryset=User.objects.all_with_deleted())]},
+        }
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Category
         fields = ('id', 'name')
 
 
-class ProductSerializer(serializers.ModelSerializer):
-    categories = CategorySerializer(many=True)
+class EffectivePriceField(serializers.DecimalField):
+    """Product price after the currently active promotion, read from the in-process cache."""
+
+    def __init__(self, **kwargs):
+        super().__init__(max_digits=10, decimal_places=2, source='*', read_only=True, **kwargs)
+
+    def to_representation(self, product):
+        return super().to_representation(effective_price(product))
+
+
+# Relations below render as ids unless expanded, and accept an id or a nested object with an id; see api/relations.py
+class ProductSerializer(NestedWritableModelSerializer):
+    categories = NestedRelatedField(CategorySerializer(), many=True)
+    effective_price = EffectivePriceField()
 
     class Meta:
         model = Product
-        fields = ('id', 'name', 'description', 'price', 'rating', 'categories')
+        fields = ('id', 'name', 'description', 'price', 'effective_price', 'rating', 'review_count', 'categories')
+        read_only_fields = ('rating', 'review_count')
+        list_serializer_class = ProductListSerializer
 
 
-class SupplierSerializer(serializers.ModelSerializer):
-    products = ProductSerializer(many=True)
+class SupplierSerializer(NestedWritableModelSerializer):
+    products = NestedRelatedField(ProductSerializer(), many=True)
 
     class Meta:
         model = Supplier
         fields = ('id', 'name', 'products')
 
 
-class CustomerSerializer(serializers.ModelSerializer):
-    user = UserSerializer()
+class CustomerSerializer(NestedWritableModelSerializer):
+    user = NestedRelatedField(UserSerializer(), validators=[UniqueValidator(queryset=Customer.objects.all_with_deleted())])
 
     class Meta:
         model = Customer
         fields = ('id', 'user', 'phone')
 
 
-class OrderSerializer(serializers.ModelSerializer):
-    customer = CustomerSerializer()
-    products = ProductSerializer(many=True)
+class OrderItemSerializer(DynamicFieldsModelSerializer):
+    product = NestedRelatedField(ProductSerializer())
 
     class Meta:
-        model = Order
-        fields = ('id', 'customer', 'products', 'order_date', 'total_amount')
+        model = OrderItem
+        fields = ('id', 'product', 'quantity', 'unit_price', 'discount_percent')
+        read_only_fields = ('unit_price', 'discount_percent')
+        extra_kwargs = {'quantity': {'min_value': 1}}
+
 
+class OrderSerializer(NestedWritableModelSerializer):
+    customer = NestedRelatedField(CustomerSerializer())
+    products = NestedRelatedField(ProductSerializer(), many=True, required=False)
+    # Written on create only, as [{"product": id, "quantity": n}]; prices are snapshotted server-side
+    items = OrderItemSerializer(many=True, required=False)
 
-class ReviewSerializer(serializers.ModelSerializer):
-    customer = CustomerSerializer()
-    product = ProductSerializer()
+    class Meta:
+        model = Order
+        fields = ('id', 'customer', 'products', 'items', 'order_date', 'total_amount')
+        read_only_fields = ('total_amount',)
+        list_serializer_class = OrderListSerializer
+
+    def validate(self, attrs):
+        if self.instance is not None and 'items' in attrs:
+            raise serializers.ValidationError({'items': ["Позиции задаются только при создании заказа."]})
+        return attrs
+
+    @staticmethod
+    def order_lines(attrs):
+        """(product, quantity) pairs for create_orders(): the items, then one of each listed product without an item."""
+        lines = [(item['product'], item.get('quantity', 1)) for item in attrs.get('items', [])]
+        itemized = {product.pk for product, _ in lines}
+        return lines + [(product, 1) for product in attrs.get('products', []) if product.pk not in itemized]
+
+    def create(self, validated_data):
+        # Same path as the bulk endpoint: items priced in bulk by create_orders()
+        order, = create_orders([(validated_data['customer'], self.order_lines(validated_data))])
+        dispatch_order_emails([order.pk], order_email)
+        return order
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if 'products' in validated_data:
+                sync_order_items([instance])
+        return instance
+
+
+class ReviewSerializer(NestedWritableModelSerializer):
+    customer = NestedRelatedField(CustomerSerializer())
+    product = NestedRelatedField(ProductSerializer())
 
     class Meta:
         model = Review
         fields = ('id', 'customer', 'product', 'rating', 'comment', 'review_date')
 
 
-class ShippingSerializer(serializers.ModelSerializer):
-    order = OrderSerializer()
+class ShippingSerializer(NestedWritableModelSerializer):
+    order = NestedRelatedField(OrderSerializer(), validators=[UniqueValidator(queryset=Shipping.objects.all_with_deleted())])
 
     class Meta:
         model = Shipping
         fields = ('id', 'order', 'address', 'shipped_date')
+        list_serializer_class = ShippingListSerializer
 
 
-class PaymentSerializer(serializers.ModelSerializer):
-    order = OrderSerializer()
+class PaymentSerializer(NestedWritableModelSerializer):
+    order = NestedRelatedField(OrderSerializer(), validators=[UniqueValidator(queryset=Payment.objects.all_with_deleted())])
 
     class Meta:
         model = Payment
         fields = ('id', 'order', 'payment_date', 'amount')
 
 
-class StaffSerializer(serializers.ModelSerializer):
-    user = UserSerializer()
+class StaffSerializer(NestedWritableModelSerializer):
+    user = NestedRelatedField(UserSerializer(), validators=[UniqueValidator(queryset=Staff.objects.all_with_deleted())])
 
     class Meta:
         model = Staff
         fields = ('id', 'user', 'phone')
 
 
-class PromotionSerializer(serializers.ModelSerializer):
-    product = ProductSerializer()
+class PromotionSerializer(NestedWritableModelSerializer):
+    product = NestedRelatedField(ProductSerializer())
 
     class Meta:
         model = Promotion
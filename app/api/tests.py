@@ -1,3 +1,1381 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gc
+import io
+import json
+import os
+import tempfile
+import weakref
+from unittest import mock, skipIf
 
-# Create your tests here.
+import openpyxl
+from asgiref.sync import async_to_sync
+from django.contrib import admin
+from django.contrib.admin.models import LogEntry, ADDITION
+from django.contrib.auth.models import Permission
+from django.core import mail
+from django.core.cache import caches
+from django.core.management import call_command
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .benchmark import seed_dataset, run_benchmark, routes, compare, load_baseline, async_views, DEFAULT_BASELINE
+from . import compiled, exports
+from .archive import archive, restore
+from .counting import estimated_count, row_counter
+from .exports import export_response, queue_export, run_export_job, write_export
+from .indexing import plan_problems
+from .models import (
+    User, Customer, Category, Product, Supplier, Order, OrderItem, Review, Shipping, Payment, Promotion, EmailOutbox, ArchivedRecord,
+    RowCount,
+)
+from .notifications import batch_shipping_notifications, mark_shipped
+from .pagination import KeysetPagination
+from .outbox import claim_batch, drain
+from .pricing import create_orders, price_orders
+from .promotions import active_promotions, effective_price
+from .renderers import FastJSONParser, FastJSONRenderer
+from .serializers import ProductSerializer
+from .timing import metrics
+from .tokens import token_versions
+
+
+@override_settings(API_RESPONSE_CACHE_ALIAS=None)
+class EagerLoadingTests(TestCase):
+    endpoints = [
+        'users', 'categories', 'products', 'suppliers', 'customers', 'orders',
+        'reviews', 'shippings', 'payments', 'staffs', 'promotions',
+    ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="admin", role="admin"))
+
+    def count_queries(self, endpoint):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"/app/api/{endpoint}/")
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_list_queries_do_not_grow_with_page_size(self):
+        seed_dataset(2)
+        small = {endpoint: self.count_queries(endpoint) for endpoint in self.endpoints}
+        seed_dataset(8, start=2)
+        for endpoint in self.endpoints:
+            with self.subTest(endpoint=endpoint):
+                self.assertEqual(self.count_queries(endpoint), small[endpoint])
+
+
+class BenchmarkTests(TestCase):
+    def test_no_regressions_against_baseline(self):
+        seed_dataset(50)
+        results = run_benchmark(repeat=1)
+        self.assertEqual(set(results), set(load_baseline(DEFAULT_BASELINE)))
+        regressions = compare(results, load_baseline(DEFAULT_BASELINE), metrics=('queries', 'bytes'))
+        self.assertEqual(regressions, [])
+
+
+class FailingEmailBackend(EmailBackend):
+    def send_messages(self, messages):
+        raise ConnectionError("SMTP unavailable")
+
+
+class UnreachableEmailBackend(EmailBackend):
+    def open(self):
+        raise ConnectionRefusedError("Connection refused")
+
+
+class EmailOutboxTests(TestCase):
+    def create_order(self):
+        user = User.objects.create(username="buyer", email="buyer@example.com")
+        with self.captureOnCommitCallbacks(execute=True):
+            return Order.objects.create(customer=Customer.objects.create(user=user), total_amount=10)
+
+    def test_order_creation_queues_email_without_sending(self):
+        self.create_order()
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(EmailOutbox.objects.get().recipients, ["buyer@example.com"])
+
+        self.assertEqual(drain(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(EmailOutbox.objects.get().status, 'sent')
+        self.assertEqual(drain(), (0, 0))
+
+    def test_admin_order_email_has_priced_total(self):
+        self.client.force_login(User.objects.create_superuser(username="root", email="root@example.com", password="x"))
+        customer = Customer.objects.create(user=User.objects.create(username="buyer", email="buyer@example.com"))
+        product = Product.objects.create(name="product", description="", price=Decimal("12.50"))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("admin:api_order_add"), {
+                "customer": customer.pk, "products": [product.pk],
+                "items-TOTAL_FORMS": 1, "items-INITIAL_FORMS": 0,
+                "items-0-product": product.pk, "items-0-quantity": 2,
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("Общая сумма заказа: 25.00.", EmailOutbox.objects.get().message)
+
+    def test_claimed_batch_is_not_sent_twice(self):
+        self.create_order()
+        email, = claim_batch(10)
+        self.assertEqual((email.status, email.attempts), ('sending', 1))
+        self.assertEqual(claim_batch(10), [])
+        self.assertEqual(drain(), (0, 0))
+
+        # A worker that died mid-batch leaves the email to others once its lease ends
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(drain(), (1, 0))
+        email = EmailOutbox.objects.get()
+        self.assertEqual((email.status, email.attempts), ('sent', 2))
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_rolled_back_order_queues_nothing(self):
+        user = User.objects.create(username="buyer", email="buyer@example.com")
+        Order.objects.create(customer=Customer.objects.create(user=user), total_amount=10)
+        self.assertFalse(EmailOutbox.objects.exists())
+
+    @override_settings(EMAIL_BACKEND='api.tests.FailingEmailBackend')
+    def test_failed_email_is_retried_then_dead_lettered(self):
+        self.create_order()
+        with self.assertLogs('api.outbox', 'ERROR'):
+            self.assertEqual(drain(max_attempts=2, backoff=0), (0, 1))
+        email = EmailOutbox.objects.get()
+        self.assertEqual((email.status, email.attempts), ('pending', 1))
+        self.assertIn("SMTP unavailable", email.last_error)
+
+        with self.assertLogs('api.outbox', 'ERROR'):
+            self.assertEqual(drain(max_attempts=2, backoff=0), (0, 1))
+        self.assertEqual(EmailOutbox.objects.get().status, 'dead')
+        self.assertEqual(drain(max_attempts=2, backoff=0), (0, 0))
+
+    @override_settings(EMAIL_BACKEND='api.tests.UnreachableEmailBackend')
+    def test_unreachable_server_backs_off_the_batch(self):
+        self.create_order()
+        with self.assertLogs('api.outbox', 'ERROR'):
+            self.assertEqual(drain(max_attempts=2, backoff=60), (0, 1))
+        email = EmailOutbox.objects.get()
+        self.assertEqual((email.status, email.attempts), ('pending', 1))
+        self.assertIn("Connection refused", email.last_error)
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        # Not due again yet, so the worker loop just polls
+        self.assertEqual(drain(max_attempts=2, backoff=60), (0, 0))
+
+
+class ShippingNotificationTests(TestCase):
+    def create_shippings(self, count, start=0):
+        shippings = []
+        for i in range(start, start + count):
+            user = User.objects.create(username=f"buyer{i}", email=f"buyer{i}@example.com")
+            order = Order.objects.create(customer=Customer.objects.create(user=user), total_amount=10)
+            shippings.append(Shipping.objects.create(order=order, address="address"))
+        return shippings
+
+    def queued(self):
+        return sorted(email.recipients[0] for email in EmailOutbox.objects.filter(subject__contains="доставлен"))
+
+    def test_notifies_only_on_shipped_transition(self):
+        shipping, = self.create_shippings(1)
+        shipping = Shipping.objects.get(pk=shipping.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            shipping.save()
+            shipping.shipped_date = timezone.now()
+            shipping.save()
+            shipping.address = "new address"
+            shipping.save()
+            Shipping.objects.get(pk=shipping.pk).save()
+        self.assertEqual(self.queued(), ["buyer0@example.com"])
+
+    def test_batch_sends_one_email_per_order(self):
+        shippings = self.create_shippings(5)
+        with self.captureOnCommitCallbacks(execute=True):
+            with batch_shipping_notifications():
+                for shipping in shippings + shippings:
+                    shipping.shipped_date = timezone.now()
+                    shipping.save()
+        self.assertEqual(self.queued(), [f"buyer{i}@example.com" for i in range(5)])
+
+    def test_mark_shipped_runs_fixed_number_of_queries(self):
+        self.create_shippings(2)
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as small:
+            self.assertEqual(mark_shipped(Shipping.objects.all()), 2)
+        self.create_shippings(10, start=2)
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as large:
+            self.assertEqual(mark_shipped(Shipping.objects.all()), 10)
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(len(self.queued()), 12)
+
+    def test_admin_action_marks_selected_shippings(self):
+        shippings = self.create_shippings(3)
+        shippings[0].shipped_date = timezone.now()
+        shippings[0].save()
+        self.client.force_login(User.objects.create_superuser(username="root", email="root@example.com", password="x"))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("admin:api_shipping_changelist"), {
+                'action': 'mark_as_shipped', '_selected_action': [shipping.pk for shipping in shippings],
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Shipping.objects.filter(shipped_date__isnull=True).exists())
+        self.assertEqual(self.queued(), ["buyer1@example.com", "buyer2@example.com"])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="admin", role="admin"))
+        seed_dataset(25)
+        # Ties on the ordering field must be broken by id
+        Review.objects.filter(pk__lte=10).update(review_date=timezone.now())
+
+    def walk(self, url):
+        ids = []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            for query in queries:
+                self.assertNotIn('COUNT(', query['sql'])
+                self.assertNotIn('OFFSET', query['sql'])
+            ids.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_walks_every_row_once_in_order(self):
+        ids = self.walk("/app/api/reviews/?pagination=keyset")
+        expected = list(Review.objects.order_by('review_date', 'pk').values_list('pk', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_follows_requested_ordering(self):
+        ids = self.walk("/app/api/orders/?pagination=keyset&ordering=-order_date")
+        expected = list(Order.objects.order_by('-order_date', '-pk').values_list('pk', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_falls_back_to_pk_without_ordering(self):
+        paginator, ids, url = KeysetPagination(), [], "/?pagination=keyset"
+        paginator.page_size = 10
+        while url:
+            page = paginator.paginate_queryset(Payment.objects.all(), Request(APIRequestFactory().get(url)), view=None)
+            ids.extend(payment.pk for payment in page)
+            url = paginator.get_next_link()
+        self.assertEqual(ids, list(Payment.objects.order_by('pk').values_list('pk', flat=True)))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get("/app/api/payments/?cursor=garbage").status_code, 404)
+
+    def test_page_number_pagination_is_default(self):
+        response = self.client.get("/app/api/orders/")
+        self.assertEqual(response.data['count'], 25)
+
+
+class LogExportTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username="root", password="password", email="root@example.com")
+        for i in range(30):
+            LogEntry.objects.create(user=self.admin, action_flag=ADDITION, object_repr=f"object{i}")
+
+    def test_csv_streams_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = export_response(LogEntry.objects.all(), 'csv')
+            content = b"".join(response.streaming_content).decode('utf-8-sig')
+        rows = [line.split(",") for line in content.splitlines()]
+        self.assertEqual(rows[0], ["ID", "Пользователь", "Тип действия", "Объект", "Дата и время"])
+        self.assertEqual(sorted(row[3] for row in rows[1:]), sorted(f"object{i}" for i in range(30)))
+        self.assertEqual({tuple(row[1:3]) for row in rows[1:]}, {("root", "Addition")})
+
+    def test_xlsx(self):
+        response = export_response(LogEntry.objects.all(), 'xlsx')
+        with tempfile.TemporaryFile() as file:
+            file.write(b"".join(response.streaming_content))
+            rows = list(openpyxl.load_workbook(file).active.values)
+        self.assertEqual(rows[0], ("ID", "Пользователь", "Тип действия", "Объект", "Дата и время"))
+        self.assertEqual(len(rows), 31)
+
+    def test_admin_action(self):
+        self.client.force_login(self.admin)
+        response = self.client.post("/admin/admin/logentry/", {
+            'action': 'export_to_csv',
+            '_selected_action': LogEntry.objects.values_list('pk', flat=True)[:5],
+        })
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="log_entries.csv"')
+        self.assertEqual(len(b"".join(response.streaming_content).splitlines()), 6)
+
+    def test_background_job(self):
+        selected = LogEntry.objects.filter(object_repr__endswith="1")
+        job = queue_export(selected, 'csv', self.admin, chunk_size=2)
+        pks = sorted(selected.values_list('pk', flat=True))
+        self.assertEqual(list(job.chunks.order_by('pk').values_list('object_ids', flat=True)), [pks[:2], pks[2:]])
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            job = run_export_job(job)
+            self.assertEqual(job.status, 'done')
+            with job.file.open() as file:
+                self.assertEqual(len(file.read().splitlines()), 4)
+        self.assertFalse(job.chunks.exists())
+
+
+class ModelExportTests(TestCase):
+    def setUp(self):
+        seed_dataset(30)
+
+    def test_csv(self):
+        with self.assertNumQueries(1):
+            content = b"".join(export_response(Order.objects.all(), 'csv').streaming_content).decode('utf-8-sig')
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0], ["ID", "customer", "order date", "total amount", "is deleted"])
+        self.assertEqual(len(rows), 31)
+
+    def test_xlsx(self):
+        with tempfile.TemporaryFile() as file:
+            self.assertEqual(write_export(file, Review.objects.all(), 'xlsx'), 30)
+            rows = list(openpyxl.load_workbook(file).active.values)
+        self.assertEqual(len(rows), 31)
+
+    @skipIf(exports.pyarrow is None, "pyarrow is not installed")
+    def test_parquet(self):
+        with tempfile.TemporaryFile() as file:
+            self.assertEqual(write_export(file, Order.objects.all(), 'parquet', chunk_size=7), 30)
+            table = exports.pyarrow.parquet.read_table(file)
+        self.assertEqual(table.num_rows, 30)
+        self.assertEqual(table.column_names, ["id", "customer_id", "order_date", "total_amount", "is_deleted"])
+
+    def test_parquet_falls_back_to_compact_csv(self):
+        with mock.patch.object(exports, 'pyarrow', None):
+            response = export_response(Order.objects.all(), 'parquet')
+            content = b"".join(response.streaming_content).decode('utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="order.csv"')
+        self.assertTrue(content.startswith("id,customer_id,order_date,total_amount,is_deleted"))
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "payments.csv")
+            call_command('export_model', 'api.Payment', '--output', output, stdout=io.StringIO())
+            with open(output, encoding='utf-8-sig') as file:
+                self.assertEqual(len(file.read().splitlines()), 31)
+
+    def admin_actions(self, url):
+        action_form = self.client.get(url).context['action_form']
+        return [value for value, label in action_form.fields['action'].choices] if action_form else []
+
+    def test_credentials_are_not_exportable(self):
+        with self.assertRaises(ValueError):
+            exports.get_exporter(User)
+        self.client.force_login(User.objects.create_superuser(username="root", password="password", email="root@example.com"))
+        self.assertIn('export_to_csv', self.admin_actions("/admin/api/order/"))
+        self.assertNotIn('export_to_csv', self.admin_actions("/admin/api/user/"))
+
+    def test_actions_require_export_permission(self):
+        staff = User.objects.create_user(username="staff", password="password", is_staff=True)
+        staff.user_permissions.add(Permission.objects.get(codename='view_order'))
+        self.client.force_login(staff)
+        self.assertNotIn('export_to_csv', self.admin_actions("/admin/api/order/"))
+        staff.user_permissions.add(Permission.objects.get(codename='export_data'))
+        self.assertIn('export_to_csv', self.admin_actions("/admin/api/order/"))
+
+
+class ProductRatingTests(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(user=User.objects.create(username="buyer"))
+        self.product = Product.objects.create(name="product", description="", price=10)
+        self.other = Product.objects.create(name="other", description="", price=10)
+
+    def review(self, rating, product=None):
+        return Review.objects.create(customer=self.customer, product=product or self.product, rating=rating, comment="")
+
+    def assertAggregate(self, product, count, total, rating):
+        product.refresh_from_db()
+        self.assertEqual((product.review_count, product.review_sum, product.rating), (count, total, rating))
+
+    def test_incremental_updates(self):
+        first = self.review(4)
+        self.review(5)
+        self.assertAggregate(self.product, 2, 9, 4.5)
+
+        first = Review.objects.get(pk=first.pk)
+        first.rating = 2
+        first.save()
+        self.assertAggregate(self.product, 2, 7, 3.5)
+
+        first.product = self.other
+        first.save()
+        self.assertAggregate(self.product, 1, 5, 5.0)
+        self.assertAggregate(self.other, 1, 2, 2.0)
+
+        first.delete()
+        first.comment = "edited"
+        first.save()
+        self.assertAggregate(self.other, 0, 0, 0.0)
+
+    def test_product_list_does_not_read_reviews(self):
+        self.review(3)
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username="admin", role="admin"))
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get("/app/api/products/")
+        self.assertEqual(response.data['results'][1]['rating'], 3.0)
+        self.assertFalse(any('api_review' in query['sql'] for query in queries))
+
+    def test_rebuild_repairs_drift(self):
+        self.review(4)
+        self.review(1, self.other)
+        Product.objects.update(review_count=7, review_sum=1, rating=0)
+        call_command('rebuild_ratings', stdout=io.StringIO())
+        self.assertAggregate(self.product, 1, 4, 4.0)
+        self.assertAggregate(self.other, 1, 1, 1.0)
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.customer = Customer.objects.create(user=User.objects.create(username="buyer"))
+        self.cheap = Product.objects.create(name="cheap", description="", price=Decimal("9.99"))
+        self.pricey = Product.objects.create(name="pricey", description="", price=Decimal("100.00"))
+        Promotion.objects.create(product=self.pricey, discount_percent=15, start_date=now - timedelta(days=1), end_date=now + timedelta(days=1))
+        Promotion.objects.create(product=self.cheap, discount_percent=50, start_date=now + timedelta(days=1), end_date=now + timedelta(days=2))
+
+    def test_snapshots_price_and_active_promotion(self):
+        order, = create_orders([(self.customer, [(self.cheap, 3), (self.pricey.pk, 1)])])
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal("114.97"))
+        self.assertEqual(set(order.products.all()), {self.cheap, self.pricey})
+
+        Product.objects.update(price=1)
+        price_orders([order])
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal("114.97"))
+        self.assertEqual(
+            set(order.items.values_list('unit_price', 'discount_percent')),
+            {(Decimal("9.99"), 0), (Decimal("100.00"), 15)},
+        )
+
+    def test_bulk_creation_runs_fixed_number_of_queries(self):
+        def create(count):
+            with CaptureQueriesContext(connection) as queries:
+                create_orders([(self.customer, [(self.cheap, 1), (self.pricey, 2)])] * count)
+            return len(queries)
+
+        self.assertEqual(create(5), create(50))
+        self.assertEqual(OrderItem.objects.count(), 110)
+
+    def test_changing_products_resyncs_items_and_total(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username="admin", role="admin"))
+        other = Product.objects.create(name="other", description="", price=Decimal("5.00"))
+        order, = create_orders([(self.customer, [(self.cheap, 1), (self.pricey, 1)])])
+        Product.objects.filter(pk=self.pricey.pk).update(price=1)
+
+        response = client.patch(f"/app/api/orders/{order.pk}/", {'products': [self.pricey.pk, other.pk]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        # The kept item keeps its snapshot, the added one is priced now
+        self.assertEqual(response.data['total_amount'], "90.00")
+        self.assertEqual({item['product'] for item in response.data['items']}, {self.pricey.pk, other.pk})
+
+        response = client.patch("/app/api/orders/bulk/", [{'id': order.pk, 'products': [self.cheap.pk]}], format='json')
+        self.assertEqual(response.status_code, 200)
+        order.refresh_from_db()
+        self.assertEqual(order.total_amount, Decimal("9.99"))
+        self.assertEqual(list(order.items.values_list('product_id', flat=True)), [self.cheap.pk])
+
+
+class ActivePromotionCacheTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.product = Product.objects.create(name="product", description="", price=Decimal("200.00"))
+        self.promotion = Promotion.objects.create(
+            product=self.product, discount_percent=10,
+            start_date=self.now - timedelta(days=1), end_date=self.now + timedelta(days=1),
+        )
+        Promotion.objects.create(
+            product=self.product, discount_percent=30,
+            start_date=self.now + timedelta(days=2), end_date=self.now + timedelta(days=3),
+        )
+        active_promotions.invalidate()
+
+    def test_hot_path_runs_no_queries(self):
+        self.assertEqual(effective_price(self.product, self.now), Decimal("180.00"))
+        with self.assertNumQueries(0):
+            for _ in range(100):
+                self.assertEqual(effective_price(self.product, self.now), Decimal("180.00"))
+
+    def test_invalidated_by_promotion_changes(self):
+        effective_price(self.product, self.now)
+        self.promotion.discount_percent = 20
+        self.promotion.save()
+        self.assertEqual(effective_price(self.product, self.now), Decimal("160.00"))
+        self.promotion.delete()
+        self.assertEqual(effective_price(self.product, self.now), Decimal("200.00"))
+
+    def test_refreshes_at_next_boundary(self):
+        Promotion.objects.filter(pk=self.promotion.pk).update(end_date=self.now + timedelta(seconds=10))
+        effective_price(self.product, self.now)
+        with self.assertNumQueries(0):
+            self.assertEqual(effective_price(self.product, self.now + timedelta(seconds=9)), Decimal("180.00"))
+        with self.assertNumQueries(2):
+            self.assertEqual(effective_price(self.product, self.now + timedelta(seconds=11)), Decimal("200.00"))
+        self.assertEqual(effective_price(self.product, self.now + timedelta(days=2, hours=1)), Decimal("140.00"))
+
+
+class SoftDeleteTests(TestCase):
+    def setUp(self):
+        seed_dataset(5)
+
+    def test_default_manager_hides_deleted_rows(self):
+        Order.objects.filter(pk__in=Order.objects.order_by('pk').values('pk')[:2]).delete()
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertEqual(Order.objects.all_with_deleted().count(), 5)
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username="admin", role="admin"))
+        self.assertEqual(client.get("/app/api/orders/").data['count'], 3)
+        deleted = Order.objects.all_with_deleted().filter(is_deleted=True).first()
+        self.assertEqual(client.get(f"/app/api/orders/{deleted.pk}/").status_code, 404)
+
+    def test_bulk_delete_is_one_update(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(Shipping.objects.all().delete(), (5, {'api.Shipping': 5}))
+        self.assertEqual(Shipping.objects.all_with_deleted().count(), 5)
+        Shipping.objects.all_with_deleted().restore()
+        self.assertEqual(Shipping.objects.count(), 5)
+
+    def test_bulk_review_delete_updates_ratings(self):
+        product = Product.objects.order_by('pk').first()
+        Review.objects.filter(product=product).delete()
+        product.refresh_from_db()
+        self.assertEqual((product.review_count, product.review_sum, product.rating), (0, 0, 0.0))
+
+    def test_bulk_review_restore_updates_ratings(self):
+        product = Product.objects.order_by('pk').first()
+        before = (product.review_count, product.review_sum, product.rating)
+        Review.objects.filter(product=product).delete()
+        Review.objects.all_with_deleted().filter(product=product).restore()
+        product.refresh_from_db()
+        self.assertEqual((product.review_count, product.review_sum, product.rating), before)
+        self.assertGreater(product.review_count, 0)
+
+    def test_bulk_promotion_restore_invalidates_active_discounts(self):
+        product = Product.objects.create(name="product", description="", price=Decimal("100.00"))
+        now = timezone.now()
+        Promotion.objects.create(product=product, discount_percent=20, start_date=now - timedelta(days=1), end_date=now + timedelta(days=1))
+        Promotion.objects.filter(product=product).delete()
+        self.assertEqual(effective_price(product), Decimal("100.00"))
+        Promotion.objects.all_with_deleted().filter(product=product).restore()
+        self.assertEqual(effective_price(product), Decimal("80.00"))
+
+    def test_deleted_users_cannot_register_their_username_again(self):
+        User.objects.get(username="user0").delete()
+        response = APIClient().post("/app/api/register/", {'username': "user0", 'password': "secret-password"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_partial_indexes(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Order._meta.db_table)
+        self.assertEqual(constraints['order_live_date_idx']['columns'], ['order_date', 'id'])
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        seed_dataset(6)
+        self.orders = list(Order.objects.order_by('pk'))
+
+    def test_archives_deleted_and_old_orders_with_their_rows(self):
+        self.orders[0].delete()
+        Order.objects.filter(pk=self.orders[1].pk).update(order_date=timezone.now() - timedelta(days=400))
+        Review.objects.filter(pk=Review.objects.order_by('pk').first().pk).delete()
+
+        stats, _ = archive(retention_days=365, chunk_size=1)
+        # order, item, shipping, payment and product link per order
+        self.assertEqual(stats['api.Order'], (2, 10))
+        self.assertEqual(stats['api.Review'], (1, 1))
+        self.assertEqual(Order.objects.all_with_deleted().count(), 4)
+        self.assertFalse(Shipping.objects.all_with_deleted().filter(order__in=self.orders[:2]).exists())
+        self.assertFalse(Order.products.through.objects.filter(order__in=self.orders[:2]).exists())
+        self.assertEqual(archive(retention_days=365)[0]['api.Order'], (0, 0))
+
+    def test_restore(self):
+        order = self.orders[2]
+        products = set(order.products.all())
+        order.delete()
+        call_command('archive', stdout=io.StringIO())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(restore(Order, [order.pk]), 5)
+        restored = Order.objects.all_with_deleted().get(pk=order.pk)
+        self.assertTrue(restored.is_deleted)
+        self.assertEqual(set(restored.products.all()), products)
+        self.assertTrue(Payment.objects.filter(order=restored).exists())
+        self.assertEqual(restored.items.count(), 1)
+        self.assertFalse(ArchivedRecord.objects.exists())
+        self.assertFalse(EmailOutbox.objects.exists())
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        caches['api'].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="admin", role="admin"))
+        self.category = Category.objects.create(name="category")
+        self.product = Product.objects.create(name="product", description="", price=10)
+
+    def get(self, url, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, headers=headers)
+        return response, len(queries)
+
+    def test_repeated_requests_are_served_from_cache(self):
+        first, _ = self.get("/app/api/products/")
+        second, queries = self.get("/app/api/products/")
+        self.assertEqual(queries, 0)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_model_changes_invalidate(self):
+        self.get("/app/api/products/")
+        self.product.name = "renamed"
+        self.product.save()
+        response, queries = self.get("/app/api/products/")
+        self.assertGreater(queries, 0)
+        self.assertEqual(response.data['results'][0]['name'], "renamed")
+
+        self.product.categories.add(self.category)
+        response, _ = self.get("/app/api/products/")
+        self.assertEqual(len(response.data['results'][0]['categories']), 1)
+
+        Review.objects.create(
+            customer=Customer.objects.create(user=User.objects.create(username="buyer")),
+            product=self.product, rating=5, comment="",
+        )
+        response, _ = self.get("/app/api/products/")
+        self.assertEqual(response.data['results'][0]['rating'], 5.0)
+
+    def test_promotion_boundary_changes_the_key(self):
+        now, url = timezone.now(), f"/app/api/products/{self.product.pk}/"
+        Promotion.objects.create(
+            product=self.product, discount_percent=50,
+            start_date=now + timedelta(seconds=2), end_date=now + timedelta(days=1),
+        )
+        first, _ = self.get(url)
+        self.assertEqual(first.data['effective_price'], "10.00")
+        # The promotion starts without any write
+        with mock.patch('django.utils.timezone.now', return_value=now + timedelta(seconds=3)):
+            response, _ = self.get(url, If_None_Match=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['effective_price'], "5.00")
+
+    def test_queryset_soft_delete_and_restore_invalidate(self):
+        self.get("/app/api/products/")
+        Product.objects.filter(pk=self.product.pk).delete()
+        response, _ = self.get("/app/api/products/")
+        self.assertEqual(response.data['results'], [])
+
+        Product.objects.all_with_deleted().filter(pk=self.product.pk).restore()
+        response, _ = self.get("/app/api/products/")
+        self.assertEqual([product['id'] for product in response.data['results']], [self.product.pk])
+
+    def test_conditional_requests(self):
+        response, _ = self.get(f"/app/api/categories/{self.category.pk}/")
+        cached, queries = self.get(f"/app/api/categories/{self.category.pk}/", If_None_Match=response['ETag'])
+        self.assertEqual((cached.status_code, queries), (304, 0))
+        cached, _ = self.get(f"/app/api/categories/{self.category.pk}/", If_Modified_Since=response['Last-Modified'])
+        self.assertEqual(cached.status_code, 304)
+
+        Category.objects.filter(pk=self.category.pk).first().save()
+        response, _ = self.get(f"/app/api/categories/{self.category.pk}/", If_None_Match=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_roles_do_not_share_entries(self):
+        response, _ = self.get("/app/api/products/")
+        self.client.force_authenticate(User.objects.create(username="manager", role="manager"))
+        other, queries = self.get("/app/api/products/")
+        self.assertGreater(queries, 0)
+        self.assertNotEqual(other['ETag'], response['ETag'])
+
+
+class BulkEndpointTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="admin", role="admin"))
+        self.categories = [Category.objects.create(name=f"category{i}") for i in range(3)]
+
+    def products(self, count, start=0):
+        return [
+            {'name': f"product{i}", 'description': "description", 'price': "10.00",
+             'categories': [category.pk for category in self.categories[:2]]}
+            for i in range(start, start + count)
+        ]
+
+    def post_products(self, items):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/app/api/products/bulk/", items, format='json')
+        return response, len(queries)
+
+    def test_create_reports_item_errors(self):
+        items = self.products(3)
+        items.insert(1, {'name': "broken", 'description': "broken", 'price': "x", 'categories': [999]})
+        response = self.client.post("/app/api/products/bulk/", items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['ids']), 3)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        self.assertEqual(set(response.data['errors'][0]['errors']), {'price', 'categories'})
+        self.assertEqual(Product.categories.through.objects.count(), 6)
+
+        response = self.client.post("/app/api/products/bulk/", [{'name': "broken"}], format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_create_runs_fixed_number_of_queries(self):
+        response, small = self.post_products(self.products(5))
+        self.assertEqual(response.status_code, 201)
+        response, large = self.post_products(self.products(50, start=5))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(small, large)
+
+    def test_ndjson_body(self):
+        body = "\n".join(json.dumps(item) for item in self.products(2)) + "\n\n"
+        response = self.client.post("/app/api/products/bulk/", body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Product.objects.filter(name__startswith="product").count(), 2)
+
+        response = self.client.post("/app/api/products/bulk/", "{]", content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+
+    def test_update_and_delete(self):
+        ids = self.client.post("/app/api/products/bulk/", self.products(2), format='json').data['ids']
+        response = self.client.patch("/app/api/products/bulk/", [
+            {'id': ids[0], 'price': "12.50", 'categories': [self.categories[2].pk]},
+            {'id': 999, 'price': "1.00"},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['ids'], [ids[0]])
+        self.assertEqual(response.data['errors'][0]['index'], 1)
+        product = Product.objects.get(pk=ids[0])
+        self.assertEqual(product.price, Decimal("12.50"))
+        self.assertEqual(list(product.categories.all()), [self.categories[2]])
+
+        response = self.client.delete("/app/api/products/bulk/", [ids[1], 999], format='json')
+        self.assertEqual(response.data['ids'], [ids[1]])
+        self.assertEqual(response.data['errors'][0]['index'], 1)
+        self.assertFalse(Product.objects.filter(pk=ids[1]).exists())
+        self.assertTrue(Product.objects.all_with_deleted().filter(pk=ids[1]).exists())
+
+    @override_settings(EMAIL_HOST_USER="shop@example.com")
+    def test_orders_and_shippings(self):
+        customer = Customer.objects.create(user=User.objects.create(username="buyer", email="buyer@example.com"))
+        products = [Product.objects.create(name=f"product{i}", description="", price=10) for i in range(2)]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/app/api/orders/bulk/", [
+                {'customer': customer.pk, 'products': [product.pk for product in products]},
+                {'customer': customer.pk, 'products': [products[0].pk]},
+            ], format='json')
+        self.assertEqual(response.status_code, 201)
+        orders = Order.objects.filter(pk__in=response.data['ids']).order_by('pk')
+        self.assertEqual([order.total_amount for order in orders], [Decimal("20.00"), Decimal("10.00")])
+        self.assertEqual(EmailOutbox.objects.filter(subject="Спасибо за ваш заказ!").count(), 2)
+
+        def create(count):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post("/app/api/orders/bulk/", [
+                    {'customer': customer.pk, 'items': [{'product': products[0].pk, 'quantity': 4}, {'product': products[1].pk}]}
+                    for _ in range(count)
+                ], format='json')
+            self.assertEqual(response.status_code, 201)
+            totals = Order.objects.filter(pk__in=response.data['ids']).values_list('total_amount', flat=True)
+            self.assertEqual(set(totals), {Decimal("50.00")})
+            return len(queries)
+
+        self.assertEqual(create(2), create(20))
+
+        response = self.client.post("/app/api/shippings/bulk/", [
+            {'order': orders[0].pk, 'address': "address"},
+            {'order': orders[0].pk, 'address': "duplicate"},
+            {'order': orders[1].pk, 'address': "address"},
+        ], format='json')
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch("/app/api/shippings/bulk/", [
+                {'id': pk, 'shipped_date': timezone.now().isoformat()} for pk in response.data['ids']
+            ], format='json')
+        self.assertEqual(EmailOutbox.objects.filter(subject__contains="доставлен").count(), 2)
+
+
+class NestedWriteTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="admin", role="admin"))
+        self.categories = [Category.objects.create(name=f"category{i}") for i in range(3)]
+        self.customer = Customer.objects.create(user=User.objects.create(username="buyer"))
+
+    def test_accepts_ids_or_nested_objects(self):
+        response = self.client.post("/app/api/products/?expand=categories", {
+            'name': "product", 'description': "description", 'price': "10.00",
+            'categories': [self.categories[0].pk, {'id': self.categories[1].pk, 'name': "ignored"}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['categories'], [{'id': c.pk, 'name': c.name} for c in self.categories[:2]])
+
+        response = self.client.patch(f"/app/api/products/{response.data['id']}/", {
+            'categories': [{'id': self.categories[1].pk}, self.categories[2].pk],
+        }, format='json')
+        self.assertEqual(response.data['categories'], [category.pk for category in self.categories[1:]])
+
+        for categories, code in (([999], 'does_not_exist'), ([{'name': "new"}], 'incorrect_type')):
+            response = self.client.post("/app/api/products/", {
+                'name': "product", 'description': "description", 'price': "10.00", 'categories': categories,
+            }, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['categories'][0].code, code)
+
+    def test_order_write_runs_fixed_number_of_queries(self):
+        products = Product.objects.bulk_create(
+            Product(name=f"product{i}", description="", price=1) for i in range(100)
+        )
+
+        def create(count):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post("/app/api/orders/", {
+                    'customer': {'id': self.customer.pk},
+                    'products': [product.pk for product in products[:count]],
+                }, format='json')
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.data['total_amount'], f"{count}.00")
+            return len(queries)
+
+        self.assertEqual(create(5), create(100))
+
+    def test_order_items_carry_quantities(self):
+        products = Product.objects.bulk_create(
+            Product(name=f"product{i}", description="", price=Decimal("2.50")) for i in range(3)
+        )
+        response = self.client.post("/app/api/orders/", {
+            'customer': self.customer.pk,
+            'items': [{'product': products[0].pk, 'quantity': 3}, {'product': {'id': products[1].pk}, 'quantity': 2}],
+            'products': [products[1].pk, products[2].pk],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_amount'], "15.00")
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual(
+            sorted(order.items.values_list('product_id', 'quantity')),
+            [(products[0].pk, 3), (products[1].pk, 2), (products[2].pk, 1)],
+        )
+        self.assertEqual(set(order.products.all()), set(products))
+
+        response = self.client.post("/app/api/orders/", {
+            'customer': self.customer.pk, 'items': [{'product': 999}, {'product': products[0].pk, 'quantity': 0}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual({index: set(errors) for index, errors in response.data['items'].items()}, {0: {'product'}, 1: {'quantity'}})
+
+        response = self.client.patch(f"/app/api/orders/{order.pk}/", {'items': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('items', response.data)
+
+    def test_unique_relations(self):
+        order = Order.objects.create(customer=self.customer)
+        Shipping.objects.create(order=order, address="address")
+        response = self.client.post("/app/api/shippings/", {'order': order.pk, 'address': "address"}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('order', response.data)
+
+
+@override_settings(API_RESPONSE_CACHE_ALIAS=None)
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="admin", role="admin"))
+        seed_dataset(3)
+        self.payment = Payment.objects.order_by('pk').first()
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data, queries
+
+    def test_relations_default_to_primary_keys(self):
+        data, queries = self.get(f"/app/api/payments/{self.payment.pk}/")
+        self.assertEqual(data['order'], self.payment.order_id)
+        self.assertEqual(len(queries), 1)
+        self.assertFalse(any('api_order' in query['sql'] for query in queries))
+
+    def test_expand(self):
+        data, _ = self.get(f"/app/api/payments/{self.payment.pk}/?expand=order.customer.user")
+        user = data['order']['customer']['user']
+        self.assertEqual(user['id'], self.payment.order.customer.user_id)
+        self.assertEqual(data['order']['products'], [self.payment.order.products.get().pk])
+
+        data, _ = self.get("/app/api/suppliers/?expand=products")
+        self.assertIsInstance(data['results'][0]['products'][0]['categories'][0], int)
+
+    def test_sparse_fields(self):
+        data, _ = self.get(f"/app/api/payments/{self.payment.pk}/?fields=id,order.total_amount")
+        self.assertEqual(data, {'id': self.payment.pk, 'order': {'total_amount': str(self.payment.order.total_amount)}})
+
+        data, queries = self.get("/app/api/products/?fields=id,name")
+        self.assertEqual(set(data['results'][0]), {'id', 'name'})
+        self.assertFalse(any('api_category' in query['sql'] for query in queries))
+
+        data, _ = self.get("/app/api/orders/?fields=items.quantity")
+        self.assertEqual(data['results'][0], {'items': [{'quantity': 1}]})
+
+
+class FastJSONTests(TestCase):
+    data = {
+        'price': Decimal("10.50"),
+        'amount': 1.5,
+        'date': timezone.make_aware(datetime(2024, 5, 1, 12, 30, 15, 250000)),
+        'name': "Заказ\u2028№1",
+        'lazy': gettext_lazy("Заказ"),
+        'items': [{'id': 1, 'nested': None}],
+        1: True,
+    }
+
+    def test_output_matches_drf_renderer(self):
+        expected = JSONRenderer().render(self.data)
+        self.assertEqual(FastJSONRenderer().render(self.data), expected)
+        with mock.patch('api.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.data), expected)
+        self.assertEqual(
+            FastJSONRenderer().render(self.data, "application/json; indent=2"),
+            JSONRenderer().render(self.data, "application/json; indent=2"),
+        )
+
+    def test_parser(self):
+        content = FastJSONRenderer().render({'items': [1, "два"]})
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(content)), {'items': [1, "два"]})
+        for body in (b'{"price": NaN}', b'{'):
+            with self.subTest(body=body), self.assertRaises(ParseError):
+                FastJSONParser().parse(io.BytesIO(body))
+            with self.subTest(body=body, orjson=None), mock.patch('api.renderers.orjson', None):
+                with self.assertRaises(ParseError):
+                    FastJSONParser().parse(io.BytesIO(body))
+
+
+@override_settings(API_RESPONSE_CACHE_ALIAS=None)
+class CompiledSerializerTests(TestCase):
+    shapes = [
+        "", "?expand=customer.user,products.categories,order.customer.user,order.products,product,user,categories",
+        "?fields=id,name,order.id,order.customer.user.username,products.name,items.quantity",
+    ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="admin", role="admin", email="admin@example.com"))
+        seed_dataset(3)
+        Shipping.objects.update(shipped_date=None)
+        compiled._converters.clear()
+
+    def test_output_is_identical(self):
+        for url in [url for _, url in routes()]:
+            for shape in self.shapes:
+                with self.subTest(url=url + shape):
+                    response = self.client.get(url + shape)
+                    with override_settings(API_COMPILED_SERIALIZERS=False):
+                        expected = self.client.get(url + shape)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.content, expected.content)
+        self.assertEqual(len(compiled._converters), 11 * len(self.shapes))
+
+    def test_converters_do_not_keep_the_request(self):
+        def render():
+            request = Request(APIRequestFactory().get("/", {'expand': "categories"}))
+            serializer = ProductSerializer(Product.objects.all(), many=True, context={'request': request})
+            return weakref.ref(request), list(compiled.CompiledSerializer(serializer).data)
+
+        first, data = render()
+        gc.collect()
+        self.assertIsNone(first())
+        self.assertEqual(render()[1], data)
+        self.assertEqual(len(compiled._converters), 1)
+
+    def test_browsable_api_uses_serializers(self):
+        response = self.client.get("/app/api/products/", HTTP_ACCEPT="text/html")
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response.data['results'].serializer, ProductSerializer.Meta.list_serializer_class)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="admin", role="admin"))
+        self.phones, self.cases = Category.objects.create(name="Телефоны"), Category.objects.create(name="Чехлы")
+        self.phone = Product.objects.create(name="Смартфон Galaxy", description="Тонкий телефон", price=500)
+        self.case = Product.objects.create(name="Чехол", description="Чехол для смартфона Galaxy", price=10)
+        self.other = Product.objects.create(name="Ноутбук", description="Лёгкий ноутбук", price=900)
+        self.phone.categories.set([self.phones])
+        self.case.categories.set([self.phones, self.cases])
+
+    def search(self, query):
+        response = self.client.get("/app/api/products/search/", {'q': query} if isinstance(query, str) else query)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_ranks_name_matches_first(self):
+        data = self.search("galaxy")
+        self.assertEqual(data['count'], 2)
+        self.assertEqual([item['id'] for item in data['results']], [self.phone.pk, self.case.pk])
+        self.assertEqual(self.search("смартфона gal")['count'], 1)  # every word, the last one as a prefix
+        self.assertEqual(self.search("смартф")['count'], 2)
+        self.assertEqual(self.search("galaxy ноутбук")['count'], 0)
+
+    def test_ranks_every_match_and_flags_capped_counts(self):
+        self.assertFalse(self.search("galaxy")['count_is_capped'])
+        with mock.patch('api.search.MAX_MATCHES', 1):
+            data = self.search("galaxy")
+        self.assertEqual((data['count'], data['count_is_capped']), (1, True))
+        # The older product is still ranked first
+        self.assertEqual([item['id'] for item in data['results']], [self.phone.pk])
+
+    def test_category_facets_and_filter(self):
+        data = self.search("galaxy")
+        self.assertEqual(data['facets']['categories'], [
+            {'id': self.phones.pk, 'name': "Телефоны", 'count': 2},
+            {'id': self.cases.pk, 'name': "Чехлы", 'count': 1},
+        ])
+        data = self.search({'q': "galaxy", 'category': self.cases.pk})
+        self.assertEqual([item['id'] for item in data['results']], [self.case.pk])
+
+    def test_index_follows_product_changes(self):
+        self.other.name = "Galaxy Book"
+        self.other.save()
+        self.assertEqual(self.search("book")['count'], 1)
+        self.phone.delete()
+        self.assertEqual(self.search("galaxy")['count'], 2)
+        Product.objects.filter(pk=self.case.pk).delete()  # bulk soft delete sends no signal
+        self.assertEqual(self.search("galaxy")['count'], 1)
+
+        response = self.client.post("/app/api/products/bulk/", [
+            {'name': "Galaxy Tab", 'description': "Планшет", 'price': "300.00", 'categories': [self.phones.pk]},
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.search("планшет")['count'], 1)
+
+    def test_rebuild_command(self):
+        Product.objects.bulk_create([Product(name="Galaxy Watch", description="Часы", price=200)])
+        self.assertEqual(self.search("часы")['count'], 0)
+        out = io.StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn("Indexed 4 products", out.getvalue())
+        self.assertEqual(self.search("часы")['count'], 1)
+
+    def test_query_is_required_and_sanitized(self):
+        self.assertEqual(self.client.get("/app/api/products/search/", {'q': "  "}).status_code, 400)
+        self.assertEqual(self.client.get("/app/api/products/search/", {'q': "x", 'category': "a"}).status_code, 400)
+        self.assertEqual(self.search('"galaxy" OR NEAR(*')['count'], 0)
+
+    def test_queries_do_not_grow_with_results(self):
+        for i in range(20):
+            product = Product.objects.create(name=f"Galaxy {i}", description="Телефон", price=100)
+            product.categories.set([self.phones])
+        with CaptureQueriesContext(connection) as queries:
+            data = self.search("galaxy")
+        self.assertEqual(len(data['results']), 10)
+        self.assertLessEqual(len(queries), 6)
+
+
+@override_settings(API_RESPONSE_CACHE_ALIAS=None)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username="admin", role="admin", email="admin@example.com")
+        self.client.force_login(user)
+        self.async_client.force_login(user)
+        seed_dataset(12)
+        Shipping.objects.update(shipped_date=None)
+
+    def get(self, url):
+        with async_views(True):
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(url.split('?')[0]).func))
+            response = async_to_sync(self.async_client.get)(url)
+        expected = self.client.get(url)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content, expected.content)
+        return response
+
+    def test_list_and_retrieve_are_identical(self):
+        for url in [url for _, url in routes()] + ["/app/api/products/?page=2", "/app/api/products/?categories=1"]:
+            with self.subTest(url=url):
+                self.assertEqual(self.get(url).status_code, 200)
+
+    def test_keyset_pages_are_identical(self):
+        first = self.get("/app/api/orders/?ordering=-total_amount").json()
+        second = self.get(first['next'].replace("http://testserver", "")).json()
+        self.assertEqual(len(first['results']) + len(second['results']), 12)
+
+    def test_missing_object(self):
+        self.assertEqual(self.get("/app/api/products/999999/").status_code, 404)
+        self.assertEqual(self.get("/app/api/products/abc/").status_code, 404)
+
+    def test_create(self):
+        category = Category.objects.first()
+        body = {'name': "Новый", 'description': "Новый товар", 'price': "5.00", 'categories': [category.pk]}
+        with async_views(True):
+            response = async_to_sync(self.async_client.post)("/app/api/products/", body, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), ProductSerializer(Product.objects.get(name="Новый")).data | {'price': "5.00"})
+
+        with async_views(True):
+            response = async_to_sync(self.async_client.post)("/app/api/products/", {}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_permissions(self):
+        self.async_client.force_login(User.objects.create(username="customer", role="customer"))
+        with async_views(True):
+            response = async_to_sync(self.async_client.get)("/app/api/orders/")
+        self.assertEqual(response.status_code, 403)
+
+
+class TokenClaimsTests(TestCase):
+    def setUp(self):
+        token_versions.invalidate()
+        self.user = User.objects.create_user(username="manager", password="secret-pass", role="manager")
+        self.client = APIClient()
+        response = self.client.post("/app/api/token/", {'username': "manager", 'password': "secret-pass"}, format='json')
+        self.tokens = response.json()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+
+    def user_queries(self, url):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        return response.status_code, [query['sql'] for query in captured if '"api_user"' in query['sql']]
+
+    def test_tokens_carry_role_and_version(self):
+        access = AccessToken(self.tokens['access'])
+        self.assertEqual((access['role'], access['ver']), ("manager", 0))
+        response = self.client.post("/app/api/register/", {'username': "new", 'password': "x", 'email': "new@example.com"}, format='json')
+        self.assertEqual(AccessToken(response.json()['access'])['role'], "customer")
+
+    def test_reads_run_no_user_queries(self):
+        self.assertEqual(self.user_queries("/app/api/orders/")[0], 200)
+        self.assertEqual(self.user_queries("/app/api/orders/"), (200, []))
+        self.assertEqual(self.user_queries("/app/api/users/")[0], 403)
+
+    def test_role_change_and_deletion_revoke_tokens(self):
+        self.assertEqual(self.client.get("/app/api/orders/").status_code, 200)
+        self.user.role = "customer"
+        self.user.save()
+        self.assertEqual(self.user.token_version, 1)
+        self.assertEqual(self.client.get("/app/api/orders/").status_code, 401)
+        response = self.client.post("/app/api/token/refresh/", {'refresh': self.tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+        self.user.save(update_fields=['last_login'])  # unrelated saves keep the version
+        self.assertEqual(User.objects.get(pk=self.user.pk).token_version, 1)
+        response = self.client.post("/app/api/token/", {'username': "manager", 'password': "secret-pass"}, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+        self.assertEqual(self.client.get("/app/api/orders/").status_code, 403)
+        User.objects.filter(pk=self.user.pk).delete()
+        self.assertEqual(self.client.get("/app/api/orders/").status_code, 401)
+
+    def test_refresh_uses_current_claims(self):
+        response = self.client.post("/app/api/token/refresh/", {'refresh': self.tokens['refresh']}, format='json')
+        self.assertEqual(AccessToken(response.json()['access'])['role'], "manager")
+
+    def test_tokens_without_claims_load_the_user(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+        status, queries = self.user_queries("/app/api/orders/")
+        self.assertEqual(status, 200)
+        self.assertTrue(queries)
+
+
+@override_settings(API_TIMING=True, API_METRICS_TOKEN="secret")
+class TimingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="admin", role="admin")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        seed_dataset(2)
+        metrics.reset()
+
+    def phases(self, response):
+        return {part.split(';')[0]: part for part in response['Server-Timing'].split(", ")}
+
+    def test_server_timing_phases(self):
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            response = self.client.get("/app/api/users/")
+        self.assertEqual(stdout.getvalue(), "")
+        phases = self.phases(response)
+        self.assertEqual(set(phases), {'auth', 'permission', 'db', 'serialize', 'render', 'total'})
+        self.assertRegex(phases['db'], r'desc="[1-9]\d* queries"')
+
+        self.async_client.force_login(self.user)
+        with async_views(True):
+            response = async_to_sync(self.async_client.get)("/app/api/orders/")
+        self.assertRegex(self.phases(response)['db'], r'desc="[1-9]\d* queries"')
+
+    def test_header_is_only_sent_to_staff(self):
+        client = APIClient()
+        self.assertNotIn('Server-Timing', client.get("/app/api/products/"))
+        client.force_authenticate(User.objects.create(username="manager", role="manager"))
+        self.assertNotIn('Server-Timing', client.get("/app/api/products/"))
+        with override_settings(DEBUG=True):
+            self.assertIn('Server-Timing', client.get("/app/api/products/"))
+
+    def test_metrics_endpoint(self):
+        self.client.get("/app/api/products/")
+        self.client.get("/app/api/products/")
+        response = self.client.get("/app/api/metrics/", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('api_request_duration_seconds_count{view="product-list"} 2', response.content.decode())
+        self.assertIn('api_request_phase_seconds_total{view="product-list",phase="serialize"}', response.content.decode())
+        # The client address proves nothing behind a proxy
+        self.assertEqual(APIClient().get("/app/api/metrics/", REMOTE_ADDR="127.0.0.1").status_code, 403)
+        self.assertEqual(APIClient().get("/app/api/metrics/", HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        client = APIClient()
+        client.force_login(self.user)
+        self.assertEqual(client.get("/app/api/metrics/").status_code, 200)
+
+    @override_settings(API_TIMING=False)
+    def test_disabled(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertNotIn('Server-Timing', client.get("/app/api/products/"))
+        self.assertEqual(client.get("/app/api/metrics/").status_code, 404)
+        self.assertEqual(metrics.views, {})
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser(username="root", email="root@example.com", password="x"))
+
+    def changelist_queries(self):
+        counts = {}
+        for model in admin.site._registry:
+            url = reverse(f"admin:{model._meta.app_label}_{model._meta.model_name}_changelist")
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            counts[url] = len(captured)
+        return counts
+
+    def test_queries_do_not_grow_with_rows(self):
+        seed_dataset(2)
+        LogEntry.objects.log_actions(User.objects.first().pk, Product.objects.all(), ADDITION)
+        few = self.changelist_queries()
+        seed_dataset(15, start=2)
+        LogEntry.objects.log_actions(User.objects.first().pk, Product.objects.all(), ADDITION)
+        self.assertEqual(self.changelist_queries(), few)
+
+    def test_large_tables_use_estimates(self):
+        seed_dataset(3)
+        url = reverse("admin:api_order_changelist")
+        RowCount.objects.filter(label="api.Order").update(rows=50000)
+        row_counter.invalidate()
+        self.assertEqual(self.client.get(url).context['cl'].result_count, 50000)
+        self.assertEqual(self.client.get(url, {'total_amount': "10.00"}).context['cl'].result_count, 1)
+        self.assertEqual(self.client.get(url, {'exact_count': "1"}).context['cl'].result_count, 3)
+        # Models without a counter fall back to the table statistics
+        with mock.patch('api.counting.table_estimate', return_value=50000):
+            response = self.client.get(reverse("admin:api_emailoutbox_changelist"))
+        self.assertEqual(response.context['cl'].result_count, 50000)
+
+
+class RowCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="admin", role="admin"))
+        seed_dataset(3)
+
+    def rows(self, model):
+        row_counter.flush()
+        return RowCount.objects.get(label=model._meta.label).rows
+
+    def test_counters_follow_creates_and_deletes(self):
+        self.assertEqual(self.rows(Product), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name="Новый", description="", price=1)
+        self.assertEqual(self.rows(Product), 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+            product.delete()
+        self.assertEqual(self.rows(Product), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk__in=list(Product.objects.values_list('pk', flat=True)[:2])).delete()
+        self.assertEqual(self.rows(Product), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.all_with_deleted().restore()
+        self.assertEqual(self.rows(Product), 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            item = {'name': "a", 'description': "a", 'price': "1.00", 'categories': [Category.objects.first().pk]}
+            response = self.client.post("/app/api/products/bulk/", [item, item], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.rows(Product), 6)
+
+        RowCount.objects.filter(label="api.Product").update(rows=100)
+        out = io.StringIO()
+        call_command('refresh_counts', stdout=out)
+        self.assertEqual(self.rows(Product), Product.objects.count())
+
+    def test_missing_counter_is_cached(self):
+        RowCount.objects.filter(label="api.Supplier").delete()
+        row_counter.invalidate()
+        self.assertIsNone(row_counter.rows(Supplier))
+        with self.assertNumQueries(0):
+            self.assertIsNone(row_counter.rows(Supplier))
+
+    def test_order_creation_is_counted(self):
+        self.assertEqual(self.rows(Order), 3)
+        customer, product = Customer.objects.first(), Product.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/app/api/orders/", {'customer': customer.pk, 'products': [product.pk]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.rows(Order), 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/app/api/orders/bulk/", [{'customer': customer.pk, 'products': [product.pk]}] * 2, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.rows(Order), Order.objects.count())
+
+    def test_writes_outside_requests_flush_on_commit(self):
+        stored = lambda: RowCount.objects.get(label="api.Product").rows
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name="Новый", description="", price=1)
+        self.assertEqual(stored(), 4)
+
+        # Inside a request the delta waits for request_finished
+        row_counter.request_started()
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name="Ещё", description="", price=1)
+        self.assertEqual(stored(), 4)
+        with mock.patch('api.counting.FLUSH_INTERVAL', 0):
+            row_counter.request_finished()
+        self.assertEqual(stored(), 5)
+
+    def test_api_counts(self):
+        RowCount.objects.filter(label="api.Order").update(rows=50000)
+        row_counter.invalidate()
+        body = self.client.get("/app/api/orders/").json()
+        self.assertEqual((body['count'], body['count_estimated']), (50000, True))
+        body = self.client.get("/app/api/orders/", {'exact_count': "1"}).json()
+        self.assertEqual(body['count'], 3)
+        self.assertNotIn('count_estimated', body)
+        customer = Order.objects.first().customer_id
+        self.assertEqual(self.client.get("/app/api/orders/", {'customer': customer}).json()['count'], 1)
+
+        with async_views(True):
+            self.async_client.force_login(User.objects.get(username="admin"))
+            body = async_to_sync(self.async_client.get)("/app/api/orders/").json()
+        self.assertEqual((body['count'], body['count_estimated']), (50000, True))
+
+    def test_small_tables_count_exactly(self):
+        with self.assertNumQueries(0):
+            self.assertIsNone(estimated_count(Order.objects.all()))
+        self.assertEqual(self.client.get("/app/api/orders/").json()['count'], 3)
+
+
+class IndexCheckTests(TestCase):
+    def test_every_filter_and_ordering_path_is_indexed(self):
+        out = io.StringIO()
+        call_command('check_indexes', stdout=out)
+        self.assertIn("Every filter/ordering path uses an index", out.getvalue())
+
+    def test_reports_unindexed_paths(self):
+        self.assertEqual(plan_problems("4 0 0 SCAN api_order\n20 0 0 USE TEMP B-TREE FOR ORDER BY", 'api_order', False, 'sqlite'), ['scan', 'sort'])
+        self.assertEqual(plan_problems("5 0 0 SCAN api_order USING INDEX order_live_date_idx", 'api_order', True, 'sqlite'), ['scan'])
+        self.assertEqual(plan_problems("5 0 0 SCAN api_order USING INDEX order_live_date_idx", 'api_order', False, 'sqlite'), [])
+        self.assertEqual(plan_problems("Sort\n  ->  Seq Scan on api_order", 'api_order', False, 'postgresql'), ['scan', 'sort'])
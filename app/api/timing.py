@@ -0,0 +1,236 @@
+import hmac
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+
+PHASES = ('auth', 'permission', 'db', 'serialize', 'render')
+# Upper bounds (seconds) of the request duration histogram
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+current = ContextVar('api_request_timings', default=None)
+
+
+class RequestTimings:
+    """
+    Seconds spent per phase of one request. `db` covers every query, including
+    those run during auth; `serialize` is the handler time outside queries.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.queries = 0
+        self.handler_started = None
+        self.handler_db = 0.0
+        # Set by TimingMixin once the API user is known; gates the Server-Timing header
+        self.privileged = False
+
+    def add(self, phase, started):
+        self.phases[phase] += time.perf_counter() - started
+
+    def server_timing(self, total):
+        parts = [f"{phase};dur={seconds * 1000:.2f}" for phase, seconds in self.phases.items()]
+        parts[PHASES.index('db')] += f';desc="{self.queries} queries"'
+        return ", ".join([*parts, f"total;dur={total * 1000:.2f}"])
+
+
+def record_query(execute, sql, params, many, context):
+    timings = current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add('db', started)
+        timings.queries += 1
+
+
+def install_wrapper(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Metrics:
+    """
+    In-process totals per view name, exposed in the Prometheus text format.
+    Every worker process keeps its own, so scrape each process (or sum them).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def observe(self, view, timings, total):
+        with self.lock:
+            entry = self.views.get(view)
+            if entry is None:
+                entry = self.views[view] = {
+                    'buckets': [0] * len(BUCKETS), 'count': 0, 'sum': 0.0, 'queries': 0,
+                    'phases': dict.fromkeys(PHASES, 0.0),
+                }
+            for index, bound in enumerate(BUCKETS):
+                if total <= bound:
+                    entry['buckets'][index] += 1
+            entry['count'] += 1
+            entry['sum'] += total
+            entry['queries'] += timings.queries
+            for phase, seconds in timings.phases.items():
+                entry['phases'][phase] += seconds
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+    def render(self):
+        lines = [
+            "# HELP api_request_duration_seconds Request duration by view.",
+            "# TYPE api_request_duration_seconds histogram",
+        ]
+        with self.lock:
+            views = {view: {**entry, 'buckets': list(entry['buckets']), 'phases': dict(entry['phases'])}
+                     for view, entry in self.views.items()}
+        for view, entry in sorted(views.items()):
+            for bound, count in zip(BUCKETS, entry['buckets']):
+                lines.append(f'api_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {count}')
+            lines.append(f'api_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {entry["count"]}')
+            lines.append(f'api_request_duration_seconds_sum{{view="{view}"}} {entry["sum"]:.6f}')
+            lines.append(f'api_request_duration_seconds_count{{view="{view}"}} {entry["count"]}')
+        lines += [
+            "# HELP api_request_phase_seconds_total Time spent per request phase by view.",
+            "# TYPE api_request_phase_seconds_total counter",
+        ]
+        for view, entry in sorted(views.items()):
+            for phase, seconds in entry['phases'].items():
+                lines.append(f'api_request_phase_seconds_total{{view="{view}",phase="{phase}"}} {seconds:.6f}')
+        lines += [
+            "# HELP api_db_queries_total Database queries by view.",
+            "# TYPE api_db_queries_total counter",
+        ]
+        for view, entry in sorted(views.items()):
+            lines.append(f'api_db_queries_total{{view="{view}"}} {entry["queries"]}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class TimingMiddleware:
+    """
+    Times every request and counts its queries for `metrics`. The Server-Timing
+    header is only added for staff and admin API users, or for everyone under DEBUG.
+    TimingMixin fills in the auth/permission/serialize/render phases of API views.
+    Not loaded at all when settings.API_TIMING is off (the default).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'API_TIMING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            install_wrapper(connection)
+        connection_created.connect(install_wrapper, dispatch_uid='api-timing-queries')
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = current.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, timings)
+
+    def finish(self, request, response, timings):
+        total = time.perf_counter() - timings.started
+        if settings.DEBUG or timings.privileged:
+            response['Server-Timing'] = timings.server_timing(total)
+        match = getattr(request, 'resolver_match', None)
+        metrics.observe(match.view_name if match else 'unmatched', timings, total)
+        return response
+
+
+class TimingMixin:
+    """ViewSet mixin: records the auth, permission, serialize and render phases for TimingMiddleware."""
+
+    def perform_authentication(self, request):
+        timings = current.get()
+        if timings is None:
+            return super().perform_authentication(request)
+        started = time.perf_counter()
+        super().perform_authentication(request)
+        timings.add('auth', started)
+        user = request.user
+        timings.privileged = bool(getattr(user, 'is_staff', False) or getattr(user, 'role', None) == 'admin')
+
+    def check_permissions(self, request):
+        timings = current.get()
+        if timings is None:
+            return super().check_permissions(request)
+        started = time.perf_counter()
+        super().check_permissions(request)
+        timings.add('permission', started)
+
+    def check_object_permissions(self, request, obj):
+        timings = current.get()
+        if timings is None:
+            return super().check_object_permissions(request, obj)
+        started = time.perf_counter()
+        super().check_object_permissions(request, obj)
+        timings.add('permission', started)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        timings = current.get()
+        if timings is not None:
+            timings.handler_started, timings.handler_db = time.perf_counter(), timings.phases['db']
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        timings = current.get()
+        if timings is not None and timings.handler_started is not None:
+            # Handler time not spent in queries: building the serializer data
+            finished = time.perf_counter()
+            handler_db = timings.phases['db'] - timings.handler_db
+            timings.phases['serialize'] += max(0.0, finished - timings.handler_started - handler_db)
+            timings.handler_started = None
+            if hasattr(response, 'add_post_render_callback') and not response.is_rendered:
+                response.add_post_render_callback(lambda rendered: timings.add('render', finished))
+        return response
+
+
+def has_metrics_token(request):
+    token = getattr(settings, 'API_METRICS_TOKEN', '')
+    header = request.headers.get('Authorization', '')
+    return bool(token) and hmac.compare_digest(header.encode(), f"Bearer {token}".encode())
+
+
+def metrics_view(request):
+    """Prometheus text format of `metrics`; needs settings.API_METRICS_TOKEN as a bearer token or an admin session."""
+    if not getattr(settings, 'API_TIMING', False):
+        raise Http404
+    if not has_metrics_token(request) and getattr(request.user, 'role', None) != 'admin':
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
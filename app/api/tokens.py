@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import User
+
+ROLE_CLAIM = 'role'
+VERSION_CLAIM = 'ver'
+MAX_USERS = 10000
+# Other processes only learn about role changes and deletions through this expiry
+MAX_AGE = 30
+
+
+class TokenVersionCache:
+    """
+    In-process LRU of user id -> current token version (None for deleted users).
+    Ids are keyed as strings, the form the user_id claim carries.
+    A miss or an entry older than MAX_AGE costs one query; saves in this process
+    drop the entry through post_save.
+    """
+
+    def __init__(self, max_users=MAX_USERS, max_age=MAX_AGE):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.max_users, self.max_age = max_users, max_age
+
+    def get(self, user_id):
+        user_id, now = str(user_id), time.monotonic()
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is not None and now - entry[1] < self.max_age:
+                self.entries.move_to_end(user_id)
+                return entry[0]
+        version = User.objects.filter(pk=user_id, is_active=True).values_list('token_version', flat=True).first()
+        self.set(user_id, version, now)
+        return version
+
+    def set(self, user_id, version, now=None):
+        user_id = str(user_id)
+        with self.lock:
+            self.entries[user_id] = (version, time.monotonic() if now is None else now)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_users:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, *user_ids):
+        with self.lock:
+            if not user_ids:
+                self.entries.clear()
+            for user_id in user_ids:
+                self.entries.pop(str(user_id), None)
+
+
+token_versions = TokenVersionCache()
+
+
+def add_claims(token, user):
+    token[ROLE_CLAIM] = user.role
+    token[VERSION_CLAIM] = user.token_version
+    return token
+
+
+class RoleRefreshToken(RefreshToken):
+    """Refresh token carrying the user's role and token version; its access tokens copy both."""
+
+    @classmethod
+    def for_user(cls, user):
+        return add_claims(super().for_user(user), user)
+
+
+class ClaimsUser(TokenUser):
+    """request.user built from the access token's claims, without loading the User row."""
+
+    @cached_property
+    def role(self):
+        return self.token[ROLE_CLAIM]
+
+
+class TokenUserAuthentication(JWTAuthentication):
+    """
+    JWT authentication that authorizes from the `role` claim. The claimed token
+    version is checked against `token_versions`, so a role change or a deletion
+    revokes tokens issued before it. Tokens without the claims load the user.
+    """
+
+    def get_user(self, validated_token):
+        if ROLE_CLAIM not in validated_token or VERSION_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken("Токен не содержит идентификатор пользователя") from e
+        if token_versions.get(user_id) != validated_token[VERSION_CLAIM]:
+            raise AuthenticationFailed("Токен отозван", code='token_revoked')
+        return ClaimsUser(validated_token)
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = RoleRefreshToken
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """Issues an access token with the user's current claims, unless the refresh token was revoked."""
+    token_class = RoleRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.filter(pk=refresh.payload.get(api_settings.USER_ID_CLAIM), is_active=True).first()
+        if user is None:
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        token_versions.set(user.pk, user.token_version)
+        if refresh.payload.get(VERSION_CLAIM, user.token_version) != user.token_version:
+            raise AuthenticationFailed("Токен отозван", code='token_revoked')
+        data = {'access': str(add_claims(refresh.access_token, user))}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(add_claims(refresh, user))
+        return data
+
+
+@receiver(post_save, sender=User, dispatch_uid='api-token-versions')
+def on_user_save(sender, instance, **kwargs):
+    token_versions.invalidate(instance.pk)
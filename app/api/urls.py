@@ -5,6 +5,7 @@ from .views import (
     OrderViewSet, ReviewViewSet, ShippingViewSet, PaymentViewSet, StaffViewSet,
     PromotionViewSet, RegisterView
 )
+from .timing import metrics_view
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 router = DefaultRouter()
@@ -22,6 +23,7 @@ router.register(r'promotions', PromotionViewSet)
 
 urlpatterns = [
     path('api/', include(router.urls)),
+    path('api/metrics/', metrics_view, name='metrics'),
     path('api/register/', RegisterView.as_view(), name='register'),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
@@ -3,7 +3,6 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework_simplejwt.tokens import RefreshToken
 
 from .models import User, Category, Product, Supplier, Customer, Order, Review, Shipping, Payment, Staff, Promotion
 from .serializers import (
@@ -12,6 +11,14 @@ from .serializers import (
     PaymentSerializer, StaffSerializer, PromotionSerializer, RegisterSerializer
 )
 from .permissions import IsAdmin, IsAdminOrManager, IsManager, IsCustomer
+from .prefetching import EagerLoadingMixin
+from .compiled import CompiledReadMixin
+from .cache import CachedResponseMixin
+from .bulk import BulkModelMixin
+from .asyncviews import AsyncModelMixin
+from .search import SearchMixin
+from .timing import TimingMixin
+from .tokens import RoleRefreshToken
 
 class RegisterView(APIView):    
     permission_classes = [AllowAny]  # Allow anyone to access the registration view
@@ -21,14 +28,14 @@ class RegisterView(APIView):
         serializer.is_valid(raise_exception=True)
         user = serializer.save()
         
-        refresh = RefreshToken.for_user(user)
+        refresh = RoleRefreshToken.for_user(user)
         return Response({
             "user": UserSerializer(user).data,
             "refresh": str(refresh),
             "access": str(refresh.access_token),
         }, status=status.HTTP_201_CREATED)
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(CompiledReadMixin, AsyncModelMixin, EagerLoadingMixin, TimingMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
@@ -37,7 +44,7 @@ class UserViewSet(viewsets.ModelViewSet):
     ordering = ['username']
     permission_classes = [IsAdmin]  # Only Admin can manage users
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(CachedResponseMixin, CompiledReadMixin, AsyncModelMixin, EagerLoadingMixin, TimingMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
@@ -45,8 +52,9 @@ class CategoryViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name']
     ordering = ['name']
     permission_classes = [IsAdmin]  # Admin or Manager can manage categories
+    cache_models = (Category,)
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(BulkModelMixin, SearchMixin, CachedResponseMixin, CompiledReadMixin, AsyncModelMixin, EagerLoadingMixin, TimingMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
@@ -54,8 +62,9 @@ class ProductViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name', 'price']
     ordering = ['name']
     permission_classes = [IsAdminOrManager]  # Admin or Manager can manage products
+    cache_models = (Product, Category, Promotion, Review)
 
-class SupplierViewSet(viewsets.ModelViewSet):
+class SupplierViewSet(CachedResponseMixin, CompiledReadMixin, AsyncModelMixin, EagerLoadingMixin, TimingMixin, viewsets.ModelViewSet):
     queryset = Supplier.objects.all()
     serializer_class = SupplierSerializer
     filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
@@ -63,8 +72,9 @@ class SupplierViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name']
     ordering = ['name']
     permission_classes = [IsAdminOrManager]  # Admin or Manager can manage suppliers
+    cache_models = (Supplier, Product, Category, Promotion, Review)
 
-class CustomerViewSet(viewsets.ModelViewSet):
+class CustomerViewSet(CompiledReadMixin, AsyncModelMixin, EagerLoadingMixin, TimingMixin, viewsets.ModelViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
     filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
@@ -73,25 +83,27 @@ class CustomerViewSet(viewsets.ModelViewSet):
     ordering = ['user']
     permission_classes = [IsAdminOrManager]  # Admin or Manager can manage customers
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(BulkModelMixin, CompiledReadMixin, AsyncModelMixin, EagerLoadingMixin, TimingMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
     filterset_fields = ['customer', 'order_date', 'total_amount']
     ordering_fields = ['order_date', 'total_amount']
     ordering = ['order_date']
+    keyset_pagination = True
     permission_classes = [IsAdminOrManager]  # Admin or Manager can manage orders
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(CompiledReadMixin, AsyncModelMixin, EagerLoadingMixin, TimingMixin, viewsets.ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
     filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
     filterset_fields = ['customer', 'product', 'rating']
     ordering_fields = ['review_date', 'rating']
     ordering = ['review_date']
+    keyset_pagination = True
     permission_classes = [IsAdminOrManager]  # Admin or Manager can manage reviews
 
-class ShippingViewSet(viewsets.ModelViewSet):
+class ShippingViewSet(BulkModelMixin, CompiledReadMixin, AsyncModelMixin, EagerLoadingMixin, TimingMixin, viewsets.ModelViewSet):
     queryset = Shipping.objects.all()
     serializer_class = ShippingSerializer
     filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
@@ -100,16 +112,17 @@ class ShippingViewSet(viewsets.ModelViewSet):
     ordering = ['shipped_date']
     permission_classes = [IsAdminOrManager]  # Admin or Manager can manage shipping
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(CompiledReadMixin, AsyncModelMixin, EagerLoadingMixin, TimingMixin, viewsets.ModelViewSet):
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
     filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
     filterset_fields = ['order', 'payment_date', 'amount']
     ordering_fields = ['payment_date', 'amount']
     ordering = ['payment_date']
+    keyset_pagination = True
     permission_classes = [IsAdminOrManager]  # Admin or Manager can manage payments
 
-class StaffViewSet(viewsets.ModelViewSet):
+class StaffViewSet(CompiledReadMixin, AsyncModelMixin, EagerLoadingMixin, TimingMixin, viewsets.ModelViewSet):
     queryset = Staff.objects.all()
     serializer_class = StaffSerializer
     filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
@@ -118,7 +131,7 @@ class StaffViewSet(viewsets.ModelViewSet):
     ordering = ['user']
     permission_classes = [IsAdminOrManager]  # Admin or Manager can manage staff
 
-class PromotionViewSet(viewsets.ModelViewSet):
+class PromotionViewSet(CompiledReadMixin, AsyncModelMixin, EagerLoadingMixin, TimingMixin, viewsets.ModelViewSet):
     queryset = Promotion.objects.all()
     serializer_class = PromotionSerializer
     filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
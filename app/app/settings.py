@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -49,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.timing.TimingMiddleware',  # Server-Timing и /app/api/metrics/ (при API_TIMING)
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -90,6 +92,33 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Кэш ответов API (api/cache.py). Для нескольких процессов можно использовать
+    # 'django.core.cache.backends.filebased.FileBasedCache' с LOCATION = BASE_DIR / 'cache'
+    'api': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api-responses',
+        'TIMEOUT': 60,
+    },
+}
+
+API_RESPONSE_CACHE_ALIAS = 'api'  # None отключает кэширование ответов
+API_COMPILED_SERIALIZERS = True  # list/retrieve через скомпилированные сериализаторы (api/compiled.py)
+# Асинхронные list/retrieve/create под ASGI (api/asyncviews.py), по умолчанию выключены; API_ASYNC_VIEWS=1 включает
+API_ASYNC_VIEWS = os.environ.get('API_ASYNC_VIEWS') == '1'
+# Замеры фаз запроса (api/timing.py), по умолчанию выключены; API_TIMING=1 включает middleware.
+# Заголовок Server-Timing получают только сотрудники и администраторы (или все при DEBUG)
+API_TIMING = os.environ.get('API_TIMING') == '1'
+# Токен для сбора /app/api/metrics/ (Authorization: Bearer <токен>); без него доступ только администраторам
+API_METRICS_TOKEN = os.environ.get('API_METRICS_TOKEN', '')
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -126,6 +155,9 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -151,7 +183,21 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # Роль и версия токена берутся из JWT без запроса к БД (см. api/tokens.py)
+        'api.tokens.TokenUserAuthentication',
+        'rest_framework.authentication.SessionAuthentication',  # Browsable API и админка
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.PageNumberOrKeysetPagination',
+    'PAGE_SIZE': 10,  # 10 объектов на одной странице
+    # orjson, если установлен (см. api/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
 }
 
@@ -160,10 +206,8 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': True,
+    # В токенах роль и версия токена пользователя (api/tokens.py)
+    'TOKEN_OBTAIN_SERIALIZER': 'api.tokens.RoleTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'api.tokens.RoleTokenRefreshSerializer',
+    'TOKEN_USER_CLASS': 'api.tokens.ClaimsUser',
 }
-
-REST_FRAMEWORK = {
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 10,  # 10 объектов на одной странице
-}
-